@@ -0,0 +1,64 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+"""Compare the throughput of the gurux and the A-XDR decoder with the recorded test messages.
+Run from the repository root: python -m scripts.benchmark_decoder"""
+import argparse
+import logging
+import timeit
+from typing import List
+
+from smartmeter_datacollector.smartmeter.cosem import Cosem
+from smartmeter_datacollector.smartmeter.hdlc import HdlcFrame
+from smartmeter_datacollector.smartmeter.hdlc_dlms_parser import DECODERS, HdlcDlmsParser
+from tests.conftest import split_hex_data_to_frames
+from tests.testdata import iskra_am550, lg_e360, lg_e450
+
+TEST_MESSAGES = {
+    "lg_e450": lg_e450.UNENCRYPTED_VALID_DATA_CFG2026,
+    "lg_e450 (extended register)": lg_e450.UNENCRYPTED_EXTENDED_REGISTER_DATA,
+    "lg_e360": lg_e360.UNENCRYPTED_VALID_DATA_CFG2026,
+    "iskra_am550": iskra_am550.UNENCRYPTED_VALID_DATA_CFG2026,
+}
+
+
+def split_frames(data: str) -> List[HdlcFrame]:
+    parser = HdlcDlmsParser(Cosem("benchmark"))
+    frames = []
+    for chunk in split_hex_data_to_frames(data):
+        frames.extend(parser.split_hdlc_frames(chunk))
+    return frames
+
+
+def benchmark(decoder: str, frames: List[HdlcFrame], repetitions: int) -> float:
+    parser = HdlcDlmsParser(Cosem("benchmark"), decoder=decoder)
+
+    def parse() -> None:
+        for frame in frames:
+            parser.feed_frame(frame)
+    # the first message is always decoded by gurux
+    parse()
+    return min(timeit.repeat(parse, number=repetitions, repeat=5)) / repetitions
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("-n", "--repetitions", type=int, default=200, help="Messages per measurement")
+    args = arg_parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    for name, data in TEST_MESSAGES.items():
+        frames = split_frames(data)
+        results = {decoder: benchmark(decoder, frames, args.repetitions) for decoder in DECODERS}
+        print(f"{name}:")
+        for decoder, duration in results.items():
+            print(f"  {decoder:6} {duration * 1e6:9.1f} us/message "
+                  f"({results['gurux'] / duration:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
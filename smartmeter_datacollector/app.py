@@ -19,7 +19,7 @@ logging.basicConfig(level=logging.WARNING)
 async def build_and_start(app_config: ConfigParser):
     readers = factory.build_meters(app_config)
     sinks = factory.build_sinks(app_config)
-    data_collector = factory.build_collector(readers, sinks)
+    data_collector = factory.build_collector(readers, sinks, app_config)
 
     await asyncio.gather(*[sink.start() for sink in sinks])
 
@@ -31,6 +31,7 @@ async def build_and_start(app_config: ConfigParser):
         pass
     finally:
         logging.info("App shutting down now.")
+        await data_collector.drain()
         await asyncio.gather(*[sink.stop() for sink in sinks])
 
 
@@ -8,32 +8,308 @@
 import asyncio
 import logging
 from asyncio import QueueFull
-from typing import List
+from collections import deque
+from configparser import ConfigParser, SectionProxy
+from dataclasses import dataclass
+from enum import Enum
+from typing import Deque, List, Optional, Tuple
 
+from smartmeter_datacollector.config import InvalidConfigError
 from smartmeter_datacollector.sinks.data_sink import DataSink
-from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle
+from smartmeter_datacollector.smartmeter.meter_data import ColumnarMeterDataBundle, MeterDataBundle
+from smartmeter_datacollector.stages.stage import Stage
 
 LOGGER = logging.getLogger("collector")
 
 
+class QueuePolicy(Enum):
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    # bundles wait up to block_timeout for space in the queue of the sink, only this sink is delayed
+    BLOCK = "block"
+
+
+@dataclass
+class SinkQueueConfig:
+    size: int = 100
+    policy: QueuePolicy = QueuePolicy.DROP_OLDEST
+    # seconds a bundle waits for space with policy block before it is dropped
+    block_timeout: float = 5.0
+
+    @staticmethod
+    def from_sink_config(config: SectionProxy) -> "SinkQueueConfig":
+        size = config.getint("queue_size", SinkQueueConfig.size)
+        if size <= 0:
+            raise InvalidConfigError(f"'queue_size' must be greater than 0: {size}")
+        policy = config.get("queue_policy", SinkQueueConfig.policy.value)
+        block_timeout = config.getfloat("queue_block_timeout", SinkQueueConfig.block_timeout)
+        if block_timeout < 0:
+            raise InvalidConfigError(f"'queue_block_timeout' must not be negative: {block_timeout}")
+        try:
+            return SinkQueueConfig(size, QueuePolicy(policy.strip().lower()), block_timeout)
+        except ValueError as ex:
+            raise InvalidConfigError(f"'queue_policy' is invalid: {policy}") from ex
+
+
+class OverflowPolicy(Enum):
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    COALESCE = "coalesce"
+
+
+@dataclass
+class CollectorConfig:
+    queue_size: int = 1000
+    overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+    compact_bundles: bool = False
+
+    @staticmethod
+    def from_config(config: ConfigParser) -> "CollectorConfig":
+        if not config.has_section("collector"):
+            return CollectorConfig()
+        collector_config = config["collector"]
+        queue_size = collector_config.getint("queue_size", CollectorConfig.queue_size)
+        if queue_size <= 0:
+            raise InvalidConfigError(f"'queue_size' must be greater than 0: {queue_size}")
+        policy = collector_config.get("overflow_policy", CollectorConfig.overflow_policy.value)
+        try:
+            overflow_policy = OverflowPolicy(policy.strip().lower())
+        except ValueError as ex:
+            raise InvalidConfigError(f"'overflow_policy' is invalid: {policy}") from ex
+        compact_bundles = collector_config.getboolean("compact_bundles", CollectorConfig.compact_bundles)
+        return CollectorConfig(queue_size, overflow_policy, compact_bundles)
+
+
+class BundleQueue(asyncio.Queue):
+    """asyncio.Queue which allows to replace a pending bundle by a newer one of the same source."""
+
+    def coalesce(self, data_bundle: MeterDataBundle) -> bool:
+        pending = self._queue
+        for index in range(len(pending) - 1, -1, -1):
+            if pending[index].source == data_bundle.source:
+                pending[index] = data_bundle
+                return True
+        return False
+
+
+# pylint: disable=too-many-instance-attributes
+class SinkWorker:
+    """Feeds a single sink from its own bounded queue so that a slow sink cannot stall the others.
+    Stages of the sink process the bundles before they are queued. With policy block, bundles which do not fit
+    into the full queue are held back (at most queue size bundles) and moved into the queue by a task of this
+    worker as soon as there is space. A bundle held back for longer than block_timeout is dropped, put() never
+    waits so that the other sinks are not delayed."""
+
+    def __init__(self, sink: DataSink, config: SinkQueueConfig, stages: Optional[List[Stage]] = None,
+                 unfiltered: bool = False) -> None:
+        self._sink = sink
+        self._stages = stages or []
+        # receives the bundles before the stages of the collector
+        self.unfiltered = unfiltered
+        self._policy = config.policy
+        self._block_timeout = config.block_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(config.size)
+        # bundles waiting for space with policy block: (deadline, bundle)
+        self._blocked: Deque[Tuple[float, MeterDataBundle]] = deque()
+        self._blocked_task: Optional[asyncio.Task] = None
+        self._dropped = 0
+
+    @property
+    def sink(self) -> DataSink:
+        return self._sink
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    async def put(self, data_bundle: MeterDataBundle) -> None:
+        await self._process(data_bundle, 0)
+
+    async def flush_stages(self) -> None:
+        """Pass on the bundles held back by the stages which are due."""
+        for index, stage in enumerate(self._stages):
+            for data_bundle in stage.flush():
+                await self._process(data_bundle, index + 1)
+
+    async def drain(self) -> None:
+        """Send all bundles held back by the stages and all queued bundles to the sink. Used on shutdown after
+        the worker stopped running."""
+        data_bundles = []
+        for index, stage in enumerate(self._stages):
+            for data_bundle in stage.flush(final=True):
+                for next_stage in self._stages[index + 1:]:
+                    data_bundle = next_stage.process(data_bundle)
+                    if data_bundle is None:
+                        break
+                else:
+                    data_bundles.append(data_bundle)
+        if self._blocked_task is not None:
+            self._blocked_task.cancel()
+            self._blocked_task = None
+        while not self._queue.empty():
+            await self._send(self._queue.get_nowait())
+        while self._blocked:
+            await self._send(self._blocked.popleft()[1])
+        for data_bundle in data_bundles:
+            await self._send(data_bundle)
+
+    async def _process(self, data_bundle: MeterDataBundle, first_stage: int) -> None:
+        for stage in self._stages[first_stage:]:
+            data_bundle = stage.process(data_bundle)
+            if data_bundle is None:
+                return
+        if self._policy == QueuePolicy.BLOCK:
+            self._hold_back(data_bundle)
+            return
+        try:
+            self._queue.put_nowait(data_bundle)
+            return
+        except QueueFull:
+            self._dropped += 1
+
+        if self._policy == QueuePolicy.DROP_OLDEST:
+            self._queue.get_nowait()
+            self._queue.put_nowait(data_bundle)
+            LOGGER.warning("Queue of sink %s is full. Oldest data points are dropped.", type(self._sink).__name__)
+        else:
+            LOGGER.warning("Queue of sink %s is full. Current data points are dropped.", type(self._sink).__name__)
+
+    def _hold_back(self, data_bundle: MeterDataBundle) -> None:
+        if not self._blocked:
+            try:
+                self._queue.put_nowait(data_bundle)
+                return
+            except QueueFull:
+                pass
+        if len(self._blocked) >= self._queue.maxsize:
+            self._dropped += 1
+            LOGGER.warning("Queue of sink %s is full. Current data points are dropped.", type(self._sink).__name__)
+            return
+        self._blocked.append((asyncio.get_running_loop().time() + self._block_timeout, data_bundle))
+        if self._blocked_task is None or self._blocked_task.done():
+            self._blocked_task = asyncio.create_task(self._move_blocked())
+
+    async def _move_blocked(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._blocked:
+            deadline, data_bundle = self._blocked[0]
+            try:
+                await asyncio.wait_for(self._queue.put(data_bundle), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                self._dropped += 1
+                LOGGER.warning("Queue of sink %s is full for more than %.1f s. Data points are dropped.",
+                               type(self._sink).__name__, self._block_timeout)
+            self._blocked.popleft()
+
+    async def run(self) -> None:
+        while True:
+            data_bundle: MeterDataBundle = await self._queue.get()
+            await self._send(data_bundle)
+
+    async def _send(self, data_bundle: MeterDataBundle) -> None:
+        try:
+            await self._sink.send(data_bundle)
+        except Exception as ex:  # pylint: disable=broad-except
+            LOGGER.error("Sink %s failed to process data: '%s'", type(self._sink).__name__, ex)
+
+
 class Collector:
-    def __init__(self) -> None:
-        self._queue = asyncio.Queue()
-        self._data_sinks: List[DataSink] = []
+    STAGE_FLUSH_INTERVAL = 1.0
+
+    def __init__(self, config: Optional[CollectorConfig] = None) -> None:
+        config = config or CollectorConfig()
+        self._queue = BundleQueue(config.queue_size)
+        self._overflow_policy = config.overflow_policy
+        self._compact_bundles = config.compact_bundles
+        self._workers: List[SinkWorker] = []
+        self._stages: List[Stage] = []
+        self._dropped = 0
+        self._coalesced = 0
+
+    @property
+    def dropped(self) -> int:
+        """Number of bundles dropped because the collector queue was full."""
+        return self._dropped
+
+    @property
+    def coalesced(self) -> int:
+        """Number of pending bundles replaced by a newer bundle of the same source."""
+        return self._coalesced
 
-    def register_sink(self, sink: DataSink) -> None:
+    @property
+    def dropped_by_sinks(self) -> int:
+        """Number of bundles dropped because the queue of a sink was full."""
+        return sum(worker.dropped for worker in self._workers)
+
+    def register_sink(self, sink: DataSink, queue_config: Optional[SinkQueueConfig] = None,
+                      stages: Optional[List[Stage]] = None, unfiltered: bool = False) -> None:
+        """Register a sink. The stages are only applied to the bundles of this sink. If unfiltered is set, the sink
+        receives the bundles without the stages of the collector (e.g. for aggregation over all values)."""
         assert isinstance(sink, DataSink)
-        self._data_sinks.append(sink)
+        self._workers.append(SinkWorker(sink, queue_config or SinkQueueConfig(), stages, unfiltered))
+
+    def add_stage(self, stage: Stage) -> None:
+        """Add a stage which processes all bundles before they are passed to the sinks."""
+        self._stages.append(stage)
 
     def notify(self, reader_data_bundle: MeterDataBundle) -> None:
+        if self._compact_bundles:
+            reader_data_bundle = self._compact(reader_data_bundle)
         try:
             self._queue.put_nowait(reader_data_bundle)
+            return
         except QueueFull:
+            pass
+
+        if self._overflow_policy == OverflowPolicy.COALESCE and self._queue.coalesce(reader_data_bundle):
+            self._coalesced += 1
+            LOGGER.debug("Queue is full. Pending data points of '%s' are replaced.", reader_data_bundle.source)
+            return
+
+        self._dropped += 1
+        if self._overflow_policy == OverflowPolicy.DROP_NEWEST:
             LOGGER.warning("Queue is full. Current data points are dropped.")
             return
+        # drop oldest (also used by coalesce if no data points of the same source are pending)
+        self._queue.get_nowait()
+        self._queue.put_nowait(reader_data_bundle)
+        LOGGER.warning("Queue is full. Oldest data points are dropped.")
+
+    @staticmethod
+    def _compact(data_bundle: MeterDataBundle) -> MeterDataBundle:
+        try:
+            return ColumnarMeterDataBundle.from_bundle(data_bundle)
+        except TypeError:
+            # bundles with non-numeric values are kept as they are
+            return data_bundle
 
     async def process_queue(self) -> None:
+        await asyncio.gather(
+            self._dispatch(),
+            self._flush_stages_periodically(),
+            *[worker.run() for worker in self._workers])
+
+    async def drain(self) -> None:
+        """Pass the bundles held back by the sink stages and queued for the sinks on. Called on shutdown after
+        process_queue() was cancelled and before the sinks are stopped."""
+        await asyncio.gather(*[worker.drain() for worker in self._workers])
+
+    async def _dispatch(self) -> None:
         while True:
-            data_bundle: MeterDataBundle = await self._queue.get()
-            for sink in self._data_sinks:
-                await sink.send(data_bundle)
+            reader_data_bundle: MeterDataBundle = await self._queue.get()
+            data_bundle: Optional[MeterDataBundle] = reader_data_bundle
+            for stage in self._stages:
+                data_bundle = stage.process(data_bundle)
+                if data_bundle is None:
+                    break
+            for worker in self._workers:
+                if worker.unfiltered:
+                    await worker.put(reader_data_bundle)
+                elif data_bundle is not None:
+                    await worker.put(data_bundle)
+
+    async def _flush_stages_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.STAGE_FLUSH_INTERVAL)
+            for worker in self._workers:
+                await worker.flush_stages()
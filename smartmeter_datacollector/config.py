@@ -37,6 +37,11 @@ DEFAULT_CONFIG = {
         'client_cert_path': "",
         'client_key_path': "",
     },
+    'collector': {
+        'queue_size': 1000,
+        'overflow_policy': "drop_oldest",
+        'compact_bundles': False,
+    },
     'logging': {
         'default': 'DEBUG',
         'collector': 'DEBUG',
@@ -6,21 +6,39 @@
 # See LICENSES/README.md for more information.
 #
 import logging
-from configparser import ConfigParser
-from typing import List
+from configparser import ConfigParser, SectionProxy
+from typing import Dict, List, Optional, Type
 
-from smartmeter_datacollector.collector import Collector
+from smartmeter_datacollector.collector import Collector, CollectorConfig, SinkQueueConfig
 from smartmeter_datacollector.config import InvalidConfigError
 from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.sinks.influx_sink import InfluxConfig, InfluxDataSink
 from smartmeter_datacollector.sinks.logger_sink import LoggerSink
 from smartmeter_datacollector.sinks.mqtt_sink import MqttConfig, MqttDataSink, MqttSinkRlDsp
+from smartmeter_datacollector.sinks.prometheus_sink import PrometheusConfig, PrometheusSink
+from smartmeter_datacollector.sinks.sqlite_sink import SqliteConfig, SqliteSink
+from smartmeter_datacollector.sinks.timeseries_sink import TimeSeriesConfig, TimeSeriesSink
+from smartmeter_datacollector.smartmeter.hdlc_dlms_parser import DECODERS
 from smartmeter_datacollector.smartmeter.iskraam550 import IskraAM550
 from smartmeter_datacollector.smartmeter.kamstrup_han import KamstrupHAN
 from smartmeter_datacollector.smartmeter.lge360 import LGE360
 from smartmeter_datacollector.smartmeter.lge450 import LGE450
 from smartmeter_datacollector.smartmeter.lge570 import LGE570
-from smartmeter_datacollector.smartmeter.meter import Meter, MeterError
+from smartmeter_datacollector.smartmeter.meter import Meter, MeterError, SerialHdlcDlmsMeter
+from smartmeter_datacollector.smartmeter.serial_reader import SERIAL_BACKENDS
 from smartmeter_datacollector.smartmeter.siemens_td3511 import SiemensTD3511
+from smartmeter_datacollector.stages.aggregation import AggregationConfig, AggregationStage
+from smartmeter_datacollector.stages.deadband import DeadbandConfig, DeadbandStage
+from smartmeter_datacollector.stages.routing import RoutingConfig, RoutingStage
+from smartmeter_datacollector.stages.stage import Stage
+
+HDLC_DLMS_METERS: Dict[str, Type[SerialHdlcDlmsMeter]] = {
+    "lge450": LGE450,
+    "lge570": LGE570,
+    "lge360": LGE360,
+    "iskraam550": IskraAM550,
+    "kamstrup_han": KamstrupHAN,
+}
 
 
 def build_meters(config: ConfigParser) -> List[Meter]:
@@ -28,47 +46,31 @@ def build_meters(config: ConfigParser) -> List[Meter]:
     for section_name in filter(lambda sec: sec.startswith("reader"), config.sections()):
         meter_config = config[section_name]
         meter_type = meter_config.get('type')
+        serial_backend = meter_config.get('serial_backend', "aioserial")
+        if serial_backend not in SERIAL_BACKENDS:
+            raise InvalidConfigError(f"'serial_backend' is invalid: {serial_backend}")
+        decoder = meter_config.get('decoder', "gurux")
+        if decoder not in DECODERS:
+            raise InvalidConfigError(f"'decoder' is invalid: {decoder}")
         try:
-            if meter_type == "lge450":
-                meters.append(LGE450(
-                    port=meter_config.get('port', "/dev/ttyUSB0"),
-                    baudrate=meter_config.getint('baudrate', LGE450.BAUDRATE),
-                    decryption_key=meter_config.get('key'),
-                    use_system_time=meter_config.getboolean('systemtime', False)
-                ))
-            elif meter_type == "lge570":
-                meters.append(LGE570(
-                    port=meter_config.get('port', "/dev/ttyUSB0"),
-                    baudrate=meter_config.getint('baudrate', LGE570.BAUDRATE),
-                    decryption_key=meter_config.get('key'),
-                    use_system_time=meter_config.getboolean('systemtime', False)
-                ))
-            elif meter_type == "lge360":
-                meters.append(LGE360(
-                    port=meter_config.get('port', "/dev/ttyUSB0"),
-                    baudrate=meter_config.getint('baudrate', LGE360.BAUDRATE),
-                    decryption_key=meter_config.get('key'),
-                    use_system_time=meter_config.getboolean('systemtime', False)
-                ))
-            elif meter_type == "iskraam550":
-                meters.append(IskraAM550(
+            if meter_type in HDLC_DLMS_METERS:
+                meter_class = HDLC_DLMS_METERS[meter_type]
+                meters.append(meter_class(
                     port=meter_config.get('port', "/dev/ttyUSB0"),
-                    baudrate=meter_config.getint('baudrate', IskraAM550.BAUDRATE),
+                    baudrate=meter_config.getint('baudrate', meter_class.BAUDRATE),
                     decryption_key=meter_config.get('key'),
-                    use_system_time=meter_config.getboolean('systemtime', False)
-                ))
-            elif meter_type == "kamstrup_han":
-                meters.append(KamstrupHAN(
-                    port=meter_config.get('port', "/dev/ttyUSB0"),
-                    baudrate=meter_config.getint('baudrate', KamstrupHAN.BAUDRATE),
-                    decryption_key=meter_config.get('key'),
-                    use_system_time=meter_config.getboolean('systemtime', False)
+                    use_system_time=meter_config.getboolean('systemtime', False),
+                    bulk_read=meter_config.getboolean('bulk_read', False),
+                    serial_backend=serial_backend,
+                    decoder=decoder,
+                    worker_process=meter_config.getboolean('worker_process', False)
                 ))
             elif meter_type == "siemens_td3511":
                 meters.append(SiemensTD3511(
                     port=meter_config.get('port', "/dev/ttyUSB0"),
                     baudrate=meter_config.getint('baudrate', SiemensTD3511.BAUDRATE),
-                    use_system_time=meter_config.getboolean('systemtime', False)
+                    use_system_time=meter_config.getboolean('systemtime', False),
+                    serial_backend=serial_backend
                 ))
             else:
                 raise InvalidConfigError(f"'type' is invalid or missing: {meter_type}")
@@ -80,7 +82,7 @@ def build_meters(config: ConfigParser) -> List[Meter]:
 
 def build_sinks(config: ConfigParser) -> List[DataSink]:
     sinks = []
-    for section_name in filter(lambda sec: sec.startswith("sink"), config.sections()):
+    for section_name in _get_sink_sections(config):
         sink_config = config[section_name]
         sink_type = sink_config.get('type')
 
@@ -94,16 +96,52 @@ def build_sinks(config: ConfigParser) -> List[DataSink]:
         elif sink_type == "mqttrldsp":
             mqtt_config = MqttConfig.from_sink_config(sink_config)
             sinks.append(MqttSinkRlDsp(mqtt_config))
+        elif sink_type == "prometheus":
+            sinks.append(PrometheusSink(PrometheusConfig.from_sink_config(sink_config)))
+        elif sink_type == "timeseries":
+            sinks.append(TimeSeriesSink(TimeSeriesConfig.from_sink_config(sink_config)))
+        elif sink_type == "sqlite":
+            sinks.append(SqliteSink(SqliteConfig.from_sink_config(sink_config)))
+        elif sink_type == "influxdb":
+            sinks.append(InfluxDataSink(InfluxConfig.from_sink_config(sink_config)))
         else:
             raise InvalidConfigError(f"'type' is invalid or missing: {sink_type}")
     return sinks
 
 
-def build_collector(readers: List[Meter], sinks: List[DataSink]) -> Collector:
-    collector = Collector()
-
-    for sink in sinks:
-        collector.register_sink(sink)
+def build_collector(readers: List[Meter], sinks: List[DataSink], config: Optional[ConfigParser] = None) -> Collector:
+    if config is None:
+        collector = Collector()
+        for sink in sinks:
+            collector.register_sink(sink)
+    else:
+        collector = Collector(CollectorConfig.from_config(config))
+        # build_sinks creates exactly one sink per sink section in the same order
+        for sink, section_name in zip(sinks, _get_sink_sections(config)):
+            stages = _build_sink_stages(config[section_name])
+            # the deadband must not thin out the values which are aggregated, aggregating sinks get all values
+            aggregating = any(isinstance(stage, AggregationStage) for stage in stages)
+            collector.register_sink(sink, SinkQueueConfig.from_sink_config(config[section_name]), stages,
+                                    unfiltered=aggregating)
+        deadband_config = DeadbandConfig.from_config(config)
+        if deadband_config is not None:
+            collector.add_stage(DeadbandStage(deadband_config))
     for reader in readers:
         reader.register(collector)
     return collector
+
+
+def _build_sink_stages(sink_config: SectionProxy) -> List[Stage]:
+    stages: List[Stage] = []
+    # routing first: aggregation only accumulates the selected registers
+    routing_config = RoutingConfig.from_sink_config(sink_config)
+    if routing_config is not None:
+        stages.append(RoutingStage(routing_config))
+    aggregation_config = AggregationConfig.from_sink_config(sink_config)
+    if aggregation_config is not None:
+        stages.append(AggregationStage(aggregation_config))
+    return stages
+
+
+def _get_sink_sections(config: ConfigParser) -> List[str]:
+    return [sec for sec in config.sections() if sec.startswith("sink")]
@@ -0,0 +1,34 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import logging
+from typing import Any, Callable
+
+# more verbose than DEBUG, e.g. for raw data of every frame
+TRACE = 5
+logging.addLevelName(TRACE, "TRACE")
+
+
+class LazyStr:  # pylint: disable=too-few-public-methods
+    """Log argument which calls func(*args) only if the log record is actually formatted."""
+    __slots__ = ("_func", "_args")
+
+    def __init__(self, func: Callable[..., Any], *args: Any) -> None:
+        self._func = func
+        self._args = args
+
+    def __str__(self) -> str:
+        return str(self._func(*self._args))
+
+
+def lazy(func: Callable[..., Any], *args: Any) -> LazyStr:
+    return LazyStr(func, *args)
+
+
+def trace(logger: logging.Logger, msg: str, *args: Any) -> None:
+    if logger.isEnabledFor(TRACE):
+        logger.log(TRACE, msg, *args)
@@ -0,0 +1,356 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import logging
+import ssl
+from configparser import SectionProxy
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle
+
+LOGGER = logging.getLogger("sink")
+
+PROTOCOLS = ("http", "udp")
+PRECISIONS = ("ms", "ns")
+
+
+# pylint: disable=too-many-instance-attributes
+@dataclass
+class InfluxConfig:
+    host: str
+    protocol: str = "http"
+    port: int = 8086
+    tls: bool = False
+    # default: /write (InfluxDB 1.x) if database is set, /api/v2/write otherwise
+    path: Optional[str] = None
+    bucket: Optional[str] = None
+    org: Optional[str] = None
+    # InfluxDB 1.x database, used instead of bucket and org
+    database: Optional[str] = None
+    token: Optional[str] = None
+    measurement: str = "smartmeter"
+    batch_bytes: int = 65536
+    flush_interval: float = 1.0
+    # lines which could not be delivered are kept up to this size and retried after a backoff
+    max_pending_bytes: int = 1_000_000
+    udp_payload_bytes: int = 1400
+
+    @staticmethod
+    def from_sink_config(config: SectionProxy) -> "InfluxConfig":
+        host = config.get("host")
+        if not host:
+            raise InvalidConfigError("InfluxDB sink: 'host' must be set")
+        protocol = config.get("protocol", InfluxConfig.protocol).strip().lower()
+        if protocol not in PROTOCOLS:
+            raise InvalidConfigError(f"'protocol' is invalid: {protocol}")
+        influx_config = InfluxConfig(
+            host.strip(), protocol,
+            port=config.getint("port", 8086 if protocol == "http" else 8089),
+            tls=config.getboolean("tls", False),
+            path=_strip(config.get("path")),
+            bucket=config.get("bucket"),
+            org=config.get("org"),
+            database=config.get("database"),
+            token=config.get("token"),
+            measurement=config.get("measurement", InfluxConfig.measurement).strip(),
+            batch_bytes=config.getint("batch_bytes", InfluxConfig.batch_bytes),
+            flush_interval=config.getfloat("flush_interval", InfluxConfig.flush_interval),
+            max_pending_bytes=config.getint("max_pending_bytes", InfluxConfig.max_pending_bytes),
+            udp_payload_bytes=config.getint("udp_payload_bytes", InfluxConfig.udp_payload_bytes))
+        if influx_config.batch_bytes <= 0 or influx_config.flush_interval < 0:
+            raise InvalidConfigError("InfluxDB sink: 'batch_bytes' must be > 0 and 'flush_interval' >= 0")
+        return influx_config
+
+    def write_target(self) -> str:
+        path = self.path or ("/write" if self.database else "/api/v2/write")
+        params = {"precision": "ms"}
+        if self.database:
+            params["db"] = self.database
+        else:
+            if self.org:
+                params["org"] = self.org
+            if self.bucket:
+                params["bucket"] = self.bucket
+        return f"{path}?{urlencode(params)}"
+
+
+def _strip(value: Optional[str]) -> Optional[str]:
+    return value.strip() if value else None
+
+
+def escape_key(value: str) -> str:
+    """Escape a tag key, tag value or field key."""
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def escape_measurement(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(" ", "\\ ")
+
+
+class LineProtocolEncoder:  # pylint: disable=too-few-public-methods
+    """Renders a bundle into a single line with one field per register. The measurement and tag part and the
+    field keys are created once per source and type. Timestamps are written in milliseconds ("ms") or
+    nanoseconds ("ns"), UDP listeners have no precision parameter and expect nanoseconds."""
+    MAX_CACHE_SIZE = 1024
+
+    def __init__(self, measurement: str, precision: str = "ms") -> None:
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported precision: {precision}")
+        self._nanoseconds = precision == "ns"
+        self._measurement = escape_measurement(measurement)
+        self._prefixes: Dict[str, str] = {}
+        self._field_keys: Dict[str, str] = {}
+
+    def encode(self, data_bundle: MeterDataBundle) -> Optional[str]:
+        prefix = self._prefixes.get(data_bundle.source)
+        if prefix is None:
+            if len(self._prefixes) >= self.MAX_CACHE_SIZE:
+                self._prefixes.clear()
+            prefix = f"{self._measurement},source={escape_key(data_bundle.source)} "
+            self._prefixes[data_bundle.source] = prefix
+        fields = []
+        for data_point in data_bundle.data_points:
+            identifier = data_point.type.identifier
+            field_key = self._field_keys.get(identifier)
+            if field_key is None:
+                if len(self._field_keys) >= self.MAX_CACHE_SIZE:
+                    self._field_keys.clear()
+                field_key = self._field_keys[identifier] = escape_key(identifier.lower()) + "="
+            value = data_point.value
+            if isinstance(value, bool):
+                fields.append(field_key + ("true" if value else "false"))
+            elif isinstance(value, int):
+                fields.append(f"{field_key}{value}i")
+            elif isinstance(value, float):
+                fields.append(field_key + repr(value))
+            else:
+                escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"")
+                fields.append(f'{field_key}"{escaped}"')
+        if not fields:
+            return None
+        timestamp = data_bundle.timestamp
+        if self._nanoseconds:
+            # exact, a float timestamp has no nanosecond resolution
+            epoch_ns = int(timestamp.replace(microsecond=0).timestamp()) * 1_000_000_000 + timestamp.microsecond * 1000
+            return f"{prefix}{','.join(fields)} {epoch_ns}"
+        return f"{prefix}{','.join(fields)} {int(round(timestamp.timestamp() * 1000))}"
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 client with a persistent (keep-alive) connection for the write endpoint."""
+    TIMEOUT = 10.0
+    ERRORS = (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, OSError)
+
+    def __init__(self, host: str, port: int, ssl_context: Optional[ssl.SSLContext] = None) -> None:
+        self._host = host
+        self._port = port
+        self._ssl_context = ssl_context
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def post(self, target: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, bytes]:
+        """Send a POST request and return status code and response body."""
+        if self._writer is not None:
+            try:
+                return await self._send(target, body, headers)
+            except self.ERRORS:
+                # the server might have closed the idle keep-alive connection, retry on a new connection
+                self.close()
+        try:
+            return await self._send(target, body, headers)
+        except self.ERRORS:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+
+    async def _send(self, target: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, bytes]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self._host, self._port, ssl=self._ssl_context), self.TIMEOUT)
+        return await asyncio.wait_for(self._request(target, body, headers), self.TIMEOUT)
+
+    async def _request(self, target: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, bytes]:
+        assert self._reader is not None and self._writer is not None
+        header_lines = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        self._writer.write(
+            f"POST {target} HTTP/1.1\r\nHost: {self._host}:{self._port}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: keep-alive\r\n{header_lines}\r\n".encode("latin-1") + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self._reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            response_body = await self._read_chunked()
+        else:
+            response_body = await self._reader.readexactly(int(response_headers.get("content-length", "0")))
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, response_body
+
+    async def _read_chunked(self) -> bytes:
+        assert self._reader is not None
+        chunks = []
+        while True:
+            size = int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            chunk = await self._reader.readexactly(size + 2)
+            if size == 0:
+                return b"".join(chunks)
+            chunks.append(chunk[:-2])
+
+
+class InfluxDataSink(DataSink):
+    """Writes the bundles in InfluxDB line protocol, one line per bundle with a field per register.
+    Lines are sent in batches when batch_bytes are pending or after flush_interval seconds, either with HTTP
+    over a keep-alive connection or as UDP datagrams. After a failed HTTP write the pending lines are only
+    retried by the flush timer after an exponential backoff (RETRY_DELAY up to MAX_RETRY_DELAY seconds) and
+    are sent in requests of at most batch_bytes."""
+    RETRY_DELAY = 1.0
+    MAX_RETRY_DELAY = 60.0
+
+    def __init__(self, config: InfluxConfig) -> None:
+        self._config = config
+        self._encoder = LineProtocolEncoder(config.measurement, "ns" if config.protocol == "udp" else "ms")
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        # event loop time before which no flush is triggered by send() after a failed write
+        self._retry_at = 0.0
+        self._retry_delay = 0.0
+        self._http: Optional[HttpConnection] = None
+        self._udp: Optional[asyncio.DatagramTransport] = None
+        self._target = config.write_target()
+        self._headers = {"Content-Type": "text/plain; charset=utf-8"}
+        if config.token:
+            self._headers["Authorization"] = f"Token {config.token}"
+
+    async def start(self) -> None:
+        if self._config.protocol == "udp":
+            self._udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=(self._config.host, self._config.port))
+        else:
+            self._http = HttpConnection(
+                self._config.host, self._config.port, ssl.create_default_context() if self._config.tls else None)
+
+    async def stop(self) -> None:
+        self._cancel_flush_task()
+        await self.flush()
+        # a failed flush schedules a retry
+        self._cancel_flush_task()
+        if self._pending:
+            LOGGER.warning("Discarding %d InfluxDB lines which could not be delivered.", len(self._pending))
+        if self._http is not None:
+            self._http.close()
+        if self._udp is not None:
+            self._udp.close()
+
+    async def send(self, data_bundle: MeterDataBundle) -> None:
+        line = self._encoder.encode(data_bundle)
+        if line is None:
+            return
+        data = line.encode("utf-8") + b"\n"
+        backing_off = asyncio.get_running_loop().time() < self._retry_at
+        if not backing_off and self._pending and self._pending_bytes + len(data) > self._config.batch_bytes:
+            # send the full batch first, requests never exceed batch_bytes (unless a single line does)
+            await self.flush()
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        if backing_off:
+            self._limit_pending()
+        elif self._pending_bytes >= self._config.batch_bytes or self._config.flush_interval == 0:
+            await self.flush()
+        if self._pending and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after(self._config.flush_interval))
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            lines, self._pending, self._pending_bytes = self._pending, [], 0
+            if self._udp is not None:
+                self._send_datagrams(lines)
+                return
+            start = 0
+            while start < len(lines):
+                end, size = start + 1, len(lines[start])
+                while end < len(lines) and size + len(lines[end]) <= self._config.batch_bytes:
+                    size += len(lines[end])
+                    end += 1
+                if not await self._post(b"".join(lines[start:end])):
+                    self._keep_for_retry(lines[start:])
+                    return
+                start = end
+            self._retry_delay = 0.0
+
+    async def _flush_after(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        await self.flush()
+
+    def _cancel_flush_task(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+    async def _post(self, body: bytes) -> bool:
+        """Returns False if the batch has to be retried."""
+        if self._http is None:
+            return False
+        try:
+            status, response = await self._http.post(self._target, body, self._headers)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, OSError, ValueError) as ex:
+            LOGGER.warning("InfluxDB write failed: '%s'", ex)
+            return False
+        if status < 300:
+            LOGGER.debug("Wrote %d bytes to InfluxDB.", len(body))
+            return True
+        LOGGER.error("InfluxDB write failed with status %d: %s", status, response[:200])
+        # client errors (e.g. invalid data) are not retried
+        return status < 500 and status != 429
+
+    def _keep_for_retry(self, lines: List[bytes]) -> None:
+        self._pending[:0] = lines
+        self._pending_bytes += sum(len(line) for line in lines)
+        self._limit_pending()
+        self._retry_delay = min(self.MAX_RETRY_DELAY, max(self.RETRY_DELAY, self._retry_delay * 2))
+        self._retry_at = asyncio.get_running_loop().time() + self._retry_delay
+        LOGGER.debug("Retrying %d InfluxDB lines in %.0f s.", len(self._pending), self._retry_delay)
+        self._cancel_flush_task()
+        self._flush_task = asyncio.create_task(self._flush_after(self._retry_delay))
+
+    def _limit_pending(self) -> None:
+        while self._pending and self._pending_bytes > self._config.max_pending_bytes:
+            self._pending_bytes -= len(self._pending.pop(0))
+
+    def _send_datagrams(self, lines: List[bytes]) -> None:
+        assert self._udp is not None
+        payload = bytearray()
+        for line in lines:
+            if payload and len(payload) + len(line) > self._config.udp_payload_bytes:
+                self._udp.sendto(bytes(payload))
+                payload.clear()
+            payload += line
+        if payload:
+            self._udp.sendto(bytes(payload))
@@ -23,4 +23,4 @@ class LoggerSink(DataSink):
         pass
 
     async def send(self, data_bundle: MeterDataBundle) -> None:
-        self._logger.info(str(data_bundle))
+        self._logger.info("%s", data_bundle)
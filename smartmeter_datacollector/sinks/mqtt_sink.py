@@ -11,11 +11,16 @@ import logging
 import ssl
 from configparser import SectionProxy
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional, Tuple, Union
 
 from aiomqtt import Client, MqttCodeError, MqttError
 
+from smartmeter_datacollector.config import InvalidConfigError
 from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.sinks.payload_encoder import (PAYLOAD_FORMATS, BundleEncoder, DataPointEncoder,
+                                                            available_payload_formats)
+from smartmeter_datacollector.sinks.retry_scheduler import RetryScheduler
+from smartmeter_datacollector.sinks.spool import DiskSpool
 from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint
 
 LOGGER = logging.getLogger("sink")
@@ -34,6 +39,17 @@ class MqttConfig:
     client_cert_path: Optional[str] = None
     client_key_path: Optional[str] = None
     topic_group: str = "building"
+    batch_publish: bool = False
+    batch_window: float = 0.0
+    retry_queue_size: int = 1000
+    retry_deadline: float = 60.0
+    spool_dir: Optional[str] = None
+    spool_max_bytes: int = 50_000_000
+    spool_segment_bytes: int = 1_000_000
+    spool_fsync_interval: float = 5.0
+    spool_replay_rate: float = 20.0
+    # json or a compact bundle format (packed, msgpack, cbor) with a schema message per meter
+    payload_format: str = "json"
 
     def with_tls(
         self, ca_cert_path: Optional[str] = None, check_hostname: bool = True
@@ -76,12 +92,30 @@ class MqttConfig:
         topic_group = config.get("topic_group")
         if topic_group and topic_group.strip().isalnum():
             mqtt_cfg.topic_group = topic_group.strip()
+        mqtt_cfg.batch_publish = config.getboolean("batch_publish", False)
+        mqtt_cfg.batch_window = max(0.0, config.getfloat("batch_window", 0.0))
+        mqtt_cfg.retry_queue_size = max(0, config.getint("retry_queue_size", mqtt_cfg.retry_queue_size))
+        mqtt_cfg.retry_deadline = max(0.0, config.getfloat("retry_deadline", mqtt_cfg.retry_deadline))
+        spool_dir = config.get("spool_dir")
+        if spool_dir:
+            mqtt_cfg.spool_dir = spool_dir.strip()
+            mqtt_cfg.spool_max_bytes = config.getint("spool_max_bytes", mqtt_cfg.spool_max_bytes)
+            mqtt_cfg.spool_segment_bytes = config.getint("spool_segment_bytes", mqtt_cfg.spool_segment_bytes)
+            mqtt_cfg.spool_fsync_interval = config.getfloat("spool_fsync_interval", mqtt_cfg.spool_fsync_interval)
+            mqtt_cfg.spool_replay_rate = config.getfloat("spool_replay_rate", mqtt_cfg.spool_replay_rate)
+        payload_format = config.get("payload_format", mqtt_cfg.payload_format).strip().lower()
+        if payload_format not in PAYLOAD_FORMATS:
+            raise InvalidConfigError(f"'payload_format' is invalid: {payload_format}")
+        if payload_format not in available_payload_formats():
+            raise InvalidConfigError(f"'payload_format' {payload_format} requires a package which is not installed.")
+        mqtt_cfg.payload_format = payload_format
         return mqtt_cfg
 
 
 class MqttDataSink(DataSink):
     TIMEOUT = 3
     RETRIES = 2
+    SPOOL_REPLAY_BATCH = 100
 
     def __init__(self, config: MqttConfig) -> None:
         tls_context = None
@@ -103,6 +137,22 @@ class MqttDataSink(DataSink):
         )
 
         self._client_task: Optional[asyncio.Task] = None
+        self._encoder = DataPointEncoder()
+        self._bundle_encoder = BundleEncoder(config.payload_format) if config.payload_format != "json" else None
+        self._batch_publish = config.batch_publish or config.batch_window > 0
+        self._batch_window = config.batch_window
+        self._pending: List[Tuple[str, Union[str, bytes]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._spool: Optional[DiskSpool] = None
+        if config.spool_dir:
+            self._spool = DiskSpool(config.spool_dir, config.spool_max_bytes, config.spool_segment_bytes)
+        self._spool_fsync_interval = max(0.1, config.spool_fsync_interval)
+        self._spool_replay_interval = 1 / config.spool_replay_rate if config.spool_replay_rate > 0 else 0.0
+        self._spool_task: Optional[asyncio.Task] = None
+        self._retry_scheduler = RetryScheduler(
+            self._try_publish, max_size=config.retry_queue_size, max_age=config.retry_deadline,
+            on_discard=self._spool.append if self._spool else None)
+        self._retry_task: Optional[asyncio.Task] = None
 
     @staticmethod
     def _build_ssl_context(
@@ -128,12 +178,32 @@ class MqttDataSink(DataSink):
             LOGGER.warning("MQTT client task is already running")
             return
         self._client_task = asyncio.create_task(self._connection_handler())
+        self._retry_task = asyncio.create_task(self._retry_scheduler.run())
+        if self._spool is not None:
+            self._spool_task = asyncio.create_task(self._flush_spool_periodically())
         LOGGER.info("Connecting to MQTT broker...")
 
     async def stop(self) -> None:
         if self._client_task is None:
             LOGGER.warning("MQTT client task is not running")
             return
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._pending:
+            await self._flush_pending()
+        if self._retry_task is not None:
+            self._retry_task.cancel()
+            self._retry_task = None
+        if self._spool is not None:
+            if self._spool_task is not None:
+                self._spool_task.cancel()
+                self._spool_task = None
+            for topic, payload in self._retry_scheduler.drain():
+                self._spool.append(topic, payload)
+            await asyncio.get_running_loop().run_in_executor(None, self._spool.close)
+        elif len(self._retry_scheduler) > 0:
+            LOGGER.warning("Discarding %d MQTT msgs waiting for a retry", len(self._retry_scheduler))
         LOGGER.info("Disconnecting from MQTT broker...")
         self._client_task.cancel()
         try:
@@ -144,16 +214,68 @@ class MqttDataSink(DataSink):
         LOGGER.info("Disconnected from MQTT broker")
 
     async def send(self, data_bundle: MeterDataBundle) -> None:
-        for data_point in data_bundle.data_points:
-            topic = MqttDataSink.get_topic_name_for_datapoint(data_point, data_bundle.source)
-            dp_json = self.data_point_to_mqtt_json(data_point, int(data_bundle.timestamp.timestamp()))
-            await self._publish_with_retries(topic, dp_json, retries=self.RETRIES)
+        source = data_bundle.source
+        if self._bundle_encoder is not None:
+            await self._send_bundle(data_bundle, f"smartmeter/{source}/data", f"smartmeter/{source}/schema")
+            return
+        timestamp = int(data_bundle.timestamp.timestamp())
+        encode = self._encoder.encode
+        await self._publish([encode(source, data_point, timestamp) for data_point in data_bundle.data_points])
+
+    async def _send_bundle(self, data_bundle: MeterDataBundle, topic: str, schema_topic: str) -> None:
+        """Publish the bundle as a single compact payload. The schema message of the meter is published
+        (retained) beforehand whenever it changed or could not be published yet."""
+        assert self._bundle_encoder is not None
+        schema_message, payload = self._bundle_encoder.encode(data_bundle)
+        if schema_message is not None:
+            try:
+                await self._client.publish(schema_topic, schema_message, retain=True)
+                self._bundle_encoder.confirm_schema(data_bundle.source, schema_message)
+            except (ValueError, TimeoutError, MqttCodeError, MqttError) as ex:
+                LOGGER.warning("MQTT publish of schema to topic '%s' failed, retrying with the next msg: %s",
+                               schema_topic, ex)
+        await self._publish([(topic, payload)])
+
+    async def _publish(self, messages: List[Tuple[str, Union[str, bytes]]]) -> None:
+        """Publish messages either one after another or batched, depending on the configuration.
+        Batched messages are published concurrently, each of them with its own retries.
+        With a batch window > 0 the messages of all bundles sent within the window are collected
+        and published together once the window has elapsed."""
+        if not self._batch_publish:
+            for topic, payload in messages:
+                await self._publish_with_retries(topic, payload, retries=self.RETRIES)
+        elif self._batch_window > 0:
+            self._pending.extend(messages)
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_after_window())
+        else:
+            await asyncio.gather(
+                *[self._publish_with_retries(topic, payload, retries=self.RETRIES) for topic, payload in messages])
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self._batch_window)
+        self._flush_task = None
+        await self._flush_pending()
+
+    async def _flush_pending(self) -> None:
+        messages, self._pending = self._pending, []
+        LOGGER.debug("Publishing batch of %d MQTT messages.", len(messages))
+        await asyncio.gather(
+            *[self._publish_with_retries(topic, payload, retries=self.RETRIES) for topic, payload in messages])
+
+    @property
+    def spool_depth(self) -> int:
+        """Number of msgs in the disk spool waiting to be replayed."""
+        return self._spool.depth if self._spool else 0
 
     async def _connection_handler(self) -> None:
         while True:
+            replay_task: Optional[asyncio.Task] = None
             try:
                 async with self._client:
                     LOGGER.info("Connected to MQTT broker using client ID '%s'", self._client.identifier)
+                    if self._spool is not None:
+                        replay_task = asyncio.create_task(self._replay_spool())
                     async for msg in self._client.messages:
                         # just used to keep the connection alive; no messages are expected
                         LOGGER.debug("Received message on topic '%s': %s", msg.topic, msg.payload)
@@ -163,25 +285,65 @@ class MqttDataSink(DataSink):
             except asyncio.CancelledError:
                 LOGGER.debug("MQTT client task cancelled")
                 break
+            finally:
+                if replay_task is not None:
+                    replay_task.cancel()
 
-    async def _publish_with_retries(self, topic: str, payload: str, retries: int = 1) -> None:
-        for attempt in range(retries + 1):
-            try:
-                await self._client.publish(topic, payload)
-                LOGGER.debug("Published MQTT msg with topic '%s': %s", topic, payload)
-                return
-            except ValueError as ex:
-                LOGGER.error("MQTT payload or topic is invalid: '%s'", ex)
-                return
-            except TimeoutError:
-                LOGGER.warning("MQTT publish attempt %d failed: not connected to broker", attempt + 1)
-            except (MqttCodeError, MqttError) as ex:
-                LOGGER.warning("MQTT publish attempt %d failed: %s", attempt + 1, ex)
-            if attempt < retries:
+    async def _flush_spool_periodically(self) -> None:
+        assert self._spool is not None
+        loop = asyncio.get_running_loop()
+        last_depth = 0
+        while True:
+            await asyncio.sleep(self._spool_fsync_interval)
+            await loop.run_in_executor(None, self._spool.flush)
+            depth = self._spool.depth
+            if depth != last_depth:
+                LOGGER.info("MQTT spool depth: %d msgs (%d bytes)", depth, self._spool.depth_bytes)
+                last_depth = depth
+
+    async def _replay_spool(self) -> None:
+        """Replay spooled msgs in order and rate limited while the connection to the broker is up."""
+        assert self._spool is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self._spool.flush)
+            records = await loop.run_in_executor(None, self._spool.read_batch, self.SPOOL_REPLAY_BATCH)
+            if not records:
+                await asyncio.sleep(self._spool_fsync_interval)
+                continue
+            LOGGER.info("Replaying spooled MQTT msgs (spool depth: %d msgs)", self._spool.depth)
+            delivered = None
+            for topic, payload, cursor in records:
+                if not await self._try_publish(topic, payload):
+                    break
+                delivered = cursor
+                await asyncio.sleep(self._spool_replay_interval)
+            if delivered is None:
                 await asyncio.sleep(1)
+                continue
+            await loop.run_in_executor(None, self._spool.ack, delivered)
 
-        LOGGER.error("Failed to publish MQTT msg with topic '%s' after %d attempts. Discarding msg",
-                     topic, retries + 1)
+    async def _publish_with_retries(self, topic: str, payload: Union[str, bytes], retries: int = 1) -> None:
+        """Publish a message. If the first attempt fails the message is handed over to the retry scheduler
+        so that the caller does not have to wait for the retries."""
+        if await self._try_publish(topic, payload) or retries <= 0:
+            return
+        self._retry_scheduler.schedule(topic, payload, retries)
+
+    async def _try_publish(self, topic: str, payload: Union[str, bytes]) -> bool:
+        """Returns True if the message was either published or must not be retried."""
+        try:
+            await self._client.publish(topic, payload)
+            LOGGER.debug("Published MQTT msg with topic '%s': %s", topic, payload)
+            return True
+        except ValueError as ex:
+            LOGGER.error("MQTT payload or topic is invalid: '%s'", ex)
+            return True
+        except TimeoutError:
+            LOGGER.warning("MQTT publish to topic '%s' failed: not connected to broker", topic)
+        except (MqttCodeError, MqttError) as ex:
+            LOGGER.warning("MQTT publish to topic '%s' failed: %s", topic, ex)
+        return False
 
     @staticmethod
     def get_topic_name_for_datapoint(data_point: MeterDataPoint, source: str) -> str:
@@ -206,8 +368,11 @@ class MqttSinkRlDsp(MqttDataSink):
 
     async def send(self, data_bundle: MeterDataBundle) -> None:
         topic = self.build_topic_name(data_bundle)
+        if self._bundle_encoder is not None:
+            await self._send_bundle(data_bundle, topic, f"dt/{self._group}/{data_bundle.source}/schema")
+            return
         payload = self.to_mqtt_payload(data_bundle)
-        await self._publish_with_retries(topic, payload, retries=self.RETRIES)
+        await self._publish([(topic, payload)])
 
     def build_topic_name(self, data_bundle: MeterDataBundle) -> str:
         return f"dt/{self._group}/{data_bundle.source}/ds"
@@ -0,0 +1,188 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import json
+import math
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from smartmeter_datacollector.smartmeter.meter_data import (ColumnarMeterDataBundle, MeterDataBundle, MeterDataPoint,
+                                                            MeterDataSchema)
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover
+    cbor2 = None
+
+PAYLOAD_FORMATS = ("json", "packed", "msgpack", "cbor")
+PACKED_VERSION = 1
+# version, schema id, timestamp in seconds, followed by one float64 per data point
+PACKED_HEADER = struct.Struct("<BII")
+
+
+def encode_json_number(value: Any) -> str:
+    """Encode a number exactly like json.dumps() does but without the overhead of the generic encoder."""
+    if isinstance(value, float):
+        if math.isfinite(value):
+            return float.__repr__(value)
+        return json.dumps(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return int.__repr__(value)
+    return json.dumps(value)
+
+
+class DataPointTemplate:  # pylint: disable=too-few-public-methods
+    """Precomputed topic and payload fragments of a data point of a specific meter and register."""
+    __slots__ = ("identifier", "topic", "_suffix")
+
+    def __init__(self, identifier: str, topic: str, obis_short: str) -> None:
+        self.identifier = identifier
+        self.topic = topic
+        self._suffix = f', "obis": {json.dumps(obis_short)}}}'
+
+    def render(self, value: Any, timestamp: int) -> str:
+        return '{"value": ' + encode_json_number(value) + ', "timestamp": ' + str(timestamp) + self._suffix
+
+
+class DataPointEncoder:  # pylint: disable=too-few-public-methods
+    """Encodes data points to MQTT topic and JSON payload using cached templates per (source, OBIS code).
+    The payload is identical to json.dumps({"value": ..., "timestamp": ..., "obis": ...})."""
+    MAX_TEMPLATES = 4096
+
+    def __init__(self, topic_prefix: str = "smartmeter") -> None:
+        self._topic_prefix = topic_prefix
+        self._templates: Dict[Tuple[str, OBISCode], DataPointTemplate] = {}
+
+    def encode(self, source: str, data_point: MeterDataPoint, timestamp: int) -> Tuple[str, str]:
+        key = (source, data_point.obis)
+        template = self._templates.get(key)
+        if template is None or template.identifier != data_point.type.identifier:
+            template = self._create_template(source, data_point)
+            if len(self._templates) >= self.MAX_TEMPLATES:
+                self._templates.clear()
+            self._templates[key] = template
+        return template.topic, template.render(data_point.value, timestamp)
+
+    def _create_template(self, source: str, data_point: MeterDataPoint) -> DataPointTemplate:
+        identifier = data_point.type.identifier
+        return DataPointTemplate(
+            identifier, f"{self._topic_prefix}/{source}/{identifier}", data_point.obis.to_short_str())
+
+
+def available_payload_formats() -> List[str]:
+    """Payload formats whose (optional) encoder library is installed."""
+    return [payload_format for payload_format in PAYLOAD_FORMATS
+            if (payload_format != "msgpack" or msgpack is not None) and (payload_format != "cbor" or cbor2 is not None)]
+
+
+class BundleSchema:  # pylint: disable=too-few-public-methods
+    """Encoding state of a meter data schema: the id referenced by the payloads, the schema message and for the
+    packed format the precompiled struct."""
+    __slots__ = ("schema", "schema_id", "message", "packer")
+
+    def __init__(self, schema: MeterDataSchema, payload_format: str) -> None:
+        data_points = [{"type": data_point_type.identifier, "name": data_point_type.name, "unit": data_point_type.unit,
+                        "obis": obis.to_short_str()}
+                       for data_point_type, obis in zip(schema.types, schema.obis_codes)]
+        self.schema = schema
+        self.schema_id = zlib.crc32(json.dumps(data_points, separators=(",", ":")).encode("utf-8"))
+        self.packer = struct.Struct(f"{PACKED_HEADER.format}{len(schema)}d")
+        message = {"version": PACKED_VERSION, "schema_id": self.schema_id, "format": payload_format,
+                   "data_points": data_points}
+        if payload_format == "packed":
+            message["layout"] = self.packer.format
+        self.message = json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+class BundleEncoder:
+    """Encodes a bundle into a single compact payload which references a schema message per meter instead of
+    repeating the OBIS codes: schema id, timestamp (seconds) and the values in schema order.
+
+    * packed: little-endian struct "<BII" + one float64 per data point (version, schema id, timestamp, values)
+    * msgpack / cbor: array [schema id, timestamp, [values]]
+
+    The schema message (JSON) has to be published (retained) before the first payload of a new schema;
+    encode() returns it until confirm_schema() is called for the source.
+    """
+    MAX_SOURCES = 256
+
+    def __init__(self, payload_format: str) -> None:
+        if payload_format not in PAYLOAD_FORMATS or payload_format == "json":
+            raise ValueError(f"Payload format '{payload_format}' is not a bundle format.")
+        if payload_format not in available_payload_formats():
+            raise ValueError(f"Payload format '{payload_format}' requires an optional package which is not installed.")
+        self._format = payload_format
+        self._schemas: Dict[str, BundleSchema] = {}
+        self._unconfirmed: Dict[str, BundleSchema] = {}
+
+    def encode(self, data_bundle: MeterDataBundle) -> Tuple[Optional[bytes], bytes]:
+        """Returns the schema message (None if already confirmed) and the payload."""
+        source = data_bundle.source
+        bundle_schema = self._schemas.get(source)
+        if isinstance(data_bundle, ColumnarMeterDataBundle):
+            schema, values = data_bundle.schema, data_bundle.values
+        else:
+            data_points = data_bundle.data_points
+            if bundle_schema is not None and self._has_layout(bundle_schema.schema, data_points):
+                schema = bundle_schema.schema
+            else:
+                schema = MeterDataSchema.of(data_points)
+            values = [dp.value if isinstance(dp.value, (int, float)) else math.nan for dp in data_points]
+
+        # schemas are interned, the comparison is only needed if the schema cache was cleared
+        if bundle_schema is None or (bundle_schema.schema is not schema and bundle_schema.schema != schema):
+            if bundle_schema is None and len(self._schemas) >= self.MAX_SOURCES:
+                self._schemas.clear()
+            bundle_schema = self._schemas[source] = BundleSchema(schema, self._format)
+            self._unconfirmed[source] = bundle_schema
+
+        timestamp = int(data_bundle.timestamp.timestamp())
+        if self._format == "packed":
+            payload = bundle_schema.packer.pack(PACKED_VERSION, bundle_schema.schema_id, timestamp, *values)
+        elif self._format == "msgpack":
+            payload = msgpack.packb([bundle_schema.schema_id, timestamp, list(values)])
+        else:
+            payload = cbor2.dumps([bundle_schema.schema_id, timestamp, list(values)])
+        unconfirmed = self._unconfirmed.get(source)
+        return (unconfirmed.message if unconfirmed is not None else None), payload
+
+    @staticmethod
+    def _has_layout(schema: MeterDataSchema, data_points: List[MeterDataPoint]) -> bool:
+        # types and OBIS codes are shared objects, identity checks avoid building the schema key per bundle
+        return len(data_points) == len(schema) and all(
+            dp.type is data_point_type and dp.obis is obis
+            for dp, data_point_type, obis in zip(data_points, schema.types, schema.obis_codes))
+
+    def confirm_schema(self, source: str, schema_message: bytes) -> None:
+        """Mark the schema message of the source as published."""
+        unconfirmed = self._unconfirmed.get(source)
+        if unconfirmed is not None and unconfirmed.message == schema_message:
+            del self._unconfirmed[source]
+
+
+def decode_bundle_payload(payload_format: str, payload: bytes) -> Tuple[int, int, List[float]]:
+    """Decode a payload of BundleEncoder into schema id, timestamp and values."""
+    if payload_format == "packed":
+        count = (len(payload) - PACKED_HEADER.size) // 8
+        version, schema_id, timestamp = PACKED_HEADER.unpack_from(payload)
+        if version != PACKED_VERSION or PACKED_HEADER.size + count * 8 != len(payload):
+            raise ValueError("Invalid packed payload.")
+        return schema_id, timestamp, list(struct.unpack_from(f"<{count}d", payload, PACKED_HEADER.size))
+    if payload_format == "msgpack" and msgpack is not None:
+        schema_id, timestamp, values = msgpack.unpackb(payload)
+    elif payload_format == "cbor" and cbor2 is not None:
+        schema_id, timestamp, values = cbor2.loads(payload)
+    else:
+        raise ValueError(f"Payload format '{payload_format}' is not supported.")
+    return schema_id, timestamp, values
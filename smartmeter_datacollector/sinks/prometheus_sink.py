@@ -0,0 +1,186 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import logging
+import math
+from array import array
+from configparser import SectionProxy
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointType
+
+LOGGER = logging.getLogger("sink")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metric_type(data_point_type: MeterDataPointType) -> str:
+    """Energy readings only increase and are exported as counters. The consumption per aggregation window
+    (derived *_DELTA types) is not cumulative and is exported as gauge like all other values."""
+    if data_point_type.is_energy and not data_point_type.identifier.endswith("_DELTA"):
+        return "counter"
+    return "gauge"
+
+
+@dataclass
+class PrometheusConfig:
+    host: str = "0.0.0.0"
+    port: int = 9101
+    path: str = "/metrics"
+    metric_prefix: str = "smartmeter"
+
+    @staticmethod
+    def from_sink_config(config: SectionProxy) -> "PrometheusConfig":
+        path = config.get("path", PrometheusConfig.path).strip()
+        return PrometheusConfig(
+            host=config.get("host", PrometheusConfig.host),
+            port=config.getint("port", PrometheusConfig.port),
+            path=path if path.startswith("/") else f"/{path}",
+            metric_prefix=config.get("metric_prefix", PrometheusConfig.metric_prefix).strip())
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_sample_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class LatestValueStore:
+    """Latest value per (source, data point type). Values are held in a single array, the series metadata
+    and the label part of the sample lines are created once per series."""
+
+    def __init__(self) -> None:
+        self._slots: Dict[Tuple[str, str], int] = {}
+        self._series: List[Tuple[MeterDataPointType, str]] = []
+        self._values = array("d")
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """Incremented each time a value or a series changes."""
+        return self._version
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def update(self, source: str, data_point: MeterDataPoint) -> None:
+        value = float(data_point.value)
+        slot = self._slots.get((source, data_point.type.identifier))
+        if slot is None:
+            self._slots[(source, data_point.type.identifier)] = len(self._values)
+            self._series.append((data_point.type, f'{{source="{escape_label_value(source)}",'
+                                                  f'obis="{data_point.obis.to_short_str()}"}} '))
+            self._values.append(value)
+        elif self._values[slot] == value:
+            return
+        else:
+            self._values[slot] = value
+        self._version += 1
+
+    def items(self):
+        """Yields (data point type, rendered labels, value) of all series."""
+        return ((data_point_type, labels, value)
+                for (data_point_type, labels), value in zip(self._series, self._values))
+
+
+class PrometheusSink(DataSink):
+    """Serves the latest values in the Prometheus text exposition format. The page is rendered on the first
+    scrape after a value changed, all other scrapes return the cached page."""
+    READ_TIMEOUT = 5.0
+    MAX_REQUEST_SIZE = 8192
+
+    def __init__(self, config: PrometheusConfig) -> None:
+        self._config = config
+        self._store = LatestValueStore()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._page = b""
+        self._page_version = -1
+
+    @property
+    def port(self) -> Optional[int]:
+        """Port the server listens on, differs from the configured port if it was 0."""
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_client, self._config.host, self._config.port,
+                                                  limit=self.MAX_REQUEST_SIZE)
+        LOGGER.info("Prometheus exporter listening on %s:%s%s", self._config.host, self.port, self._config.path)
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def send(self, data_bundle: MeterDataBundle) -> None:
+        source = data_bundle.source
+        for data_point in data_bundle.data_points:
+            if isinstance(data_point.value, (int, float)):
+                self._store.update(source, data_point)
+
+    def render(self) -> bytes:
+        if self._page_version == self._store.version:
+            return self._page
+        by_type: Dict[str, List[str]] = {}
+        types: Dict[str, MeterDataPointType] = {}
+        for data_point_type, labels, value in self._store.items():
+            types.setdefault(data_point_type.identifier, data_point_type)
+            by_type.setdefault(data_point_type.identifier, []).append(labels + format_sample_value(value))
+
+        lines = []
+        for identifier in sorted(by_type):
+            data_point_type = types[identifier]
+            name = f"{self._config.metric_prefix}_{identifier.lower()}"
+            unit = f" [{data_point_type.unit}]" if data_point_type.unit else ""
+            lines.append(f"# HELP {name} {data_point_type.name}{unit}")
+            lines.append(f"# TYPE {name} {metric_type(data_point_type)}")
+            lines.extend(name + sample for sample in by_type[identifier])
+        self._page = ("\n".join(lines) + "\n").encode() if lines else b""
+        self._page_version = self._store.version
+        return self._page
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.READ_TIMEOUT)
+            request_line = request.split(b"\r\n", 1)[0].decode("latin-1").split()
+            if len(request_line) != 3:
+                await self._respond(writer, "400 Bad Request")
+            elif request_line[0] not in ("GET", "HEAD"):
+                await self._respond(writer, "405 Method Not Allowed")
+            elif request_line[1].split("?", 1)[0] != self._config.path:
+                await self._respond(writer, "404 Not Found")
+            else:
+                await self._respond(writer, "200 OK", self.render(), CONTENT_TYPE, request_line[0] == "HEAD")
+        except asyncio.LimitOverrunError:
+            try:
+                await self._respond(writer, "431 Request Header Fields Too Large")
+            except ConnectionError:
+                pass
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: str, body: bytes = b"",
+                       content_type: str = "text/plain", head: bool = False) -> None:
+        header = (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                  f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode()
+        writer.write(header if head else header + body)
+        await writer.drain()
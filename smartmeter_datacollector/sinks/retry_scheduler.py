@@ -0,0 +1,129 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+LOGGER = logging.getLogger("sink")
+
+
+@dataclass(order=True)
+class RetryEntry:
+    due: float
+    seq: int
+    topic: str = field(compare=False)
+    payload: Union[str, bytes] = field(compare=False)
+    attempt: int = field(compare=False)
+    retries_left: int = field(compare=False)
+    deadline: float = field(compare=False)
+
+
+# pylint: disable=too-many-instance-attributes
+class RetryScheduler:
+    """Retries failed publishes in the background with exponential backoff and jitter.
+
+    Failed messages are kept in a capped queue ordered by their next due time. A message is discarded
+    if it runs out of retries, misses its deadline or does not fit into the queue anymore. Discarded
+    messages are passed to on_discard if set.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self,
+                 publish: Callable[[str, Union[str, bytes]], Awaitable[bool]],
+                 max_size: int = 1000,
+                 max_age: float = 60.0,
+                 base_delay: float = 1.0,
+                 max_delay: float = 30.0,
+                 on_discard: Optional[Callable[[str, Union[str, bytes]], None]] = None) -> None:
+        self._publish = publish
+        self._on_discard = on_discard
+        self._max_size = max_size
+        self._max_age = max_age
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._heap: List[RetryEntry] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._discarded = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @property
+    def discarded(self) -> int:
+        return self._discarded
+
+    def schedule(self, topic: str, payload: Union[str, bytes], retries: int, now: Optional[float] = None) -> None:
+        """Schedule the first retry of a message whose first publish attempt failed."""
+        now = time.monotonic() if now is None else now
+        self._push(RetryEntry(0.0, 0, topic, payload, 1, retries, now + self._max_age), now)
+
+    def drain(self) -> List[Tuple[str, Union[str, bytes]]]:
+        """Remove all waiting messages from the queue and return them in the order of their first failure."""
+        entries = sorted(self._heap, key=lambda e: e.deadline)
+        self._heap.clear()
+        return [(entry.topic, entry.payload) for entry in entries]
+
+    async def run(self) -> None:
+        while True:
+            timeout = max(0.0, self._heap[0].due - time.monotonic()) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            await self.process_due()
+
+    async def process_due(self, now: Optional[float] = None) -> int:
+        """Retry all messages which are due. Returns the number of retried messages."""
+        now = time.monotonic() if now is None else now
+        due_entries: List[RetryEntry] = []
+        while self._heap and self._heap[0].due <= now:
+            entry = heapq.heappop(self._heap)
+            if entry.deadline < now:
+                self._discard(entry, "deadline exceeded")
+            else:
+                due_entries.append(entry)
+        if not due_entries:
+            return 0
+
+        results = await asyncio.gather(*[self._publish(entry.topic, entry.payload) for entry in due_entries])
+        for entry, success in zip(due_entries, results):
+            if success:
+                continue
+            if entry.retries_left <= 1:
+                self._discard(entry, f"no success after {entry.attempt + 1} attempts")
+                continue
+            entry.attempt += 1
+            entry.retries_left -= 1
+            self._push(entry, now)
+        return len(due_entries)
+
+    def _push(self, entry: RetryEntry, now: float) -> None:
+        if len(self._heap) >= self._max_size:
+            self._discard(entry, "retry queue is full")
+            return
+        delay = min(self._max_delay, self._base_delay * 2 ** (entry.attempt - 1))
+        # "equal jitter": wait at least half of the backoff to spread retries of concurrently failed messages
+        entry.due = now + delay / 2 + random.uniform(0, delay / 2)
+        entry.seq = next(self._seq)
+        heapq.heappush(self._heap, entry)
+        self._wakeup.set()
+
+    def _discard(self, entry: RetryEntry, reason: str) -> None:
+        self._discarded += 1
+        if self._on_discard is not None:
+            LOGGER.warning("Failed to publish MQTT msg with topic '%s' (%s). Spooling msg", entry.topic, reason)
+            self._on_discard(entry.topic, entry.payload)
+            return
+        LOGGER.error("Failed to publish MQTT msg with topic '%s' (%s). Discarding msg", entry.topic, reason)
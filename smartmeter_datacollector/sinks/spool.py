@@ -0,0 +1,325 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import logging
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+LOGGER = logging.getLogger("sink")
+
+# CRC32 over the rest of the record, topic length, payload length
+RECORD_HEADER = struct.Struct("<IHI")
+SEGMENT_SUFFIX = ".spool"
+CURSOR_FILE = "cursor"
+
+# segment index, offset within segment, number of records within segment before offset
+SpoolCursor = Tuple[int, int, int]
+SpoolRecord = Tuple[str, bytes, SpoolCursor]
+
+
+# pylint: disable=too-many-instance-attributes
+class DiskSpool:
+    """Append-only on-disk spool (write-ahead log) for messages which could not be delivered.
+
+    Records are appended to segment files which are rotated when they exceed the segment size. Appended
+    records are buffered in memory and written with a single write and fsync on flush() to keep the write
+    amplification on SD cards low. Records are replayed in order with read_batch() and ack(). Fully replayed
+    segments are deleted. If the spool exceeds its size cap, the oldest segment is deleted.
+    The replay position is persisted on ack, records might be replayed twice after a crash (at-least-once).
+    All methods are thread-safe so that the blocking file operations can be run in an executor. The file
+    operations are serialized with a separate file lock, append() and depth never wait for disk I/O.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 50_000_000, segment_bytes: int = 1_000_000) -> None:
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._segment_bytes = max(1, min(segment_bytes, max_bytes))
+        # protects the in-memory state, never held during disk I/O
+        self._lock = threading.Lock()
+        # serializes flush, read_batch, ack and close which access the segment files
+        self._file_lock = threading.Lock()
+        self._buffer = bytearray()
+        self._buffer_records = 0
+        # records taken from the buffer which are being written by flush()
+        self._flushing_records = 0
+        self._flushing_bytes = 0
+        # segment index -> [size in bytes, number of records]
+        self._segments: Dict[int, List[int]] = {}
+        self._writer: Optional[BinaryIO] = None
+        self._cursor: SpoolCursor = (0, 0, 0)
+        self._dropped_records = 0
+        self._load()
+
+    @property
+    def depth(self) -> int:
+        """Number of spooled records which have not been replayed yet."""
+        with self._lock:
+            return (sum(seg[1] for seg in self._segments.values()) + self._buffer_records + self._flushing_records -
+                    self._cursor[2])
+
+    @property
+    def depth_bytes(self) -> int:
+        with self._lock:
+            return (sum(seg[0] for seg in self._segments.values()) + len(self._buffer) + self._flushing_bytes -
+                    self._cursor[1])
+
+    @property
+    def dropped(self) -> int:
+        """Number of records deleted because the spool exceeded its size cap."""
+        return self._dropped_records
+
+    def append(self, topic: str, payload: Union[str, bytes]) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        topic_bytes = topic.encode("utf-8")
+        body = topic_bytes + payload
+        header = RECORD_HEADER.pack(zlib.crc32(body), len(topic_bytes), len(payload))
+        with self._lock:
+            self._buffer += header
+            self._buffer += body
+            self._buffer_records += 1
+
+    def flush(self) -> None:
+        """Write buffered records to the active segment and fsync it."""
+        with self._file_lock:
+            with self._lock:
+                if not self._buffer:
+                    return
+                data, records = bytes(self._buffer), self._buffer_records
+                self._buffer.clear()
+                self._buffer_records = 0
+                self._flushing_records, self._flushing_bytes = records, len(data)
+                index = self._active_segment()
+                if self._segments[index][0] > 0 and self._segments[index][0] + len(data) > self._segment_bytes:
+                    index = self._rotate()
+
+            try:
+                writer = self._open_writer(index)
+                writer.write(data)
+                writer.flush()
+                os.fsync(writer.fileno())
+            except OSError:
+                with self._lock:
+                    self._flushing_records, self._flushing_bytes = 0, 0
+                    self._dropped_records += records
+                    # the segment might end with a partially written record now
+                    if index == self._active_segment():
+                        self._rotate()
+                self._close_writer()
+                raise
+            with self._lock:
+                self._flushing_records, self._flushing_bytes = 0, 0
+                self._segments[index][0] += len(data)
+                self._segments[index][1] += records
+                deleted = self._enforce_size_cap()
+            self._unlink_segments(deleted)
+
+    def read_batch(self, max_records: int) -> List[SpoolRecord]:
+        """Read up to max_records flushed records starting at the replay position.
+        Each record contains the cursor which has to be acknowledged after the record was delivered."""
+        records: List[SpoolRecord] = []
+        deleted: List[int] = []
+        with self._file_lock:
+            with self._lock:
+                index, offset, count = self._cursor
+                segments = sorted((seg_index, seg[0]) for seg_index, seg in self._segments.items())
+            for seg_index, size in segments:
+                if seg_index < index:
+                    continue
+                if seg_index > index:
+                    index, offset, count = seg_index, 0, 0
+                if offset >= size:
+                    continue
+                with open(self._segment_path(seg_index), "rb") as file:
+                    file.seek(offset)
+                    while offset < size and len(records) < max_records:
+                        record = self._read_record(file)
+                        if record is None:
+                            with self._lock:
+                                deleted += self._drop_corrupt_tail(seg_index, offset, count)
+                            break
+                        topic, payload, length = record
+                        offset += length
+                        count += 1
+                        records.append((topic, payload, (seg_index, offset, count)))
+                if len(records) >= max_records:
+                    break
+            self._unlink_segments(deleted)
+        return records
+
+    def ack(self, cursor: SpoolCursor) -> None:
+        """Mark all records up to cursor as delivered. Fully replayed segments are deleted."""
+        with self._file_lock:
+            with self._lock:
+                deleted = self._advance_cursor(cursor)
+                saved_cursor = self._cursor
+            self._unlink_segments(deleted)
+            self._save_cursor(saved_cursor)
+
+    def close(self) -> None:
+        self.flush()
+        with self._file_lock:
+            self._close_writer()
+
+    def _load(self) -> None:
+        for path in self._dir.glob(f"*{SEGMENT_SUFFIX}"):
+            try:
+                index = int(path.stem)
+            except ValueError:
+                continue
+            self._segments[index] = [path.stat().st_size, 0]
+        for index, segment in self._segments.items():
+            segment[1] = self._count_records(index, segment[0])
+        if not self._segments:
+            self._segments[0] = [0, 0]
+        elif self._segments[self._active_segment()][0] > 0:
+            # never append to a segment which might end with a partially written record
+            self._rotate()
+
+        cursor_path = self._dir / CURSOR_FILE
+        try:
+            index, offset, count = (int(v) for v in cursor_path.read_text(encoding="utf-8").split())
+        except (OSError, ValueError):
+            index, offset, count = min(self._segments), 0, 0
+        if index in self._segments and offset <= self._segments[index][0]:
+            self._cursor = (index, offset, count)
+        else:
+            self._cursor = (min(self._segments), 0, 0)
+        if self.depth:
+            LOGGER.info("Found %d spooled MQTT msgs in '%s'.", self.depth, self._dir)
+
+    def _count_records(self, index: int, until_offset: int) -> int:
+        count = 0
+        offset = 0
+        path = self._segment_path(index)
+        if not path.exists():
+            return 0
+        with open(path, "rb") as file:
+            while offset < until_offset:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                _, topic_len, payload_len = RECORD_HEADER.unpack(header)
+                file.seek(topic_len + payload_len, os.SEEK_CUR)
+                offset += RECORD_HEADER.size + topic_len + payload_len
+                count += 1
+        return count
+
+    @staticmethod
+    def _read_record(file: BinaryIO) -> Optional[Tuple[str, bytes, int]]:
+        header = file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        crc, topic_len, payload_len = RECORD_HEADER.unpack(header)
+        body = file.read(topic_len + payload_len)
+        if len(body) < topic_len + payload_len or zlib.crc32(body) != crc:
+            return None
+        try:
+            topic = body[:topic_len].decode("utf-8")
+        except UnicodeDecodeError:
+            return None
+        return topic, body[topic_len:], RECORD_HEADER.size + len(body)
+
+    # The following methods only update the in-memory state under the lock. They return the indexes of the
+    # removed segments which are deleted from disk with _unlink_segments() after the lock is released.
+
+    def _advance_cursor(self, cursor: SpoolCursor) -> List[int]:
+        if cursor[:2] <= self._cursor[:2]:
+            return []
+        index, offset, _ = cursor
+        deleted = [i for i in self._segments if i < index]
+        for seg_index in deleted:
+            self._remove_segment(seg_index)
+        if index not in self._segments:
+            return deleted
+        self._cursor = cursor
+        if offset >= self._segments[index][0]:
+            if index == self._active_segment():
+                self._rotate()
+            self._remove_segment(index)
+            deleted.append(index)
+        return deleted
+
+    def _drop_corrupt_tail(self, index: int, offset: int, count: int) -> List[int]:
+        LOGGER.warning("Corrupt record in MQTT spool segment %d. Dropping rest of segment.", index)
+        if index == self._active_segment():
+            # new records must not be appended behind the corrupt data
+            self._rotate()
+        self._segments[index][0] = offset
+        self._segments[index][1] = count
+        if self._cursor[0] == index and self._cursor[1] >= offset:
+            self._remove_segment(index)
+            return [index]
+        return []
+
+    def _active_segment(self) -> int:
+        return max(self._segments)
+
+    def _rotate(self) -> int:
+        # the writer of the previous segment is closed by _open_writer()
+        index = self._active_segment() + 1
+        self._segments[index] = [0, 0]
+        return index
+
+    def _open_writer(self, index: int) -> BinaryIO:
+        if self._writer is None or self._writer.name != str(self._segment_path(index)):
+            if self._writer:
+                self._writer.close()
+            # pylint: disable=consider-using-with
+            self._writer = open(self._segment_path(index), "ab")
+        return self._writer
+
+    def _close_writer(self) -> None:
+        if self._writer:
+            try:
+                self._writer.close()
+            except OSError:
+                # buffered data of a failed write is lost, the records were already counted as dropped
+                pass
+            self._writer = None
+
+    def _enforce_size_cap(self) -> List[int]:
+        deleted = []
+        while sum(seg[0] for seg in self._segments.values()) > self._max_bytes:
+            oldest = min(self._segments)
+            if oldest == self._active_segment():
+                self._rotate()
+            dropped = self._segments[oldest][1]
+            if oldest == self._cursor[0]:
+                dropped -= self._cursor[2]
+            self._dropped_records += dropped
+            LOGGER.warning("MQTT spool exceeds %d bytes. Dropping %d oldest spooled msgs.", self._max_bytes, dropped)
+            self._remove_segment(oldest)
+            deleted.append(oldest)
+        return deleted
+
+    def _remove_segment(self, index: int) -> None:
+        del self._segments[index]
+        if not self._segments:
+            self._segments[index + 1] = [0, 0]
+        if self._cursor[0] == index:
+            self._cursor = (min(self._segments), 0, 0)
+
+    def _unlink_segments(self, indexes: List[int]) -> None:
+        for index in indexes:
+            try:
+                self._segment_path(index).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _save_cursor(self, cursor: SpoolCursor) -> None:
+        tmp_path = self._dir / f"{CURSOR_FILE}.tmp"
+        tmp_path.write_text(" ".join(str(v) for v in cursor), encoding="utf-8")
+        os.replace(tmp_path, self._dir / CURSOR_FILE)
+
+    def _segment_path(self, index: int) -> Path:
+        return self._dir / f"{index:08d}{SEGMENT_SUFFIX}"
@@ -0,0 +1,219 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from configparser import SectionProxy
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPointType
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+LOGGER = logging.getLogger("sink")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meters (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS registers (
+    id INTEGER PRIMARY KEY,
+    meter_id INTEGER NOT NULL REFERENCES meters(id),
+    obis TEXT NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    UNIQUE (meter_id, obis, type)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    register_id INTEGER NOT NULL REFERENCES registers(id),
+    ts INTEGER NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS samples_register_ts ON samples (register_id, ts);
+CREATE VIEW IF NOT EXISTS sample_values AS
+    SELECT meters.source, registers.obis, registers.type, registers.unit, samples.ts, samples.value
+    FROM samples
+    JOIN registers ON registers.id = samples.register_id
+    JOIN meters ON meters.id = registers.meter_id;
+"""
+
+# register id, timestamp in ms, value
+SampleRow = Tuple[int, int, float]
+
+
+@dataclass
+class SqliteConfig:
+    path: str
+    batch_size: int = 5000
+    commit_interval: float = 10.0
+    # 0: samples are kept forever
+    retention_days: float = 0.0
+    # maximum number of samples deleted after a commit
+    prune_batch: int = 5000
+    queue_size: int = 10000
+
+    @staticmethod
+    def from_sink_config(config: SectionProxy) -> "SqliteConfig":
+        path = config.get("path")
+        if not path:
+            raise InvalidConfigError("SQLite sink: 'path' must be set")
+        sqlite_config = SqliteConfig(
+            path.strip(),
+            batch_size=config.getint("batch_size", SqliteConfig.batch_size),
+            commit_interval=config.getfloat("commit_interval", SqliteConfig.commit_interval),
+            retention_days=config.getfloat("retention_days", SqliteConfig.retention_days),
+            prune_batch=config.getint("prune_batch", SqliteConfig.prune_batch),
+            queue_size=config.getint("queue_size", SqliteConfig.queue_size))
+        if sqlite_config.batch_size <= 0 or sqlite_config.prune_batch <= 0 or sqlite_config.commit_interval <= 0:
+            raise InvalidConfigError("SQLite sink: 'batch_size', 'prune_batch' and 'commit_interval' must be > 0")
+        return sqlite_config
+
+
+class SqliteWriter:
+    """Owns the SQLite connection. Created in an executor and then only used from the writer thread of the
+    SqliteSink, never concurrently."""
+
+    def __init__(self, config: SqliteConfig) -> None:
+        self._config = config
+        self._connection = sqlite3.connect(config.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._meter_ids: Dict[str, int] = {}
+        self._register_ids: Dict[Tuple[str, str, str], int] = {}
+
+    def write(self, data_bundles: List[MeterDataBundle]) -> int:
+        """Insert the data points of the bundles in a single transaction and prune old samples."""
+        try:
+            with self._connection:
+                rows = self._to_rows(data_bundles)
+                self._connection.executemany("INSERT INTO samples (register_id, ts, value) VALUES (?, ?, ?)", rows)
+        except Exception:
+            # meters and registers inserted by the rolled back transaction do not exist
+            self._meter_ids.clear()
+            self._register_ids.clear()
+            raise
+        if self._config.retention_days > 0:
+            self.prune(int((time.time() - self._config.retention_days * 86400) * 1000))
+        return len(rows)
+
+    def prune(self, before_ms: int) -> int:
+        """Delete at most prune_batch samples older than before_ms. The old samples are looked up per register with
+        the (register_id, ts) index, independent of the insertion order. If there is nothing to delete, a prune
+        reads a single index entry per register."""
+        with self._connection:
+            cursor = self._connection.execute(
+                "DELETE FROM samples WHERE rowid IN (SELECT rowid FROM samples "
+                "WHERE register_id IN (SELECT id FROM registers) AND ts < ? LIMIT ?)",
+                (before_ms, self._config.prune_batch))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _to_rows(self, data_bundles: List[MeterDataBundle]) -> List[SampleRow]:
+        rows: List[SampleRow] = []
+        for data_bundle in data_bundles:
+            timestamp = int(round(data_bundle.timestamp.timestamp() * 1000))
+            source = data_bundle.source
+            for data_point in data_bundle.data_points:
+                if not isinstance(data_point.value, (int, float)):
+                    continue
+                key = (source, str(data_point.obis), data_point.type.identifier)
+                register_id = self._register_ids.get(key)
+                if register_id is None:
+                    register_id = self._register_id(source, data_point.obis, data_point.type)
+                    self._register_ids[key] = register_id
+                rows.append((register_id, timestamp, data_point.value))
+        return rows
+
+    def _register_id(self, source: str, obis: OBISCode, data_point_type: MeterDataPointType) -> int:
+        meter_id = self._meter_ids.get(source)
+        if meter_id is None:
+            self._connection.execute("INSERT OR IGNORE INTO meters (source) VALUES (?)", (source,))
+            meter_id = self._connection.execute("SELECT id FROM meters WHERE source = ?", (source,)).fetchone()[0]
+            self._meter_ids[source] = meter_id
+        self._connection.execute(
+            "INSERT OR IGNORE INTO registers (meter_id, obis, type, name, unit) VALUES (?, ?, ?, ?, ?)",
+            (meter_id, str(obis), data_point_type.identifier, data_point_type.name, data_point_type.unit))
+        return self._connection.execute(
+            "SELECT id FROM registers WHERE meter_id = ? AND obis = ? AND type = ?",
+            (meter_id, str(obis), data_point_type.identifier)).fetchone()[0]
+
+
+class SqliteSink(DataSink):
+    """Stores the data points in a SQLite database (WAL mode) with the tables meters, registers and samples.
+    Bundles are handed over to a background thread which inserts them in batched transactions, either when
+    batch_size data points are pending or after commit_interval seconds. Old samples are pruned incrementally
+    after each commit if a retention is configured."""
+
+    def __init__(self, config: SqliteConfig) -> None:
+        self._config = config
+        self._queue: queue.Queue = queue.Queue(config.queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._dropped = 0
+
+    @property
+    def dropped(self) -> int:
+        """Number of bundles dropped because the writer thread could not keep up."""
+        return self._dropped
+
+    async def start(self) -> None:
+        if self._thread is not None:
+            return
+        writer = await asyncio.get_running_loop().run_in_executor(None, SqliteWriter, self._config)
+        self._thread = threading.Thread(target=self._run, args=(writer,), name="sqlite-sink", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._thread is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._queue.put, None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+
+    async def send(self, data_bundle: MeterDataBundle) -> None:
+        try:
+            self._queue.put_nowait(data_bundle)
+        except queue.Full:
+            self._dropped += 1
+            LOGGER.warning("SQLite sink queue is full. Current data points are dropped.")
+
+    def _run(self, writer: SqliteWriter) -> None:
+        pending: List[MeterDataBundle] = []
+        pending_points = 0
+        deadline = time.monotonic() + self._config.commit_interval
+        running = True
+        while running:
+            try:
+                data_bundle = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if data_bundle is None:
+                    running = False
+                else:
+                    pending.append(data_bundle)
+                    pending_points += len(data_bundle.data_points)
+            except queue.Empty:
+                pass
+            if pending and (not running or pending_points >= self._config.batch_size or
+                            time.monotonic() >= deadline):
+                try:
+                    writer.write(pending)
+                except Exception as ex:  # pylint: disable=broad-except
+                    LOGGER.error("Unable to write %d bundles to SQLite database: '%s'", len(pending), ex)
+                pending = []
+                pending_points = 0
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self._config.commit_interval
+        writer.close()
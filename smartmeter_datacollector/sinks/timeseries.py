@@ -0,0 +1,390 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import json
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import zlib
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointType
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+LOGGER = logging.getLogger("sink")
+
+# record kind, CRC32 of the payload, payload length
+RECORD_HEADER = struct.Struct("<BII")
+# schema id, number of rows, first and last timestamp in ms (uncompressed part of a block payload)
+BLOCK_HEADER = struct.Struct("<HIqq")
+RECORD_SCHEMA = 1
+RECORD_BLOCK = 2
+SEGMENT_SUFFIX = ".tsd"
+# partition name format and length in seconds
+PARTITIONS = {
+    "hour": ("%Y%m%d%H", 3600),
+    "day": ("%Y%m%d", 86400),
+}
+# partition name length -> partition name format and length
+PARTITION_NAMES = {len(datetime(2000, 1, 1).strftime(fmt)): (fmt, seconds) for fmt, seconds in PARTITIONS.values()}
+UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+# (identifier, name, unit, OBIS code) per column
+SchemaKey = Tuple[Tuple[str, str, str, str], ...]
+Row = Tuple[int, SchemaKey, List[float]]
+# encoded records, rows and schema ids of a segment file
+SegmentAppend = Tuple[bytearray, List[Row], Dict[SchemaKey, int]]
+
+
+def encode_timestamps(timestamps: List[int]) -> bytes:
+    """Zigzag varint encoded deltas to the previous timestamp, the first delta is relative to the first timestamp."""
+    data = bytearray()
+    previous = timestamps[0]
+    for timestamp in timestamps:
+        delta = timestamp - previous
+        previous = timestamp
+        value = (delta << 1) ^ (delta >> 63)
+        while value > 0x7F:
+            data.append((value & 0x7F) | 0x80)
+            value >>= 7
+        data.append(value)
+    return bytes(data)
+
+
+def decode_timestamps(data: bytes, first: int, count: int) -> List[int]:
+    timestamps = []
+    timestamp = first
+    offset = 0
+    for _ in range(count):
+        value = 0
+        shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        timestamp += (value >> 1) ^ -(value & 1)
+        timestamps.append(timestamp)
+    return timestamps
+
+
+def encode_floats(values: List[float]) -> bytes:
+    """XOR of each value with its predecessor, byte-shuffled. Slowly changing values produce long runs of
+    zero bytes (equal sign, exponent and leading mantissa bits) which compress well."""
+    bits = array("Q", array("d", values).tobytes())
+    xored = array("Q", [bits[0]])
+    xored.extend(bits[index] ^ bits[index - 1] for index in range(1, len(bits)))
+    raw = xored.tobytes()
+    return b"".join(raw[index::8] for index in range(8))
+
+
+def decode_floats(data: bytes, count: int) -> List[float]:
+    raw = bytearray(count * 8)
+    for index in range(8):
+        raw[index::8] = data[index * count:(index + 1) * count]
+    bits = array("Q", bytes(raw))
+    for index in range(1, count):
+        bits[index] ^= bits[index - 1]
+    return array("d", bits.tobytes()).tolist()
+
+
+def to_milliseconds(timestamp: datetime) -> int:
+    return int(round(timestamp.timestamp() * 1000))
+
+
+def source_directory_name(source: str) -> str:
+    return UNSAFE_CHARS.sub("_", source) or "_"
+
+
+# pylint: disable=too-many-instance-attributes
+class TimeSeriesWriter:
+    """Writes bundles to rolling, time-partitioned segment files, one directory per source.
+
+    A segment file is a sequence of records. Schema records hold the types and OBIS codes of a meter once per
+    file, block records hold the rows of one schema in columnar form: delta-encoded timestamps followed by one
+    XOR-encoded column per register, compressed with zlib. Appended rows are buffered in memory and written
+    with a single write and fsync per file on flush(). Rows which could not be written are kept (up to
+    MAX_PENDING_ROWS per source) and written with the next flush. If the total size exceeds max_bytes the oldest
+    segment files are deleted. All methods are thread-safe so that flush() can be run in an executor, append()
+    never waits for the file operations of flush().
+    """
+    MAX_PENDING_ROWS = 100_000
+
+    def __init__(self, directory: str, partition: str = "day", max_bytes: int = 500_000_000,
+                 compression_level: int = 6) -> None:
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._partition_format, self._partition_seconds = PARTITIONS[partition]
+        self._max_bytes = max_bytes
+        self._compression_level = compression_level
+        # protects the pending rows and the sizes, never held during disk I/O
+        self._lock = threading.Lock()
+        # serializes flush() which accesses the segment files
+        self._file_lock = threading.Lock()
+        self._pending: Dict[str, List[Row]] = {}
+        self._schema_keys: Dict[Tuple[Tuple[str, str], ...], SchemaKey] = {}
+        # schema ids of the segment files written by this writer
+        self._file_schemas: Dict[Path, Dict[SchemaKey, int]] = {}
+        self._sizes: Dict[Path, int] = {path: path.stat().st_size for path in self._dir.glob(f"*/*{SEGMENT_SUFFIX}")}
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def append(self, data_bundle: MeterDataBundle) -> None:
+        data_points = data_bundle.data_points
+        if not data_points:
+            return
+        values = [float(dp.value) if isinstance(dp.value, (int, float)) else math.nan for dp in data_points]
+        schema_key = self._schema_key(data_points)
+        with self._lock:
+            self._pending.setdefault(data_bundle.source, []).append(
+                (to_milliseconds(data_bundle.timestamp), schema_key, values))
+
+    def flush(self) -> None:
+        """Write buffered rows as blocks to the segment files and fsync them. Raises the first OSError after all
+        sources were processed, the rows which could not be written are kept for the next flush."""
+        with self._file_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            error: Optional[OSError] = None
+            for source, rows in pending.items():
+                try:
+                    failed_rows, write_error = self._write_rows(source, rows)
+                except OSError as ex:
+                    # raised before any file was written
+                    failed_rows, write_error = rows, ex
+                if failed_rows:
+                    self._keep_for_retry(source, failed_rows)
+                    error = error or write_error
+            self._enforce_size_cap()
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        self.flush()
+
+    def _schema_key(self, data_points: List[MeterDataPoint]) -> SchemaKey:
+        # schema keys are shared between bundles with the same layout
+        layout_id = tuple((dp.type.identifier, dp.obis.to_gurux_str()) for dp in data_points)
+        schema_key = self._schema_keys.get(layout_id)
+        if schema_key is None:
+            schema_key = tuple((dp.type.identifier, dp.type.name, dp.type.unit, str(dp.obis)) for dp in data_points)
+            if len(self._schema_keys) >= 64:
+                self._schema_keys.clear()
+            self._schema_keys[layout_id] = schema_key
+        return schema_key
+
+    def _keep_for_retry(self, source: str, rows: List[Row]) -> None:
+        with self._lock:
+            rows = rows + self._pending.get(source, [])
+            if len(rows) > self.MAX_PENDING_ROWS:
+                LOGGER.warning("Unable to write time series data of '%s'. Dropping %d oldest rows.",
+                               source, len(rows) - self.MAX_PENDING_ROWS)
+                rows = rows[-self.MAX_PENDING_ROWS:]
+            self._pending[source] = rows
+
+    def _write_rows(self, source: str, rows: List[Row]) -> Tuple[List[Row], Optional[OSError]]:
+        """Returns the rows of the segment files which could not be written and the last write error."""
+        source_dir = self._dir / source_directory_name(source)
+        segments = self._encode_rows(source_dir, rows)
+        source_dir.mkdir(exist_ok=True)
+        failed_rows: List[Row] = []
+        error: Optional[OSError] = None
+        for path, (data, segment_rows, schemas) in segments.items():
+            try:
+                with open(path, "ab") as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except OSError as ex:
+                # the file might end with a partially written record now, it is validated and truncated again
+                # before the next write
+                self._file_schemas.pop(path, None)
+                error = ex
+                failed_rows.extend(segment_rows)
+                continue
+            self._file_schemas[path] = schemas
+            with self._lock:
+                self._sizes[path] = self._sizes.get(path, 0) + len(data)
+        return failed_rows, error
+
+    def _encode_rows(self, source_dir: Path, rows: List[Row]) -> Dict[Path, SegmentAppend]:
+        """Encodes the rows as records per segment file. The schema ids of a segment file are only taken over
+        once the records were written successfully."""
+        segments: Dict[Path, SegmentAppend] = {}
+        start = 0
+        while start < len(rows):
+            partition = rows[start][0] // 1000 // self._partition_seconds
+            schema_key = rows[start][1]
+            end = start + 1
+            while end < len(rows) and rows[end][1] == schema_key and \
+                    rows[end][0] // 1000 // self._partition_seconds == partition:
+                end += 1
+            path = source_dir / (self._partition_name(partition) + SEGMENT_SUFFIX)
+            segment = segments.get(path)
+            if segment is None:
+                segment = segments[path] = (bytearray(), [], dict(self._schemas_of(path)))
+            data, segment_rows, schemas = segment
+            segment_rows.extend(rows[start:end])
+            schema_id = schemas.get(schema_key)
+            if schema_id is None:
+                schema_id = schemas[schema_key] = len(schemas)
+                data += self._encode_record(RECORD_SCHEMA, struct.pack("<H", schema_id) + json.dumps(
+                    [list(column) for column in schema_key]).encode("utf-8"))
+            data += self._encode_record(RECORD_BLOCK, self._encode_block(schema_id, rows[start:end]))
+            start = end
+        return segments
+
+    def _encode_block(self, schema_id: int, rows: List[Row]) -> bytes:
+        timestamps = [row[0] for row in rows]
+        columns = [encode_floats(list(column)) for column in zip(*(row[2] for row in rows))]
+        encoded_timestamps = encode_timestamps(timestamps)
+        body = struct.pack("<I", len(encoded_timestamps)) + encoded_timestamps + b"".join(columns)
+        header = BLOCK_HEADER.pack(schema_id, len(rows), timestamps[0], timestamps[-1])
+        return header + zlib.compress(body, self._compression_level)
+
+    @staticmethod
+    def _encode_record(kind: int, payload: bytes) -> bytes:
+        return RECORD_HEADER.pack(kind, zlib.crc32(payload), len(payload)) + payload
+
+    def _partition_name(self, partition: int) -> str:
+        return datetime.fromtimestamp(partition * self._partition_seconds, timezone.utc).strftime(
+            self._partition_format)
+
+    def _schemas_of(self, path: Path) -> Dict[SchemaKey, int]:
+        schemas = self._file_schemas.get(path)
+        if schemas is not None:
+            return schemas
+        schemas = {}
+        if path.exists():
+            # continue an existing file: reuse its schemas and cut off a partially written record
+            valid_size = 0
+            for kind, payload, end in read_records(path):
+                if kind == RECORD_SCHEMA:
+                    schemas[decode_schema_key(payload)] = struct.unpack_from("<H", payload)[0]
+                valid_size = end
+            if valid_size < path.stat().st_size:
+                LOGGER.warning("Truncating corrupt end of time series segment '%s'.", path)
+                os.truncate(path, valid_size)
+            with self._lock:
+                self._sizes[path] = valid_size
+        self._file_schemas[path] = schemas
+        return schemas
+
+    def _enforce_size_cap(self) -> None:
+        total = sum(self._sizes.values())
+        # oldest partitions first over all sources
+        for path in sorted(self._sizes, key=lambda p: (p.name, str(p))):
+            if total <= self._max_bytes:
+                break
+            LOGGER.warning("Time series store exceeds %d bytes. Deleting segment '%s'.", self._max_bytes, path)
+            with self._lock:
+                total -= self._sizes.pop(path)
+            self._file_schemas.pop(path, None)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def read_records(path: Path) -> Iterator[Tuple[int, bytes, int]]:
+    """Yields kind, payload and end offset of the valid records of a segment file."""
+    with open(path, "rb") as file:
+        data = file.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, crc, length = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        offset = start + length
+        yield kind, payload, offset
+
+
+def decode_schema_key(payload: bytes) -> SchemaKey:
+    return tuple(tuple(column) for column in json.loads(payload[2:].decode("utf-8")))
+
+
+class TimeSeriesReader:
+    """Range queries on the segment files written by TimeSeriesWriter. Timestamps are returned in UTC."""
+
+    def __init__(self, directory: str) -> None:
+        self._dir = Path(directory)
+
+    def sources(self) -> List[str]:
+        """Names of the sources with stored data (file system safe version of the source)."""
+        if not self._dir.is_dir():
+            return []
+        return sorted(path.name for path in self._dir.iterdir() if any(path.glob(f"*{SEGMENT_SUFFIX}")))
+
+    def query(self, source: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              identifiers: Optional[Iterable[str]] = None) -> Iterator[MeterDataBundle]:
+        """Yields the stored bundles of a source with start <= timestamp < end in the order they were written.
+        If identifiers are given only data points of these types are returned."""
+        start_ms = to_milliseconds(start) if start is not None else None
+        end_ms = to_milliseconds(end) if end is not None else None
+        selected = {identifier.upper() for identifier in identifiers} if identifiers is not None else None
+        for path in self._segments(source, start_ms, end_ms):
+            types: Dict[int, List[Tuple[int, MeterDataPointType, OBISCode]]] = {}
+            for kind, payload, _ in read_records(path):
+                if kind == RECORD_SCHEMA:
+                    types[struct.unpack_from("<H", payload)[0]] = [
+                        (index, MeterDataPointType(identifier, name, unit), OBISCode.from_string(obis))
+                        for index, (identifier, name, unit, obis) in enumerate(decode_schema_key(payload))
+                        if selected is None or identifier in selected]
+                elif kind == RECORD_BLOCK:
+                    schema_id, _, first_ms, last_ms = BLOCK_HEADER.unpack_from(payload)
+                    if (start_ms is not None and last_ms < start_ms) or (end_ms is not None and first_ms >= end_ms):
+                        continue
+                    yield from self._decode_block(source, payload, types.get(schema_id, []), start_ms, end_ms)
+
+    def _segments(self, source: str, start_ms: Optional[int], end_ms: Optional[int]) -> List[Path]:
+        segments = []
+        for path in sorted((self._dir / source_directory_name(source)).glob(f"*{SEGMENT_SUFFIX}")):
+            if len(path.stem) not in PARTITION_NAMES:
+                continue
+            partition_format, partition_seconds = PARTITION_NAMES[len(path.stem)]
+            try:
+                partition_start = datetime.strptime(path.stem, partition_format).replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            partition_start_ms = to_milliseconds(partition_start)
+            if end_ms is not None and partition_start_ms >= end_ms:
+                continue
+            if start_ms is not None and partition_start_ms + partition_seconds * 1000 <= start_ms:
+                continue
+            segments.append(path)
+        return segments
+
+    @staticmethod
+    def _decode_block(source: str, payload: bytes, columns: List[Tuple[int, MeterDataPointType, OBISCode]],
+                      start_ms: Optional[int], end_ms: Optional[int]) -> Iterator[MeterDataBundle]:
+        _, rows, first_ms, _ = BLOCK_HEADER.unpack_from(payload)
+        body = zlib.decompress(payload[BLOCK_HEADER.size:])
+        timestamps_end = 4 + struct.unpack_from("<I", body)[0]
+        timestamps = decode_timestamps(body[4:timestamps_end], first_ms, rows)
+        # the columns follow the timestamps and occupy rows * 8 bytes each
+        column_size = rows * 8
+        values = {index: decode_floats(body[timestamps_end + index * column_size:][:column_size], rows)
+                  for index, _, _ in columns}
+        for row, timestamp in enumerate(timestamps):
+            if (start_ms is not None and timestamp < start_ms) or (end_ms is not None and timestamp >= end_ms):
+                continue
+            data_points = [MeterDataPoint(data_point_type, values[index][row], obis)
+                           for index, data_point_type, obis in columns if not math.isnan(values[index][row])]
+            yield MeterDataBundle(source, datetime.fromtimestamp(timestamp / 1000, timezone.utc), data_points)
@@ -0,0 +1,73 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import logging
+from configparser import SectionProxy
+from dataclasses import dataclass
+from typing import Optional
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.sinks.timeseries import PARTITIONS, TimeSeriesWriter
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle
+
+LOGGER = logging.getLogger("sink")
+
+
+@dataclass
+class TimeSeriesConfig:
+    directory: str
+    partition: str = "day"
+    flush_interval: float = 300.0
+    max_bytes: int = 500_000_000
+
+    @staticmethod
+    def from_sink_config(config: SectionProxy) -> "TimeSeriesConfig":
+        directory = config.get("directory")
+        if not directory:
+            raise InvalidConfigError("Time series sink: 'directory' must be set")
+        partition = config.get("partition", TimeSeriesConfig.partition).strip().lower()
+        if partition not in PARTITIONS:
+            raise InvalidConfigError(f"'partition' is invalid: {partition}")
+        flush_interval = config.getfloat("flush_interval", TimeSeriesConfig.flush_interval)
+        if flush_interval <= 0:
+            raise InvalidConfigError(f"'flush_interval' must be greater than 0: {flush_interval}")
+        return TimeSeriesConfig(
+            directory.strip(), partition, flush_interval, config.getint("max_bytes", TimeSeriesConfig.max_bytes))
+
+
+class TimeSeriesSink(DataSink):
+    """Stores the bundles locally in columnar segment files (see TimeSeriesWriter). The buffered rows are
+    written every flush_interval seconds, the file operations run in an executor."""
+
+    def __init__(self, config: TimeSeriesConfig) -> None:
+        self._writer = TimeSeriesWriter(config.directory, config.partition, config.max_bytes)
+        self._flush_interval = config.flush_interval
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await asyncio.get_running_loop().run_in_executor(None, self._writer.close)
+
+    async def send(self, data_bundle: MeterDataBundle) -> None:
+        self._writer.append(data_bundle)
+
+    async def _flush_periodically(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await loop.run_in_executor(None, self._writer.flush)
+            except OSError as ex:
+                LOGGER.error("Unable to write time series data: '%s'", ex)
@@ -0,0 +1,190 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import struct
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+LLC_HEADERS = (b"\xe6\xe7\x00", b"\xe6\xe6\x00")
+GENERAL_BLOCK_TRANSFER = 0xE0
+DATA_NOTIFICATION = 0x0F
+# 12 byte date-time of COSEM (IEC 62056-6-2)
+DATE_TIME_LENGTH = 12
+
+
+class AxdrError(ValueError):
+    pass
+
+
+def decode_length(data: bytes, offset: int) -> Tuple[int, int]:
+    """Decode a variable length A-XDR length field. Returns length and offset after the field."""
+    try:
+        length = data[offset]
+        offset += 1
+        if length & 0x80:
+            size = length & 0x7F
+            if offset + size > len(data):
+                raise AxdrError("Truncated A-XDR length.")
+            length = int.from_bytes(data[offset:offset + size], "big")
+            offset += size
+    except IndexError as ex:
+        raise AxdrError("Truncated A-XDR length.") from ex
+    return length, offset
+
+
+def _fixed(fmt: str) -> Callable[[bytes, int], Tuple[Any, int]]:
+    unpack_from = struct.Struct(fmt).unpack_from
+    size = struct.calcsize(fmt)
+
+    def decode(data: bytes, offset: int) -> Tuple[Any, int]:
+        if offset + size > len(data):
+            raise AxdrError("Truncated A-XDR value.")
+        return unpack_from(data, offset)[0], offset + size
+    return decode
+
+
+def _null(_: bytes, offset: int) -> Tuple[Any, int]:
+    return None, offset
+
+
+def _boolean(data: bytes, offset: int) -> Tuple[Any, int]:
+    if offset >= len(data):
+        raise AxdrError("Truncated A-XDR value.")
+    return data[offset] != 0, offset + 1
+
+
+def _octet_string(data: bytes, offset: int) -> Tuple[Any, int]:
+    length, offset = decode_length(data, offset)
+    if offset + length > len(data):
+        raise AxdrError("Truncated A-XDR octet-string.")
+    return bytearray(data[offset:offset + length]), offset + length
+
+
+def _string(encoding: str) -> Callable[[bytes, int], Tuple[Any, int]]:
+    def decode(data: bytes, offset: int) -> Tuple[Any, int]:
+        value, offset = _octet_string(data, offset)
+        return value.decode(encoding, errors="replace"), offset
+    return decode
+
+
+def _sequence(data: bytes, offset: int) -> Tuple[Any, int]:
+    count, offset = decode_length(data, offset)
+    items = []
+    for _ in range(count):
+        item, offset = decode_data(data, offset)
+        items.append(item)
+    return items, offset
+
+
+# Only data types which gurux decodes to plain Python values are supported. Messages with other types
+# (e.g. bit-string, enum, bcd or date-time) are decoded with gurux.
+DECODERS: Dict[int, Callable[[bytes, int], Tuple[Any, int]]] = {
+    0x00: _null,
+    0x01: _sequence,                # array
+    0x02: _sequence,                # structure
+    0x03: _boolean,
+    0x05: _fixed(">i"),             # double-long
+    0x06: _fixed(">I"),             # double-long-unsigned
+    0x09: _octet_string,
+    0x0A: _string("ascii"),         # visible-string
+    0x0C: _string("utf-8"),
+    0x0F: _fixed(">b"),             # integer
+    0x10: _fixed(">h"),             # long
+    0x11: _fixed(">B"),             # unsigned
+    0x12: _fixed(">H"),             # long-unsigned
+    0x14: _fixed(">q"),             # long64
+    0x15: _fixed(">Q"),             # long64-unsigned
+    0x17: _fixed(">f"),             # float32
+    0x18: _fixed(">d"),             # float64
+}
+
+
+def decode_data(data: bytes, offset: int = 0) -> Tuple[Any, int]:
+    """Decode one A-XDR encoded value (type tag followed by its content). Returns value and next offset."""
+    if offset >= len(data):
+        raise AxdrError("Truncated A-XDR data.")
+    decoder = DECODERS.get(data[offset])
+    if decoder is None:
+        raise AxdrError(f"Unsupported A-XDR data type 0x{data[offset]:02x}.")
+    return decoder(data, offset + 1)
+
+
+@dataclass
+class DataNotification:
+    invoke_id: int
+    date_time: Optional[bytes]
+    body: Any
+
+
+def decode_data_notification(apdu: bytes) -> DataNotification:
+    if len(apdu) < 6 or apdu[0] != DATA_NOTIFICATION:
+        raise AxdrError("APDU is no unciphered data-notification.")
+    invoke_id = int.from_bytes(apdu[1:5], "big")
+    date_time = None
+    offset = 5
+    if apdu[offset] == 0x00:
+        offset += 1
+    else:
+        length, offset = decode_length(apdu, offset)
+        if length != DATE_TIME_LENGTH or offset + length > len(apdu):
+            raise AxdrError("Invalid date-time of data-notification.")
+        date_time = apdu[offset:offset + length]
+        offset += length
+    body, offset = decode_data(apdu, offset)
+    return DataNotification(invoke_id, date_time, body)
+
+
+class ApduAssembler:
+    """Assembles APDUs from the information fields of HDLC frames.
+
+    Segmented HDLC messages are concatenated, the LLC header is removed and general-block-transfer (GBT)
+    blocks are reassembled.
+    """
+
+    def __init__(self) -> None:
+        self._segments = bytearray()
+        self._blocks = bytearray()
+        self._next_block: Optional[int] = None
+
+    def reset(self) -> None:
+        self._segments.clear()
+        self._blocks.clear()
+        self._next_block = None
+
+    def feed(self, info: bytes, segmented: bool) -> Optional[bytes]:
+        """Add the information field of a frame. Returns the APDU if it is complete."""
+        self._segments += info
+        if segmented:
+            return None
+        data = bytes(self._segments)
+        self._segments.clear()
+        if data[:3] in LLC_HEADERS:
+            data = data[3:]
+        if not data or data[0] != GENERAL_BLOCK_TRANSFER:
+            return data
+        return self._add_block(data)
+
+    def _add_block(self, data: bytes) -> Optional[bytes]:
+        if len(data) < 6:
+            self.reset()
+            raise AxdrError("Truncated general-block-transfer header.")
+        last_block = bool(data[1] & 0x80)
+        block_number = int.from_bytes(data[2:4], "big")
+        length, offset = decode_length(data, 6)
+        if block_number == 1:
+            # first block of a new transfer, a previous incomplete transfer is dropped
+            self._blocks.clear()
+        elif block_number != self._next_block:
+            self.reset()
+            raise AxdrError(f"General-block-transfer block {block_number} out of order.")
+        self._blocks += data[offset:offset + length]
+        if not last_block:
+            self._next_block = block_number + 1
+            return None
+        apdu = bytes(self._blocks)
+        self.reset()
+        return apdu
@@ -9,14 +9,20 @@ import logging
 import uuid
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
 
 from gurux_dlms import GXDateTime
-from gurux_dlms.objects import GXDLMSClock, GXDLMSData, GXDLMSRegister
+from gurux_dlms.enums import ObjectType
+from gurux_dlms.objects import GXDLMSClock, GXDLMSData, GXDLMSExtendedRegister, GXDLMSRegister
 
-from smartmeter_datacollector.smartmeter.meter_data import MeterDataPointType, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataPoint, MeterDataPointType, MeterDataPointTypes
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
 LOGGER = logging.getLogger("smartmeter")
 
 
@@ -27,6 +33,47 @@ class RegisterCosem:
     scaling: float = 1.0
 
 
+@dataclass(frozen=True)
+class ConversionPlan:
+    """Precompiled conversion of the DLMS objects of a message with a specific layout.
+    Indices refer to the order of the objects in the message."""
+    # (index, OBIS code, data point type, scaling) of every known register
+    registers: Tuple[Tuple[int, OBISCode, MeterDataPointType, float], ...]
+    id_obis: Optional[OBISCode] = None
+    id_index: Optional[int] = None
+    clock_index: Optional[int] = None
+
+
+def scale_register_values(raw_values: Sequence[Sequence[Any]],
+                          scalings: Sequence[float]) -> List[List[Optional[float]]]:
+    """Convert the raw register values of N messages to scaled floats.
+    raw_values contains one row per message with one value per entry of scalings. Uses a single vectorized
+    NumPy operation if NumPy is installed and all values are numeric. Invalid values are converted to None."""
+    if numpy is not None and raw_values:
+        try:
+            matrix = numpy.array(raw_values, dtype=numpy.float64)
+        except (TypeError, ValueError, OverflowError):
+            pass
+        else:
+            if matrix.shape == (len(raw_values), len(scalings)):
+                scaled_values = (matrix * numpy.array(scalings, dtype=numpy.float64)).tolist()
+                # NumPy converts None to NaN
+                for row, column in numpy.argwhere(numpy.isnan(matrix)).tolist():
+                    if raw_values[row][column] is None:
+                        scaled_values[row][column] = None
+                return scaled_values
+    return [[_scale_value(raw_value, scaling) for raw_value, scaling in zip(row, scalings)] for row in raw_values]
+
+
+def _scale_value(raw_value: Any, scaling: float) -> Optional[float]:
+    if raw_value is None:
+        return None
+    try:
+        return float(raw_value) * scaling
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
 DEFAULT_REGISTER_MAP = [
     RegisterCosem(OBISCode(1, 0, 1, 7, 0), MeterDataPointTypes.ACTIVE_POWER_P.value),
     RegisterCosem(OBISCode(1, 0, 2, 7, 0), MeterDataPointTypes.ACTIVE_POWER_N.value),
@@ -107,6 +154,7 @@ DEFAULT_REGISTER_MAP = [
 class Cosem:
     CLOCK_DEFAULT_OBIS = OBISCode(0, 0, 1, 0, 0)
     OBJECT_DETECT_ATTEMPTS = 3
+    PLAN_CACHE_SIZE = 16
 
     def __init__(self,
                  fallback_id: str,
@@ -122,18 +170,65 @@ class Cosem:
         if register_obis_extended:
             self._register_obis.update({r.obis: r for r in register_obis_extended})
         self._id_detect_countdown = Cosem.OBJECT_DETECT_ATTEMPTS
+        self._plans: Dict[Hashable, ConversionPlan] = {}
+
+    def get_conversion_plan(self, dlms_objects: Dict[OBISCode, Any]) -> ConversionPlan:
+        """Return the conversion plan for the layout (OBIS codes and object types) of dlms_objects.
+        The plan is compiled once per layout."""
+        layout = tuple((obis, type(obj)) for obis, obj in dlms_objects.items())
+        plan = self._plans.get(layout)
+        if plan is None:
+            plan = self._compile_plan(dlms_objects)
+            if len(self._plans) >= self.PLAN_CACHE_SIZE:
+                self._plans.clear()
+            self._plans[layout] = plan
+        return plan
+
+    def _compile_plan(self, dlms_objects: Dict[OBISCode, Any]) -> ConversionPlan:
+        registers = []
+        clock_index = None
+        for index, (obis, obj) in enumerate(dlms_objects.items()):
+            if isinstance(obj, (GXDLMSRegister, GXDLMSExtendedRegister)) and \
+                    obj.getObjectType() in (ObjectType.REGISTER, ObjectType.EXTENDED_REGISTER):
+                reg_type = self.get_register(obis)
+                if reg_type:
+                    registers.append((index, obis, reg_type.data_point_type, reg_type.scaling))
+            elif obis == Cosem.CLOCK_DEFAULT_OBIS and isinstance(obj, GXDLMSClock):
+                clock_index = index
+        id_obis = self._find_obis_of_id(dlms_objects)
+        id_index = list(dlms_objects).index(id_obis) if id_obis else None
+        LOGGER.debug("Conversion plan with %d registers compiled.", len(registers))
+        return ConversionPlan(tuple(registers), id_obis, id_index, clock_index)
+
+    @staticmethod
+    def convert_register_batch(plan: ConversionPlan,
+                               raw_values: Sequence[Sequence[Any]]) -> List[List[MeterDataPoint]]:
+        """Convert the raw values of the registers of plan for N messages with the same layout.
+        Each row of raw_values contains the values in the order of plan.registers."""
+        scaled_values = scale_register_values(raw_values, [scaling for _, _, _, scaling in plan.registers])
+        return [
+            [MeterDataPoint(data_point_type, value, obis)
+             for (_, obis, data_point_type, _), value in zip(plan.registers, row) if value is not None]
+            for row in scaled_values]
 
     def retrieve_id(self, dlms_objects: Dict[OBISCode, Any]) -> str:
         if self._id:
             return self._id
 
         id_obis = self._find_obis_of_id(dlms_objects)
+        return self._read_id(id_obis, dlms_objects[id_obis] if id_obis else None)
+
+    def retrieve_id_with_plan(self, plan: ConversionPlan, objects: Sequence[Any]) -> str:
+        if self._id:
+            return self._id
+        return self._read_id(plan.id_obis, objects[plan.id_index] if plan.id_index is not None else None)
+
+    def _read_id(self, id_obis: Optional[OBISCode], id_obj: Any) -> str:
         if not id_obis:
             LOGGER.debug("Unable to find ID object. Using fallback ID %s.", self._fallback_id)
             self._trigger_id_detect_counter()
             return self._fallback_id
 
-        id_obj = dlms_objects[id_obis]
         if not isinstance(id_obj, (GXDLMSData, GXDLMSRegister)):
             LOGGER.debug("Invalid ID object for OBIS code %s. Using fallback ID %s.", id_obis, self._fallback_id)
             self._trigger_id_detect_counter()
@@ -150,9 +245,17 @@ class Cosem:
         return meter_id
 
     def retrieve_time_from_dlms_registers(self, dlms_objects: Dict[OBISCode, Any]) -> Optional[datetime]:
-        clock_obj = dlms_objects.get(Cosem.CLOCK_DEFAULT_OBIS, None)
+        return self._read_time(dlms_objects.get(Cosem.CLOCK_DEFAULT_OBIS, None))
+
+    def retrieve_time_with_plan(self, plan: ConversionPlan, objects: Sequence[Any]) -> Optional[datetime]:
+        if plan.clock_index is None:
+            return None
+        return self._read_time(objects[plan.clock_index])
+
+    @staticmethod
+    def _read_time(clock_obj: Any) -> Optional[datetime]:
         if clock_obj and isinstance(clock_obj, GXDLMSClock):
-            timestamp = self._extract_datetime(clock_obj)
+            timestamp = Cosem._extract_datetime(clock_obj)
             if timestamp:
                 # assume local time if tzinfo is None
                 return timestamp.astimezone(timestamp.tzinfo)
@@ -0,0 +1,196 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+LOGGER = logging.getLogger("smartmeter")
+
+HDLC_FLAG = 0x7E
+FRAME_FORMAT_TYPE = 0xA0
+SEGMENTATION_BIT = 0x08
+# CRC-16/X.25 residue of a frame including its (correct) FCS
+FCS_GOOD = 0xF0B8
+
+
+def _build_fcs_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+FCS_TABLE = _build_fcs_table()
+
+
+def fcs16(data: Union[bytes, bytearray, memoryview], fcs: int = 0xFFFF) -> int:
+    """Table driven CRC-16/X.25 as used for HCS and FCS of HDLC frames (IEC 62056-46)."""
+    table = FCS_TABLE
+    for byte in data:
+        fcs = (fcs >> 8) ^ table[(fcs ^ byte) & 0xFF]
+    return fcs
+
+
+def calculate_fcs(data: Union[bytes, bytearray, memoryview]) -> bytes:
+    """Return the check sequence of data in transmission order."""
+    return (fcs16(data) ^ 0xFFFF).to_bytes(2, "little")
+
+
+@dataclass
+class HdlcFrame:
+    raw: bytes
+    control: int
+    segmented: bool
+    info_offset: int
+    # set on the first frame after an incomplete message was dropped
+    restart: bool = False
+
+    @property
+    def info(self) -> bytes:
+        """Information field of the frame (without HCS and FCS)."""
+        return self.raw[self.info_offset:-3]
+
+    @property
+    def send_sequence(self) -> Optional[int]:
+        """N(S) of I-frames, None for all other frame types."""
+        if self.control & 0x01:
+            return None
+        return (self.control >> 1) & 0x07
+
+
+class HdlcDeframer:
+    """Incremental HDLC frame decoder.
+
+    Bytes from the serial stream are appended with feed() which returns all complete frames with a valid
+    header (HCS) and frame check sequence (FCS). Frame boundaries are detected with the length field of the
+    frame format, corrupt frames are skipped without discarding the following data. Segments of a segmented
+    message after a rejected or missing frame are dropped until the message ends.
+    """
+    MAX_BUFFER_SIZE = 5000
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._rejected = 0
+        self._in_message = False
+        self._skip_segments = False
+        self._restart = False
+        self._last_sequence: Optional[int] = None
+
+    @property
+    def rejected(self) -> int:
+        """Number of frames rejected because of an invalid check sequence or missing segment."""
+        return self._rejected
+
+    def reset(self) -> None:
+        self._buffer.clear()
+        self._in_message = False
+        self._skip_segments = False
+        self._restart = False
+        self._last_sequence = None
+
+    def feed(self, data: Union[bytes, bytearray]) -> List[HdlcFrame]:
+        buffer = self._buffer
+        buffer += data
+        frames: List[HdlcFrame] = []
+        while True:
+            start = buffer.find(HDLC_FLAG)
+            if start < 0:
+                buffer.clear()
+                break
+            # skip garbage and repeated flags between frames
+            while start + 1 < len(buffer) and buffer[start + 1] == HDLC_FLAG:
+                start += 1
+            if start > 0:
+                del buffer[:start]
+            if len(buffer) < 3:
+                break
+            if buffer[1] & 0xF0 != FRAME_FORMAT_TYPE:
+                del buffer[0]
+                continue
+            # 11 bit frame length without flags
+            end = (((buffer[1] & 0x07) << 8) | buffer[2]) + 1
+            if len(buffer) <= end:
+                if len(buffer) > self.MAX_BUFFER_SIZE:
+                    del buffer[0]
+                    continue
+                break
+            if buffer[end] != HDLC_FLAG:
+                LOGGER.debug("HDLC frame length does not match. Resynchronizing.")
+                del buffer[0]
+                continue
+
+            frame = self._decode(memoryview(buffer)[:end + 1])
+            if frame is None:
+                # drop the frame but keep its closing flag as opening flag of the next frame
+                del buffer[:end]
+                continue
+            del buffer[:end]
+            if self._accept(frame):
+                frames.append(frame)
+        return frames
+
+    def _decode(self, raw: memoryview) -> Optional[HdlcFrame]:
+        try:
+            content = raw[1:-1]
+            if fcs16(content) != FCS_GOOD:
+                self._reject("invalid FCS")
+                return None
+            # destination and source address: variable length, last byte has LSB set
+            index = 2
+            for _ in range(2):
+                while index < len(content) - 2 and not content[index] & 0x01:
+                    index += 1
+                index += 1
+            control = content[index]
+            segmented = bool(content[0] & SEGMENTATION_BIT)
+            index += 1
+            if len(content) <= index + 2:
+                # frame without information field
+                return HdlcFrame(bytes(raw), control, segmented, len(raw) - 3)
+            if len(content) < index + 4 or fcs16(content[:index + 2]) != FCS_GOOD:
+                self._reject("invalid HCS")
+                return None
+            # information field starts after opening flag, header and HCS
+            return HdlcFrame(bytes(raw), control, segmented, index + 3)
+        finally:
+            raw.release()
+
+    def _accept(self, frame: HdlcFrame) -> bool:
+        sequence = frame.send_sequence
+        if sequence is not None:
+            if self._last_sequence is not None and sequence != (self._last_sequence + 1) % 8:
+                LOGGER.warning("HDLC frame sequence number %d out of order (expected %d).",
+                               sequence, (self._last_sequence + 1) % 8)
+                self._drop_message()
+            self._last_sequence = sequence
+
+        if self._skip_segments:
+            self._rejected += 1
+            # the last segment of the incomplete message is dropped as well
+            self._skip_segments = frame.segmented
+            LOGGER.debug("Dropped HDLC segment of incomplete message.")
+            return False
+        frame.restart = self._restart
+        self._restart = False
+        self._in_message = frame.segmented
+        return True
+
+    def _reject(self, reason: str) -> None:
+        self._rejected += 1
+        LOGGER.warning("Rejected HDLC frame: %s.", reason)
+        self._drop_message()
+
+    def _drop_message(self) -> None:
+        if self._in_message:
+            # the remaining segments of the current message are useless
+            self._skip_segments = True
+            self._in_message = False
+        self._restart = True
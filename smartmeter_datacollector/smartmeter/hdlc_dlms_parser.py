@@ -6,26 +6,60 @@
 # See LICENSES/README.md for more information.
 #
 import logging
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
 
 from gurux_dlms import GXByteBuffer, GXDateTime, GXDLMSClient, GXReplyData
-from gurux_dlms.enums import InterfaceType, ObjectType, Security
-from gurux_dlms.objects import (GXDLMSCaptureObject, GXDLMSClock, GXDLMSData, GXDLMSExtendedRegister, GXDLMSObject,
-                                GXDLMSPushSetup, GXDLMSRegister)
+from gurux_dlms.enums import DataType, InterfaceType, Security
+from gurux_dlms.objects import (GXDLMSCaptureObject, GXDLMSClock, GXDLMSExtendedRegister, GXDLMSObject, GXDLMSPushSetup,
+                                GXDLMSRegister)
 from gurux_dlms.secure import GXDLMSSecureClient
 
-from smartmeter_datacollector.smartmeter.cosem import Cosem
-from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint
+from smartmeter_datacollector.log_utils import lazy, trace
+from smartmeter_datacollector.smartmeter.axdr import ApduAssembler, AxdrError, decode_data_notification
+from smartmeter_datacollector.smartmeter.cosem import ConversionPlan, Cosem
+from smartmeter_datacollector.smartmeter.hdlc import HdlcDeframer, HdlcFrame
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointType
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 
 LOGGER = logging.getLogger("smartmeter")
 
+DECODERS = ("gurux", "axdr")
 
+# (value index, register object, OBIS code, data point type, scaling)
+AxdrRegister = Tuple[int, Union[GXDLMSRegister, GXDLMSExtendedRegister], OBISCode, MeterDataPointType, float]
+
+
+@dataclass
+class AxdrLayout:
+    """Positions of the registers and the clock in the values of a data-notification with a known push-object-list."""
+    registers: List[AxdrRegister]
+    clock: Optional[Tuple[int, GXDLMSClock]]
+
+
+@dataclass
+class PushListTemplate:
+    """Parsed push-object-list which is reused for all messages with the same push-object-list structure."""
+    push_objects: List[Tuple[GXDLMSObject, int]]
+    dlms_objects: List[GXDLMSObject]
+    obis_obj_pairs: Dict[OBISCode, GXDLMSObject]
+    # objects of obis_obj_pairs in the order of the conversion plan
+    objects: List[GXDLMSObject]
+    plan: Optional[ConversionPlan] = None
+    axdr_layout: Optional[AxdrLayout] = None
+
+
+# pylint: disable=too-many-instance-attributes
 class HdlcDlmsParser:
     HDLC_BUFFER_MAX_SIZE = 5000
+    PUSH_LIST_CACHE_SIZE = 8
+    PENDING_FRAMES_MAX_COUNT = 64
 
-    def __init__(self, cosem: Cosem, block_cipher_key: Optional[str] = None, use_system_time: bool = False) -> None:
+    def __init__(self, cosem: Cosem, block_cipher_key: Optional[str] = None, use_system_time: bool = False,
+                 decoder: str = "gurux") -> None:
+        if decoder not in DECODERS:
+            raise ValueError(f"Unknown DLMS decoder '{decoder}'.")
         if block_cipher_key:
             self._client = GXDLMSSecureClient(
                 useLogicalNameReferencing=True,
@@ -38,11 +72,21 @@ class HdlcDlmsParser:
                 interfaceType=InterfaceType.HDLC)
 
         self._hdlc_buffer = GXByteBuffer()
+        self._deframer = HdlcDeframer()
         self._dlms_data = GXReplyData()
         self._cosem = cosem
         self._use_system_time = use_system_time
+        self._push_list_templates: Dict[Hashable, PushListTemplate] = {}
+        self._current_template: Optional[PushListTemplate] = None
+        self._apdu_assembler: Optional[ApduAssembler] = None
+        self._pending_frames: List[HdlcFrame] = []
         if use_system_time:
             LOGGER.info("Use system UTC time instead of time in DLMS messages for this smart meter.")
+        if decoder == "axdr":
+            if block_cipher_key:
+                LOGGER.warning("A-XDR decoder does not support encrypted messages. Using gurux decoder.")
+            else:
+                self._apdu_assembler = ApduAssembler()
 
     def append_to_hdlc_buffer(self, data: bytes) -> None:
         if self._hdlc_buffer.getSize() > self.HDLC_BUFFER_MAX_SIZE:
@@ -55,6 +99,67 @@ class HdlcDlmsParser:
     def clear_hdlc_buffer(self) -> None:
         self._hdlc_buffer.clear()
 
+    def split_hdlc_frames(self, data: bytes) -> List[HdlcFrame]:
+        """
+        Append raw bytes from the serial stream and return all complete and valid HDLC frames.
+        Incomplete frames are kept until the next call, corrupt frames are skipped.
+        """
+        return self._deframer.feed(data)
+
+    def append_hdlc_frame(self, frame: HdlcFrame) -> None:
+        if frame.restart:
+            # frames of the partially received message got lost
+            self._hdlc_buffer.clear()
+            self._dlms_data.clear()
+        self.append_to_hdlc_buffer(frame.raw)
+
+    def feed(self, data: bytes) -> List[MeterDataBundle]:
+        """Parse raw bytes from the serial stream. Returns the data of all messages completed by data."""
+        data_bundles = []
+        for frame in self._deframer.feed(data):
+            data_bundle = self.feed_frame(frame)
+            if data_bundle is not None:
+                data_bundles.append(data_bundle)
+        return data_bundles
+
+    def feed_frame(self, frame: HdlcFrame) -> Optional[MeterDataBundle]:
+        """Parse a frame from split_hdlc_frames(). Returns the data of the message completed by the frame."""
+        if self._apdu_assembler is None:
+            return self._feed_frame_to_gurux(frame)
+
+        if frame.restart:
+            self._apdu_assembler.reset()
+            self._pending_frames.clear()
+        self._pending_frames.append(frame)
+        try:
+            apdu = self._apdu_assembler.feed(frame.info, frame.segmented)
+        except AxdrError as ex:
+            LOGGER.debug("Unable to assemble APDU: %s", ex)
+            apdu = b""
+        if apdu is None and len(self._pending_frames) < self.PENDING_FRAMES_MAX_COUNT:
+            return None
+
+        frames, self._pending_frames = self._pending_frames, []
+        if apdu:
+            data_bundle = self._decode_known_layout(apdu)
+            if data_bundle is not None:
+                return data_bundle
+        # unknown push-object-list or unsupported message: gurux parses the frames (and caches the layout)
+        data_bundle = None
+        for pending_frame in frames:
+            data_bundle = self._feed_frame_to_gurux(pending_frame) or data_bundle
+        return data_bundle
+
+    def _feed_frame_to_gurux(self, frame: HdlcFrame) -> Optional[MeterDataBundle]:
+        self.append_hdlc_frame(frame)
+        if not self.extract_data_from_hdlc_frames():
+            return None
+        message_time = self.extract_message_time()
+        dlms_objects = self.parse_to_dlms_objects()
+        if not dlms_objects:
+            return None
+        return self.convert_dlms_bundle_to_reader_data(dlms_objects, message_time)
+
     def extract_data_from_hdlc_frames(self) -> bool:
         """
         Try to extract data fragments from HDLC frame-buffer and store it into DLMS buffer.
@@ -63,7 +168,7 @@ class HdlcDlmsParser:
         """
         tmp = GXReplyData()
         try:
-            LOGGER.debug("HDLC Buffer: %s", GXByteBuffer.hex(self._hdlc_buffer))
+            trace(LOGGER, "HDLC Buffer: %s", lazy(GXByteBuffer.hex, self._hdlc_buffer))
             self._client.getData(self._hdlc_buffer, tmp, self._dlms_data)
         except (ValueError, TypeError) as ex:
             LOGGER.warning("Failed to extract data from HDLC frame: '%s' Some data got lost.", ex)
@@ -84,9 +189,13 @@ class HdlcDlmsParser:
         return True
 
     def extract_message_time(self) -> Optional[datetime]:
-        if not isinstance(self._dlms_data.time, GXDateTime):
+        return self._to_message_time(self._dlms_data.time)
+
+    @staticmethod
+    def _to_message_time(time: Any) -> Optional[datetime]:
+        if not isinstance(time, GXDateTime):
             return None
-        dt = self._dlms_data.time.value
+        dt = time.value
         if isinstance(dt, datetime):
             # assume local time if tzinfo is None
             return dt.astimezone(dt.tzinfo)
@@ -113,25 +222,38 @@ class HdlcDlmsParser:
 
     def convert_dlms_bundle_to_reader_data(self, dlms_objects: List[GXDLMSObject],
                                            message_time: Optional[datetime] = None) -> MeterDataBundle:
-        obis_obj_pairs: dict[OBISCode, GXDLMSObject] = {}
-        for obj in dlms_objects:
-            try:
-                obis = OBISCode.from_string(str(obj.logicalName))
-                if obis in obis_obj_pairs:
-                    LOGGER.debug("DLMS object with similar OBIS code '%s' skipped.", obis)
-                else:
-                    obis_obj_pairs[obis] = obj
-            except ValueError as ex:
-                LOGGER.warning("Skipping unparsable DLMS object. (Reason: %s)", ex)
+        template = self._current_template
+        if template is not None and dlms_objects is template.dlms_objects:
+            if template.plan is None:
+                template.plan = self._cosem.get_conversion_plan(template.obis_obj_pairs)
+                if self._apdu_assembler is not None:
+                    template.axdr_layout = self._create_axdr_layout(template, template.plan)
+            plan = template.plan
+            objects = template.objects
+        else:
+            obis_obj_pairs = self._map_obis_to_objects(dlms_objects)
+            plan = self._cosem.get_conversion_plan(obis_obj_pairs)
+            objects = list(obis_obj_pairs.values())
 
-        meter_id = self._cosem.retrieve_id(obis_obj_pairs)
+        meter_id = self._cosem.retrieve_id_with_plan(plan, objects)
+        timestamp = self._get_timestamp(plan, objects, message_time)
 
+        # Extract register data
+        data_points: List[MeterDataPoint] = []
+        for index, obis, data_point_type, scaling in plan.registers:
+            data_point = self._to_data_point(obis, objects[index].value, data_point_type, scaling)
+            if data_point is not None:
+                data_points.append(data_point)
+        return MeterDataBundle(meter_id, timestamp, data_points)
+
+    def _get_timestamp(self, plan: ConversionPlan, objects: List[GXDLMSObject],
+                       message_time: Optional[datetime]) -> datetime:
         timestamp = None
         if self._use_system_time:
             timestamp = datetime.now(timezone.utc)
 
         if not timestamp:
-            timestamp = self._cosem.retrieve_time_from_dlms_registers(obis_obj_pairs)
+            timestamp = self._cosem.retrieve_time_with_plan(plan, objects)
         if not timestamp:
             timestamp = message_time
         if not timestamp:
@@ -140,35 +262,147 @@ class HdlcDlmsParser:
             timestamp = datetime.now(timezone.utc)
 
         # convert to UTC format
-        timestamp = timestamp.astimezone(timezone.utc)
+        return timestamp.astimezone(timezone.utc)
 
-        # Extract register data
+    @staticmethod
+    def _to_data_point(obis: OBISCode, raw_value: Any, data_point_type: MeterDataPointType,
+                       scaling: float) -> Optional[MeterDataPoint]:
+        if raw_value is None:
+            LOGGER.warning("No value received for %s.", obis)
+            return None
+        try:
+            value = float(raw_value) * scaling
+        except (TypeError, ValueError, OverflowError):
+            LOGGER.warning("Invalid register value '%s'. Skipping register.", str(raw_value))
+            return None
+        return MeterDataPoint(data_point_type, value, obis)
+
+    @staticmethod
+    def _create_axdr_layout(template: PushListTemplate, plan: ConversionPlan) -> Optional[AxdrLayout]:
+        """Locate the values of registers and clock in the data-notification. Layouts which update other
+        attributes of these objects (e.g. the scaler) are not supported by the A-XDR decoder."""
+        positions: Dict[int, Tuple[int, int]] = {}
+        for index, (obj, attr_ind) in enumerate(template.push_objects[1:], start=1):
+            if id(obj) in positions:
+                return None
+            positions[id(obj)] = (index, attr_ind)
+
+        objects = template.objects
+        registers: List[AxdrRegister] = []
+        for obj_index, obis, data_point_type, scaling in plan.registers:
+            obj = objects[obj_index]
+            index, attr_ind = positions.get(id(obj), (0, 0))
+            if attr_ind != 2:
+                return None
+            registers.append((index, obj, obis, data_point_type, scaling))
+
+        clock = None
+        if plan.clock_index is not None:
+            clock_obj = objects[plan.clock_index]
+            index, attr_ind = positions.get(id(clock_obj), (0, 0))
+            if attr_ind != 2:
+                return None
+            clock = (index, clock_obj)
+        LOGGER.debug("A-XDR layout with %d registers created.", len(registers))
+        return AxdrLayout(registers, clock)
+
+    def _decode_known_layout(self, apdu: bytes) -> Optional[MeterDataBundle]:
+        """Decode a data-notification directly from A-XDR if its push-object-list is known.
+        Returns None if the message has to be parsed by gurux."""
+        try:
+            notification = decode_data_notification(apdu)
+        except AxdrError as ex:
+            LOGGER.debug("A-XDR decoder not applicable: %s", ex)
+            return None
+        values = notification.body
+        if not isinstance(values, list) or not values or not isinstance(values[0], list):
+            return None
+        fingerprint = self._fingerprint_push_list(values[0])
+        template = self._push_list_templates.get(fingerprint) if fingerprint is not None else None
+        if template is None or template.axdr_layout is None or len(values) < len(template.push_objects):
+            return None
+        layout = template.axdr_layout
+
+        if layout.clock is not None:
+            index, clock_obj = layout.clock
+            self._client.updateValue(clock_obj, 2, values[index])
+        message_time = None
+        if notification.date_time is not None:
+            message_time = self._to_message_time(
+                GXDLMSClient.changeType(bytearray(notification.date_time), DataType.DATETIME))
+
+        meter_id = self._cosem.retrieve_id_with_plan(template.plan, template.objects)
+        timestamp = self._get_timestamp(template.plan, template.objects, message_time)
+        return MeterDataBundle(meter_id, timestamp, self._decode_registers(layout, values))
+
+    def _decode_registers(self, layout: AxdrLayout, values: List[Any]) -> List[MeterDataPoint]:
         data_points: List[MeterDataPoint] = []
-        for obis, obj in filter(lambda o: o[1].getObjectType() in (ObjectType.REGISTER, ObjectType.EXTENDED_REGISTER),
-                                obis_obj_pairs.items()):
-            reg_type = self._cosem.get_register(obis)
-            if reg_type and (isinstance(obj, GXDLMSRegister) or isinstance(obj, GXDLMSExtendedRegister)):
-                raw_value = self._extract_register_value(obj)
-                if raw_value is None:
-                    LOGGER.warning("No value received for %s.", obis)
-                    continue
-                data_point_type = reg_type.data_point_type
+        for index, obj, obis, data_point_type, scaling in layout.registers:
+            raw_value = values[index]
+            if obj.scaler != 1 and raw_value is not None:
+                # same as GXDLMSRegister.setValue()
                 try:
-                    value = float(raw_value) * reg_type.scaling
-                except (TypeError, ValueError, OverflowError):
-                    LOGGER.warning("Invalid register value '%s'. Skipping register.", str(raw_value))
-                    continue
-                data_points.append(MeterDataPoint(data_point_type, value, obis))
-        return MeterDataBundle(meter_id, timestamp, data_points)
+                    raw_value = raw_value * obj.scaler
+                except TypeError:
+                    pass
+            data_point = self._to_data_point(obis, raw_value, data_point_type, scaling)
+            if data_point is not None:
+                data_points.append(data_point)
+        return data_points
+
+    @staticmethod
+    def _map_obis_to_objects(dlms_objects: List[GXDLMSObject]) -> Dict[OBISCode, GXDLMSObject]:
+        obis_obj_pairs: Dict[OBISCode, GXDLMSObject] = {}
+        for obj in dlms_objects:
+            try:
+                obis = OBISCode.from_string(str(obj.logicalName))
+                if obis in obis_obj_pairs:
+                    LOGGER.debug("DLMS object with similar OBIS code '%s' skipped.", obis)
+                else:
+                    obis_obj_pairs[obis] = obj
+            except ValueError as ex:
+                LOGGER.warning("Skipping unparsable DLMS object. (Reason: %s)", ex)
+        return obis_obj_pairs
 
     def _parse_dlms_with_push_object_list(self) -> List[GXDLMSObject]:
-        parsed_objects: List[Tuple[GXDLMSObject, int]] = []
-        parsed_objects = self._client.parsePushObjects(self._dlms_data.value[0])
-        for index, (obj, attr_ind) in enumerate(parsed_objects[1:], start=1):
+        template = self._get_push_list_template(self._dlms_data.value[0])
+        self._current_template = template
+        debug_enabled = LOGGER.isEnabledFor(logging.DEBUG)
+        for index, (obj, attr_ind) in enumerate(template.push_objects[1:], start=1):
             self._client.updateValue(obj, attr_ind, self._dlms_data.value[index])
-            LOGGER.debug("%s %s %s: %s", obj.objectType, obj.logicalName, attr_ind, obj.getValues()[attr_ind - 1])
+            if debug_enabled:
+                LOGGER.debug("%s %s %s: %s", obj.objectType, obj.logicalName, attr_ind,
+                             self._get_attribute_value(obj, attr_ind))
+
+        return template.dlms_objects
+
+    def _get_push_list_template(self, push_list: List[Any]) -> PushListTemplate:
+        """Return the parsed push-object-list. The push-object-list is only parsed if its structure
+        (class IDs, logical names and attribute indices) has not been seen before."""
+        fingerprint = self._fingerprint_push_list(push_list)
+        template = self._push_list_templates.get(fingerprint) if fingerprint is not None else None
+        if template is not None:
+            return template
+
+        parsed_objects: List[Tuple[GXDLMSObject, int]] = self._client.parsePushObjects(push_list)
+        dlms_objects = [obj for obj, _ in parsed_objects]
+        obis_obj_pairs = self._map_obis_to_objects(dlms_objects)
+        template = PushListTemplate(parsed_objects, dlms_objects, obis_obj_pairs, list(obis_obj_pairs.values()))
+        if fingerprint is not None:
+            if len(self._push_list_templates) >= self.PUSH_LIST_CACHE_SIZE:
+                self._push_list_templates.pop(next(iter(self._push_list_templates)))
+            self._push_list_templates[fingerprint] = template
+            LOGGER.debug("New push-object-list with %d objects cached.", len(dlms_objects))
+        return template
 
-        return [obj for obj, _ in parsed_objects]
+    @staticmethod
+    def _fingerprint_push_list(push_list: List[Any]) -> Optional[Hashable]:
+        try:
+            return tuple(
+                tuple(bytes(item) if isinstance(item, (bytes, bytearray)) else item for item in entry)
+                for entry in push_list)
+        except TypeError:
+            return None
 
     def _parse_dlms_without_push_list(self) -> List[GXDLMSObject]:
         """Tries to extract OBIS codes and values from message.
@@ -191,19 +425,17 @@ class HdlcDlmsParser:
             else:
                 push_setup.pushObjectList.append((GXDLMSRegister(obis.to_gurux_str()), GXDLMSCaptureObject(2, 0)))
 
+        debug_enabled = LOGGER.isEnabledFor(logging.DEBUG)
         for index, (obj, attr_ind) in enumerate(push_setup.pushObjectList):
             self._client.updateValue(obj, attr_ind.attributeIndex, values[index])
-            LOGGER.debug("%d %s %s %s: %s", index, obj.objectType, obj.logicalName,
-                         attr_ind.attributeIndex, obj.getValues()[attr_ind.attributeIndex - 1])
+            if debug_enabled:
+                LOGGER.debug("%d %s %s %s: %s", index, obj.objectType, obj.logicalName,
+                             attr_ind.attributeIndex, self._get_attribute_value(obj, attr_ind.attributeIndex))
         return [obj for obj, _ in push_setup.pushObjectList]
 
     @staticmethod
-    def _extract_value_from_data_object(data_object: GXDLMSData) -> Optional[Any]:
-        return data_object.getValues()[1]
-
-    @staticmethod
-    def _extract_register_value(register: Union[GXDLMSRegister, GXDLMSExtendedRegister]) -> Optional[Any]:
-        return register.getValues()[1]
+    def _get_attribute_value(obj: GXDLMSObject, attribute_index: int) -> Any:
+        return obj.getValues()[attribute_index - 1]
 
     @staticmethod
     def extract_obis_and_values(data: List[Any]) -> Tuple[List[OBISCode], List[Any]]:
@@ -23,17 +23,24 @@ LOGGER = logging.getLogger("smartmeter")
 class IskraAM550(SerialHdlcDlmsMeter):
     BAUDRATE = 115200
 
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(self, port: str,
                  baudrate: int = BAUDRATE,
                  decryption_key: Optional[str] = None,
-                 use_system_time: bool = False) -> None:
+                 use_system_time: bool = False,
+                 bulk_read: bool = False,
+                 serial_backend: str = "aioserial",
+                 decoder: str = "gurux",
+                 worker_process: bool = False) -> None:
         serial_config = SerialConfig(
             port=port,
             baudrate=baudrate,
             data_bits=serial.EIGHTBITS,
             parity=serial.PARITY_NONE,
             stop_bits=serial.STOPBITS_ONE,
-            termination=SerialHdlcDlmsMeter.HDLC_FLAG
+            termination=SerialHdlcDlmsMeter.HDLC_FLAG,
+            bulk_read=bulk_read,
+            backend=serial_backend
         )
         voltage_registers = [
             RegisterCosem(OBISCode(1, 0, 32, 7, 0), MeterDataPointTypes.VOLTAGE_L1.value, 0.1),
@@ -42,7 +49,7 @@ class IskraAM550(SerialHdlcDlmsMeter):
         ]
         cosem = Cosem(fallback_id=port, register_obis_extended=voltage_registers)
         try:
-            super().__init__(serial_config, cosem, decryption_key, use_system_time)
+            super().__init__(serial_config, cosem, decryption_key, use_system_time, decoder, worker_process)
         except ReaderError as ex:
             LOGGER.fatal("Unable to setup serial reader for Iskra AM550. '%s'", ex)
             raise MeterError("Failed setting up Iskra AM550.") from ex
@@ -23,17 +23,24 @@ LOGGER = logging.getLogger("smartmeter")
 class LGE570(SerialHdlcDlmsMeter):
     BAUDRATE = 2400
 
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(self, port: str,
                  baudrate: int = BAUDRATE,
                  decryption_key: Optional[str] = None,
-                 use_system_time: bool = False) -> None:
+                 use_system_time: bool = False,
+                 bulk_read: bool = False,
+                 serial_backend: str = "aioserial",
+                 decoder: str = "gurux",
+                 worker_process: bool = False) -> None:
         serial_config = SerialConfig(
             port=port,
             baudrate=baudrate,
             data_bits=serial.EIGHTBITS,
             parity=serial.PARITY_EVEN,
             stop_bits=serial.STOPBITS_ONE,
-            termination=SerialHdlcDlmsMeter.HDLC_FLAG
+            termination=SerialHdlcDlmsMeter.HDLC_FLAG,
+            bulk_read=bulk_read,
+            backend=serial_backend
         )
         current_registers = [
             RegisterCosem(OBISCode(1, 0, 31, 7, 0), MeterDataPointTypes.CURRENT_L1.value, 1.0),
@@ -42,7 +49,7 @@ class LGE570(SerialHdlcDlmsMeter):
         ]
         cosem = Cosem(fallback_id=port, register_obis_extended=current_registers)
         try:
-            super().__init__(serial_config, cosem, decryption_key, use_system_time)
+            super().__init__(serial_config, cosem, decryption_key, use_system_time, decoder, worker_process)
         except ReaderError as ex:
             LOGGER.fatal("Unable to setup serial reader for L+G E570. '%s'", ex)
             raise MeterError("Failed setting up L+G E570.") from ex
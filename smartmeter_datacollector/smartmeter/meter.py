@@ -11,6 +11,7 @@ from typing import Optional
 from smartmeter_datacollector.smartmeter.cosem import Cosem
 from smartmeter_datacollector.smartmeter.hdlc_dlms_parser import HdlcDlmsParser
 from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle
+from smartmeter_datacollector.smartmeter.parser_process import ParserProcess
 from smartmeter_datacollector.smartmeter.serial_reader import SerialConfig, SerialReader
 
 
@@ -37,30 +38,39 @@ class Meter(ABC):
 class SerialHdlcDlmsMeter(Meter):
     HDLC_FLAG = b"\x7e"
 
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(self, serial_config: SerialConfig,
                  cosem: Cosem,
                  decryption_key: Optional[str] = None,
-                 use_system_time: bool = False) -> None:
+                 use_system_time: bool = False,
+                 decoder: str = "gurux",
+                 worker_process: bool = False) -> None:
         super().__init__()
-        self._parser = HdlcDlmsParser(cosem, decryption_key, use_system_time)
+        self._parser: Optional[HdlcDlmsParser] = None
+        self._parser_process: Optional[ParserProcess] = None
+        if worker_process:
+            self._parser_process = ParserProcess(
+                cosem, decryption_key, use_system_time, decoder, self._notify_observers)
+        else:
+            self._parser = HdlcDlmsParser(cosem, decryption_key, use_system_time, decoder)
         self._serial = SerialReader(serial_config, self._data_received)
 
     async def start(self) -> None:
-        await self._serial.start_and_listen()
+        if self._parser_process is None:
+            await self._serial.start_and_listen()
+            return
+        self._parser_process.start()
+        try:
+            await self._serial.start_and_listen()
+        finally:
+            await self._parser_process.stop()
 
     def _data_received(self, received_data: bytes) -> None:
         if not received_data:
             return
-        if received_data == SerialHdlcDlmsMeter.HDLC_FLAG:
-            self._parser.append_to_hdlc_buffer(received_data)
-            return
 
-        self._parser.append_to_hdlc_buffer(received_data)
-        if self._parser.extract_data_from_hdlc_frames():
-            message_time = self._parser.extract_message_time()
-            dlms_objects = self._parser.parse_to_dlms_objects()
-            if not dlms_objects:
-                return
-
-            data_bundle = self._parser.convert_dlms_bundle_to_reader_data(dlms_objects, message_time)
+        if self._parser_process is not None:
+            self._parser_process.feed(received_data)
+            return
+        for data_bundle in self._parser.feed(received_data):
             self._notify_observers(data_bundle)
@@ -7,19 +7,26 @@
 #
 import dataclasses
 import json
+from array import array
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from typing import ClassVar, Dict, Iterable, Iterator, List, Tuple
 
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 
 
-@dataclass
+@dataclass(slots=True)
 class MeterDataPointType:
     identifier: str
     name: str
     unit: str
 
+    @property
+    def is_energy(self) -> bool:
+        """True for cumulative energy registers (meter readings)."""
+        return "_ENERGY" in self.identifier
+
 
 class MeterDataPointTypes(Enum):
     ACTIVE_POWER_P = MeterDataPointType("ACTIVE_POWER_P", "Active Power +", "W")
@@ -98,7 +105,7 @@ class MeterDataPointTypes(Enum):
     NET_FREQUENCY = MeterDataPointType("NET_FREQUENCY", "Net Frequency any Phase", "Hz")
 
 
-@dataclass
+@dataclass(slots=True)
 class MeterDataPoint:
     type: MeterDataPointType
     value: float
@@ -113,7 +120,7 @@ class MeterDataPoint:
         return json.dumps(dict_repr)
 
 
-@dataclass
+@dataclass(slots=True)
 class MeterDataBundle:
     source: str
     timestamp: datetime
@@ -130,3 +137,68 @@ class MeterDataBundle:
             "data_points": [dp.to_json(short_obis) for dp in self.data_points]
         }
         return json.dumps(dict_repr)
+
+
+@dataclass(frozen=True)
+class MeterDataSchema:
+    """Types and OBIS codes of the data points of a meter. Schemas are interned and shared by all bundles
+    with the same layout."""
+    CACHE_SIZE: ClassVar[int] = 64
+    _schemas: ClassVar[Dict[Tuple, "MeterDataSchema"]] = {}
+
+    types: Tuple[MeterDataPointType, ...]
+    obis_codes: Tuple[OBISCode, ...]
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @classmethod
+    def of(cls, data_points: Iterable[MeterDataPoint]) -> "MeterDataSchema":
+        data_points = list(data_points)
+        key = tuple((dp.type.identifier, dp.obis.to_gurux_str()) for dp in data_points)
+        schema = cls._schemas.get(key)
+        if schema is None:
+            if len(cls._schemas) >= cls.CACHE_SIZE:
+                cls._schemas.clear()
+            schema = cls(tuple(dp.type for dp in data_points), tuple(dp.obis for dp in data_points))
+            cls._schemas[key] = schema
+        return schema
+
+
+class ColumnarMeterDataBundle(MeterDataBundle):
+    """Memory efficient MeterDataBundle which stores the values in an array and references a shared schema
+    instead of holding a MeterDataPoint per value. data_points creates the MeterDataPoint objects on access."""
+    __slots__ = ("schema", "values")
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, source: str, timestamp: datetime, schema: MeterDataSchema, values: Iterable[float]) -> None:
+        self.source = source
+        self.timestamp = timestamp
+        self.schema = schema
+        self.values = array("d", values)
+        if len(self.values) != len(schema):
+            raise ValueError("Number of values does not match the schema.")
+
+    @property
+    def data_points(self) -> List[MeterDataPoint]:  # pylint: disable=invalid-overridden-method
+        return list(self)
+
+    def __iter__(self) -> Iterator[MeterDataPoint]:
+        return map(MeterDataPoint, self.schema.types, self.values, self.schema.obis_codes)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __reduce__(self):
+        return self.__class__, (self.source, self.timestamp, self.schema, self.values)
+
+    @staticmethod
+    def from_bundle(data_bundle: MeterDataBundle) -> "ColumnarMeterDataBundle":
+        """Convert a bundle into a columnar bundle. Raises TypeError if a value is not a number."""
+        if isinstance(data_bundle, ColumnarMeterDataBundle):
+            return data_bundle
+        return ColumnarMeterDataBundle(
+            data_bundle.source,
+            data_bundle.timestamp,
+            MeterDataSchema.of(data_bundle.data_points),
+            (dp.value for dp in data_bundle.data_points))
@@ -7,16 +7,23 @@
 #
 import re
 from dataclasses import dataclass, field
-from typing import ClassVar, Union
+from typing import ClassVar, Dict, Hashable, Tuple, Union
 
 REGEX = r"^(\d{1,3})\W(\d{1,3})\W(\d{1,3})\W(\d{1,3})\W(\d{1,3})\W(\d{1,3})$"
 REGEX_SHORT = r"^(\d{1,3})\W(\d{1,3})\W(\d{1,3})$"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class OBISCode:
+    """OBIS code of a COSEM object. Instances created with from_string(), from_short_string() and from_bytes()
+    are interned: the same code always returns the same (canonical) instance."""
     PATTERN: ClassVar[re.Pattern] = re.compile(REGEX)
     PATTERN_SHORT: ClassVar[re.Pattern] = re.compile(REGEX_SHORT)
+    CACHE_SIZE: ClassVar[int] = 1024
+    _instances: ClassVar[Dict[Tuple[int, ...], "OBISCode"]] = {}
+    _string_cache: ClassVar[Dict[str, "OBISCode"]] = {}
+    _short_string_cache: ClassVar[Dict[str, "OBISCode"]] = {}
+    _bytes_cache: ClassVar[Dict[bytes, "OBISCode"]] = {}
 
     # pylint: disable=invalid-name
     a: int = field(compare=False)
@@ -26,6 +33,9 @@ class OBISCode:
     e: int
     f: int = field(default=255, compare=False)
 
+    def __reduce__(self):
+        return self.__class__, (self.a, self.b, self.c, self.d, self.e, self.f)
+
     def __str__(self) -> str:
         return f"{self.a}-{self.b}:{self.c}.{self.d}.{self.e}*{self.f}"
 
@@ -37,25 +47,52 @@ class OBISCode:
 
     @classmethod
     def from_string(cls, obis_string: str) -> 'OBISCode':
-        match = cls.PATTERN.match(obis_string)
-        if not match:
-            raise ValueError(f"Invalid OBIS string {obis_string}.")
-        groups = match.groups()
-        return cls(*(int(g) for g in groups))
+        obis = cls._string_cache.get(obis_string)
+        if obis is None:
+            match = cls.PATTERN.match(obis_string)
+            if not match:
+                raise ValueError(f"Invalid OBIS string {obis_string}.")
+            obis = cls._intern(*(int(g) for g in match.groups()))
+            cls._cache(cls._string_cache, obis_string, obis)
+        return obis
 
     @classmethod
     def from_short_string(cls, obis_short_string: str) -> 'OBISCode':
-        match = cls.PATTERN_SHORT.match(obis_short_string)
-        if not match:
-            raise ValueError(f"Invalid short OBIS string {obis_short_string}.")
-        groups = match.groups()
-        return cls(a=1, b=0, c=int(groups[0]), d=int(groups[1]), e=int(groups[2]))
+        obis = cls._short_string_cache.get(obis_short_string)
+        if obis is None:
+            match = cls.PATTERN_SHORT.match(obis_short_string)
+            if not match:
+                raise ValueError(f"Invalid short OBIS string {obis_short_string}.")
+            groups = match.groups()
+            obis = cls._intern(1, 0, int(groups[0]), int(groups[1]), int(groups[2]), 255)
+            cls._cache(cls._short_string_cache, obis_short_string, obis)
+        return obis
 
     @classmethod
     def from_bytes(cls, obis_bytes: Union[bytes, bytearray]) -> 'OBISCode':
-        if not cls.is_obis(obis_bytes):
-            raise ValueError("Invalid OBIS bytes.")
-        return cls(*obis_bytes)
+        key = bytes(obis_bytes)
+        obis = cls._bytes_cache.get(key)
+        if obis is None:
+            if not cls.is_obis(key):
+                raise ValueError("Invalid OBIS bytes.")
+            obis = cls._intern(*key)
+            cls._cache(cls._bytes_cache, key, obis)
+        return obis
+
+    @classmethod
+    def _intern(cls, *octets: int) -> 'OBISCode':
+        # a, b and f are not compared, therefore the canonical instance is looked up by all octets
+        obis = cls._instances.get(octets)
+        if obis is None:
+            obis = cls(*octets)
+            cls._cache(cls._instances, octets, obis)
+        return obis
+
+    @classmethod
+    def _cache(cls, cache: dict, key: Hashable, obis: 'OBISCode') -> None:
+        if len(cache) >= cls.CACHE_SIZE:
+            cache.clear()
+        cache[key] = obis
 
     @staticmethod
     def is_obis(data: Union[bytes, bytearray]) -> bool:
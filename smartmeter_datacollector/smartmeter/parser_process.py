@@ -0,0 +1,224 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import struct
+import time
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Callable, Optional
+
+from smartmeter_datacollector.smartmeter.cosem import Cosem
+from smartmeter_datacollector.smartmeter.hdlc_dlms_parser import HdlcDlmsParser
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle
+
+LOGGER = logging.getLogger("smartmeter")
+
+READ_SIZE = 65536
+# length of the pickled list of data bundles which follows
+FRAME_HEADER = struct.Struct("<I")
+
+
+def run_parser(data_connection: Connection,  # pylint: disable=too-many-arguments,too-many-positional-arguments
+               result_socket: socket.socket, cosem: Cosem, block_cipher_key: Optional[str], use_system_time: bool,
+               decoder: str, log_level: int) -> None:
+    """Entry point of the worker process. Parses the raw byte stream read from data_connection and sends the
+    decoded data bundles back over result_socket as length-prefixed pickled frames. The worker stops when the
+    data pipe is closed."""
+    logging.basicConfig(level=logging.WARNING)
+    LOGGER.setLevel(log_level)
+    parser = HdlcDlmsParser(cosem, block_cipher_key, use_system_time, decoder)
+    try:
+        while True:
+            data = os.read(data_connection.fileno(), READ_SIZE)
+            if not data:
+                break
+            data_bundles = parser.feed(data)
+            if data_bundles:
+                frame = pickle.dumps(data_bundles, pickle.HIGHEST_PROTOCOL)
+                result_socket.sendall(FRAME_HEADER.pack(len(frame)) + frame)
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        data_connection.close()
+        result_socket.close()
+
+
+# pylint: disable=too-many-instance-attributes
+class ParserProcess:
+    """Decodes the HDLC/DLMS data of one reader in a dedicated worker process.
+
+    Raw bytes from the serial port are written to the worker over a non-blocking pipe. If the worker does not
+    keep up, the bytes are buffered up to MAX_PENDING_BYTES and dropped beyond that, the event loop never
+    waits for the worker. Decoded data bundles are read from a non-blocking socket when it becomes readable,
+    partial frames are buffered until they are complete and the bundles are passed to the callback. A worker
+    which terminated unexpectedly is restarted after RESTART_DELAY seconds, data received in the meantime is
+    dropped. stop() waits for the worker in an executor.
+    """
+    STOP_TIMEOUT = 2.0
+    RESTART_DELAY = 5.0
+    MAX_PENDING_BYTES = 1_000_000
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, cosem: Cosem, block_cipher_key: Optional[str], use_system_time: bool, decoder: str,
+                 callback: Callable[[MeterDataBundle], None]) -> None:
+        self._parser_args = (cosem, block_cipher_key, use_system_time, decoder)
+        self._callback = callback
+        self._process: Optional[BaseProcess] = None
+        self._data_connection: Optional[Connection] = None
+        self._result_socket: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending = bytearray()
+        self._received = bytearray()
+        self._running = False
+        self._failed_at = 0.0
+        self._dropped_bytes = 0
+
+    @property
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def dropped_bytes(self) -> int:
+        """Number of received bytes which could not be passed to the worker."""
+        return self._dropped_bytes
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._running = True
+        self._start_worker()
+
+    def feed(self, data: bytes) -> None:
+        if self._data_connection is None:
+            if not self._running or time.monotonic() - self._failed_at < self.RESTART_DELAY:
+                self._dropped_bytes += len(data)
+                return
+            self._start_worker()
+        if self._pending:
+            self._buffer(data)
+            return
+        try:
+            written = os.write(self._data_connection.fileno(), data)
+        except BlockingIOError:
+            written = 0
+        except OSError as ex:
+            self._worker_failed(ex)
+            self._dropped_bytes += len(data)
+            return
+        if written < len(data):
+            self._buffer(data[written:])
+            assert self._loop is not None and self._data_connection is not None
+            self._loop.add_writer(self._data_connection.fileno(), self._write_pending)
+
+    async def stop(self) -> None:
+        self._running = False
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        self._close_connections()
+        assert self._loop is not None
+        await self._loop.run_in_executor(None, process.join, self.STOP_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+        LOGGER.debug("Parser process stopped.")
+
+    def _start_worker(self) -> None:
+        # spawn instead of fork, the event loop and its threads must not be copied into the worker
+        context = multiprocessing.get_context("spawn")
+        worker_data_connection, self._data_connection = context.Pipe(duplex=False)
+        self._result_socket, worker_result_socket = socket.socketpair()
+        self._process = context.Process(
+            target=run_parser,
+            args=(worker_data_connection, worker_result_socket, *self._parser_args,
+                  LOGGER.getEffectiveLevel()),
+            name="smartmeter-parser",
+            daemon=True)
+        self._process.start()
+        worker_data_connection.close()
+        worker_result_socket.close()
+        os.set_blocking(self._data_connection.fileno(), False)
+        self._result_socket.setblocking(False)
+        assert self._loop is not None
+        self._loop.add_reader(self._result_socket.fileno(), self._receive)
+        LOGGER.debug("Parser process %d started.", self._process.pid)
+
+    def _buffer(self, data: bytes) -> None:
+        if len(self._pending) + len(data) > self.MAX_PENDING_BYTES:
+            if not self._dropped_bytes:
+                LOGGER.warning("Parser process does not keep up. Received data is dropped.")
+            self._dropped_bytes += len(data)
+            return
+        self._pending += data
+
+    def _write_pending(self) -> None:
+        assert self._data_connection is not None
+        try:
+            written = os.write(self._data_connection.fileno(), self._pending)
+        except BlockingIOError:
+            return
+        except OSError as ex:
+            self._worker_failed(ex)
+            return
+        del self._pending[:written]
+        if not self._pending and self._loop is not None:
+            self._loop.remove_writer(self._data_connection.fileno())
+
+    def _receive(self) -> None:
+        if self._result_socket is None:
+            return
+        try:
+            data = self._result_socket.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as ex:
+            self._worker_failed(ex)
+            return
+        if not data:
+            self._worker_failed(EOFError("result socket closed"))
+            return
+        self._received += data
+        while len(self._received) >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(self._received)
+            end = FRAME_HEADER.size + length
+            if len(self._received) < end:
+                break
+            data_bundles = pickle.loads(self._received[FRAME_HEADER.size:end])
+            del self._received[:end]
+            for data_bundle in data_bundles:
+                self._callback(data_bundle)
+
+    def _worker_failed(self, ex: Exception) -> None:
+        LOGGER.error("Parser process terminated unexpectedly (%s). Restarting it in %.0f s.",
+                     type(ex).__name__, self.RESTART_DELAY)
+        self._failed_at = time.monotonic()
+        self._close_connections()
+        if self._process is not None:
+            self._process.kill()
+            # reap the killed worker without blocking the event loop
+            assert self._loop is not None
+            self._loop.run_in_executor(None, self._process.join, self.STOP_TIMEOUT)
+            self._process = None
+
+    def _close_connections(self) -> None:
+        """Closing the data pipe stops the worker."""
+        if self._data_connection is not None:
+            if self._loop is not None:
+                self._loop.remove_writer(self._data_connection.fileno())
+            self._data_connection.close()
+            self._data_connection = None
+        if self._result_socket is not None:
+            if self._loop is not None:
+                self._loop.remove_reader(self._result_socket.fileno())
+            self._result_socket.close()
+            self._result_socket = None
+        self._pending.clear()
+        self._received.clear()
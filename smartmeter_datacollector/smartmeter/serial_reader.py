@@ -5,14 +5,20 @@
 # SPDX-License-Identifier: GPL-2.0-only
 # See LICENSES/README.md for more information.
 #
+import asyncio
+import os
 from dataclasses import dataclass
-from typing import Callable
+from typing import Callable, Optional, Union
 
 import aioserial
+import serial
 
 from smartmeter_datacollector.smartmeter.reader import Reader, ReaderError
 
+SERIAL_BACKENDS = ("aioserial", "native")
 
+
+# pylint: disable=too-many-instance-attributes
 @dataclass
 class SerialConfig:
     port: str
@@ -21,6 +27,120 @@ class SerialConfig:
     parity: str = aioserial.PARITY_NONE
     stop_bits: int = aioserial.STOPBITS_ONE
     termination: bytes = aioserial.LF
+    # read all available bytes at once instead of reading until the termination
+    bulk_read: bool = False
+    # "aioserial" runs blocking reads in executor threads, "native" reads from the event loop
+    backend: str = "aioserial"
+
+
+class NativeSerialPort:
+    """Serial port which registers its file descriptor with the event loop (loop.add_reader) instead of
+    running blocking reads in executor threads. The port is configured (termios) and opened in non-blocking mode
+    by pyserial. Provides the subset of the aioserial.AioSerial interface used by the readers. POSIX only."""
+    READ_SIZE = 4096
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, port: str, baudrate: int, bytesize: int, parity: str, stopbits: float) -> None:
+        self._serial = serial.Serial(port=port, baudrate=baudrate, bytesize=bytesize, parity=parity,
+                                     stopbits=stopbits, timeout=0, write_timeout=0)
+        self._fd = self._serial.fileno()
+        self._buffer = bytearray()
+
+    @property
+    def baudrate(self) -> int:
+        return self._serial.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate: int) -> None:
+        self._serial.baudrate = baudrate
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._buffer) + self._serial.in_waiting
+
+    def read(self, size: int = 1) -> bytes:
+        """Read up to size bytes without blocking."""
+        if len(self._buffer) < size:
+            self._read_fd()
+        return self._take(min(size, len(self._buffer)))
+
+    async def read_async(self, size: int = 1) -> bytes:
+        while len(self._buffer) < size:
+            await self._wait_and_read()
+        return self._take(size)
+
+    async def read_until_async(self, expected: bytes = aioserial.LF, size: Optional[int] = None) -> bytes:
+        start = 0
+        while True:
+            index = self._buffer.find(expected, start)
+            if index >= 0:
+                return self._take(index + len(expected))
+            if size is not None and len(self._buffer) >= size:
+                return self._take(size)
+            start = max(0, len(self._buffer) - len(expected) + 1)
+            await self._wait_and_read()
+
+    async def readline_async(self, size: int = -1) -> bytes:
+        return await self.read_until_async(aioserial.LF, None if size < 0 else size)
+
+    async def write_async(self, data: bytes) -> int:
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(self._fd, view)
+                view = view[written:]
+            except BlockingIOError:
+                await self._wait_for_fd(loop.add_writer, loop.remove_writer)
+        return len(data)
+
+    def close(self) -> None:
+        self._serial.close()
+
+    async def _wait_and_read(self) -> None:
+        loop = asyncio.get_running_loop()
+        await self._wait_for_fd(loop.add_reader, loop.remove_reader)
+        self._read_fd()
+
+    async def _wait_for_fd(self, add: Callable, remove: Callable) -> None:
+        future = asyncio.get_running_loop().create_future()
+        add(self._fd, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            remove(self._fd)
+
+    def _read_fd(self) -> None:
+        try:
+            data = os.read(self._fd, self.READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as ex:
+            raise serial.SerialException(f"Reading from serial port failed: {ex}") from ex
+        if not data:
+            raise serial.SerialException("Serial port is closed.")
+        self._buffer += data
+
+    def _take(self, size: int) -> bytes:
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def open_serial_port(serial_config: SerialConfig) -> Union[aioserial.AioSerial, NativeSerialPort]:
+    if serial_config.backend not in SERIAL_BACKENDS:
+        raise ReaderError(f"Unknown serial backend '{serial_config.backend}'.")
+    port_class = NativeSerialPort if serial_config.backend == "native" else aioserial.AioSerial
+    try:
+        return port_class(
+            port=serial_config.port,
+            baudrate=serial_config.baudrate,
+            bytesize=serial_config.data_bits,
+            parity=serial_config.parity,
+            stopbits=serial_config.stop_bits
+        )
+    except (serial.SerialException, OSError) as ex:
+        raise ReaderError(ex) from ex
 
 
 # pylint: disable=too-few-public-methods
@@ -28,18 +148,21 @@ class SerialReader(Reader):
     def __init__(self, serial_config: SerialConfig, callback: Callable[[bytes], None]) -> None:
         super().__init__(callback)
         self._termination = serial_config.termination
-        try:
-            self._serial = aioserial.AioSerial(
-                port=serial_config.port,
-                baudrate=serial_config.baudrate,
-                bytesize=serial_config.data_bits,
-                parity=serial_config.parity,
-                stopbits=serial_config.stop_bits
-            )
-        except aioserial.SerialException as ex:
-            raise ReaderError(ex) from ex
+        self._bulk_read = serial_config.bulk_read
+        self._serial = open_serial_port(serial_config)
 
     async def start_and_listen(self) -> None:
         while True:
-            data: bytes = await self._serial.read_until_async(self._termination, None)
+            if self._bulk_read:
+                data = await self._read_available()
+            else:
+                data = await self._serial.read_until_async(self._termination, None)
             self._callback(data)
+
+    async def _read_available(self) -> bytes:
+        # wait for at least one byte, then fetch the other received bytes without blocking
+        data: bytes = await self._serial.read_async(1)
+        waiting = self._serial.in_waiting
+        if waiting:
+            data += self._serial.read(waiting)
+        return data
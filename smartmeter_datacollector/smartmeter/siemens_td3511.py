@@ -12,7 +12,6 @@ from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Callable, List
 
-import aioserial
 import serial
 
 from smartmeter_datacollector.smartmeter.meter import Meter, MeterError
@@ -20,7 +19,7 @@ from smartmeter_datacollector.smartmeter.meter_data import (MeterDataBundle, Met
                                                             MeterDataPointTypes)
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 from smartmeter_datacollector.smartmeter.reader import Reader, ReaderError
-from smartmeter_datacollector.smartmeter.serial_reader import SerialConfig
+from smartmeter_datacollector.smartmeter.serial_reader import SerialConfig, open_serial_port
 
 LOGGER = logging.getLogger("smartmeter")
 
@@ -28,9 +27,11 @@ LOGGER = logging.getLogger("smartmeter")
 class SiemensTD3511(Meter):
     BAUDRATE = 19200
 
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
     def __init__(self, port: str,
                  baudrate: int = BAUDRATE,
-                 use_system_time: bool = False) -> None:
+                 use_system_time: bool = False,
+                 serial_backend: str = "aioserial") -> None:
         super().__init__()
         serial_config = SerialConfig(
             port=port,
@@ -38,7 +39,8 @@ class SiemensTD3511(Meter):
             data_bits=serial.SEVENBITS,
             parity=serial.PARITY_EVEN,
             stop_bits=serial.STOPBITS_ONE,
-            termination=b"\r\n"
+            termination=b"\r\n",
+            backend=serial_backend
         )
         try:
             self._parser = SiemensParser(use_system_time)
@@ -78,16 +80,7 @@ class SiemensSerialReader(Reader):
         super().__init__(callback)
         self._termination = serial_config.termination
         self._baudrate = serial_config.baudrate
-        try:
-            self._serial = aioserial.AioSerial(
-                port=serial_config.port,
-                baudrate=serial_config.baudrate,
-                bytesize=serial_config.data_bits,
-                parity=serial_config.parity,
-                stopbits=serial_config.stop_bits
-            )
-        except aioserial.SerialException as ex:
-            raise ReaderError(ex) from ex
+        self._serial = open_serial_port(serial_config)
 
     async def start_and_listen(self) -> None:
         while True:
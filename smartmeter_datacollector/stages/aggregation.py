@@ -0,0 +1,193 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import logging
+import math
+import re
+import time
+from configparser import SectionProxy
+from dataclasses import dataclass
+from datetime import datetime, tzinfo
+from typing import Dict, List, Optional, Tuple
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointType
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+from smartmeter_datacollector.stages.stage import Stage
+
+LOGGER = logging.getLogger("collector")
+
+AGGREGATE_FUNCTIONS = ("mean", "min", "max", "last")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600}
+DURATION_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([smh]?)$")
+
+_derived_types: Dict[Tuple[str, str], MeterDataPointType] = {}
+
+
+def parse_duration(value: str) -> float:
+    """Parse a duration in seconds ("60", "60s"), minutes ("15m") or hours ("1h")."""
+    match = DURATION_PATTERN.match(value.strip().lower())
+    if not match:
+        raise InvalidConfigError(f"Duration is invalid: {value}")
+    return float(match.group(1)) * DURATION_UNITS.get(match.group(2), 1)
+
+
+def derived_type(data_point_type: MeterDataPointType, function: str) -> MeterDataPointType:
+    """Type of the aggregated values of a data point type, e.g. VOLTAGE_L1_MAX for the maximum voltage."""
+    key = (data_point_type.identifier, function)
+    derived = _derived_types.get(key)
+    if derived is None:
+        derived = MeterDataPointType(
+            f"{data_point_type.identifier}_{function.upper()}",
+            f"{data_point_type.name} ({function})",
+            data_point_type.unit)
+        _derived_types[key] = derived
+    return derived
+
+
+@dataclass
+class AggregationConfig:
+    # window length in seconds, windows are aligned to multiples of it
+    period: float
+    # emitted for non-energy registers, mean is emitted with the original type
+    functions: Tuple[str, ...] = ("mean", "min", "max")
+
+    @staticmethod
+    def from_sink_config(config: SectionProxy) -> Optional["AggregationConfig"]:
+        aggregate = config.get("aggregate")
+        if not aggregate:
+            return None
+        period = parse_duration(aggregate)
+        if period <= 0:
+            raise InvalidConfigError(f"'aggregate' must be greater than 0: {aggregate}")
+        functions = config.get("aggregate_functions")
+        if functions is None:
+            return AggregationConfig(period)
+        function_list = tuple(function.strip().lower() for function in functions.split(",") if function.strip())
+        for function in function_list:
+            if function not in AGGREGATE_FUNCTIONS:
+                raise InvalidConfigError(f"'aggregate_functions' is invalid: {function}")
+        if not function_list:
+            raise InvalidConfigError("'aggregate_functions' must not be empty.")
+        return AggregationConfig(period, function_list)
+
+
+class Accumulator:
+    """Streaming min/max/mean/last of the values of one register within a window."""
+    __slots__ = ("type", "count", "total", "minimum", "maximum", "first", "last")
+
+    def __init__(self, data_point_type: MeterDataPointType, value: float) -> None:
+        self.type = data_point_type
+        self.count = 1
+        self.total = value
+        self.minimum = value
+        self.maximum = value
+        self.first = value
+        self.last = value
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        self.last = value
+
+    def result(self, function: str) -> float:
+        if function == "mean":
+            return self.total / self.count
+        if function == "min":
+            return self.minimum
+        if function == "max":
+            return self.maximum
+        return self.last
+
+
+class SourceWindow:  # pylint: disable=too-few-public-methods
+    """Accumulators of all registers of one source in the current window."""
+    __slots__ = ("start", "timezone", "updated", "accumulators")
+
+    def __init__(self, start: float, timezone: Optional[tzinfo]) -> None:
+        self.start = start
+        self.timezone = timezone
+        # monotonic time of the last bundle added to the window
+        self.updated = time.monotonic()
+        self.accumulators: Dict[OBISCode, Accumulator] = {}
+
+
+class AggregationStage(Stage):  # pylint: disable=too-few-public-methods
+    """Downsamples the bundles of each source to one bundle per aligned time window.
+
+    Non-energy registers are reported with their mean (original type) and the configured additional functions
+    (derived types, e.g. VOLTAGE_L1_MIN). Energy registers are reported with their last reading (original type)
+    and the consumption within the window (derived type, e.g. ACTIVE_ENERGY_P_DELTA). A window is emitted with
+    the timestamp of its start as soon as the first bundle of a later window of the same source arrives, or by
+    flush() if the source did not deliver any bundle for a whole period. Sinks with aggregation receive the
+    bundles unfiltered by the deadband so that all values are aggregated.
+    """
+
+    def __init__(self, config: AggregationConfig) -> None:
+        self._period = config.period
+        self._functions = config.functions
+        self._windows: Dict[str, SourceWindow] = {}
+        # last energy reading per register of the previous window, basis for the delta
+        self._last_readings: Dict[Tuple[str, OBISCode], float] = {}
+
+    def process(self, data_bundle: MeterDataBundle) -> Optional[MeterDataBundle]:
+        start = math.floor(data_bundle.timestamp.timestamp() / self._period) * self._period
+        window = self._windows.get(data_bundle.source)
+        completed = None
+        if window is None or start != window.start:
+            if window is not None:
+                completed = self._emit(data_bundle.source, window)
+            window = self._windows[data_bundle.source] = SourceWindow(start, data_bundle.timestamp.tzinfo)
+        window.updated = time.monotonic()
+
+        accumulators = window.accumulators
+        for data_point in data_bundle.data_points:
+            value = data_point.value
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            accumulator = accumulators.get(data_point.obis)
+            if accumulator is None:
+                accumulators[data_point.obis] = Accumulator(data_point.type, value)
+            else:
+                accumulator.add(value)
+        return completed
+
+    def flush(self, final: bool = False) -> List[MeterDataBundle]:
+        """Emit the open windows of sources which are silent for a whole period, or all open windows if final."""
+        expired_before = time.monotonic() - self._period
+        data_bundles = []
+        for source, window in list(self._windows.items()):
+            if final or window.updated <= expired_before:
+                del self._windows[source]
+                data_bundle = self._emit(source, window)
+                if data_bundle is not None:
+                    data_bundles.append(data_bundle)
+        return data_bundles
+
+    def _emit(self, source: str, window: SourceWindow) -> Optional[MeterDataBundle]:
+        data_points: List[MeterDataPoint] = []
+        for obis, accumulator in window.accumulators.items():
+            if accumulator.type.is_energy:
+                key = (source, obis)
+                previous = self._last_readings.get(key, accumulator.first)
+                self._last_readings[key] = accumulator.last
+                data_points.append(MeterDataPoint(accumulator.type, accumulator.last, obis))
+                data_points.append(MeterDataPoint(
+                    derived_type(accumulator.type, "delta"), accumulator.last - previous, obis))
+                continue
+            for function in self._functions:
+                data_point_type = accumulator.type if function == "mean" else derived_type(accumulator.type, function)
+                data_points.append(MeterDataPoint(data_point_type, accumulator.result(function), obis))
+        if not data_points:
+            return None
+        LOGGER.debug("Aggregated window of '%s' with %d data points.", source, len(data_points))
+        timestamp = datetime.fromtimestamp(window.start, window.timezone)
+        return MeterDataBundle(source, timestamp, data_points)
@@ -0,0 +1,150 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import logging
+from configparser import ConfigParser
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.smartmeter.meter_data import (MeterDataBundle, MeterDataPoint, MeterDataPointType,
+                                                            MeterDataPointTypes)
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+from smartmeter_datacollector.stages.stage import Stage
+
+LOGGER = logging.getLogger("collector")
+
+
+@dataclass(frozen=True)
+class DeadbandRule:
+    absolute: float = 0.0
+    # fraction of the last reported value
+    relative: float = 0.0
+
+    @staticmethod
+    def parse(value: str) -> "DeadbandRule":
+        """Parse an absolute ("0.5") or relative ("1%") deadband."""
+        text = value.strip()
+        try:
+            if text.endswith("%"):
+                rule = DeadbandRule(relative=float(text[:-1]) / 100)
+            else:
+                rule = DeadbandRule(absolute=float(text))
+        except ValueError as ex:
+            raise InvalidConfigError(f"Deadband is invalid: {value}") from ex
+        if rule.absolute < 0 or rule.relative < 0:
+            raise InvalidConfigError(f"Deadband must not be negative: {value}")
+        return rule
+
+    def exceeded(self, last_value: float, value: float) -> bool:
+        delta = abs(value - last_value)
+        if self.relative:
+            return delta > self.relative * abs(last_value)
+        return delta > self.absolute
+
+
+@dataclass
+class DeadbandConfig:
+    # applied to all types without own rule, None: not filtered
+    default: Optional[DeadbandRule] = None
+    # applied to energy registers without own rule, None: not filtered
+    energy: Optional[DeadbandRule] = None
+    # rules per data point type identifier
+    rules: Dict[str, DeadbandRule] = field(default_factory=dict)
+    # maximum time in seconds without a report of a register, 0: disabled
+    heartbeat: float = 300.0
+
+    RESERVED_OPTIONS = ("default", "energy", "heartbeat")
+
+    @staticmethod
+    def from_config(config: ConfigParser) -> Optional["DeadbandConfig"]:
+        if not config.has_section("deadband"):
+            return None
+        deadband_config = config["deadband"]
+        heartbeat = deadband_config.getfloat("heartbeat", DeadbandConfig.heartbeat)
+        if heartbeat < 0:
+            raise InvalidConfigError(f"'heartbeat' must not be negative: {heartbeat}")
+        # raw: relative deadbands contain '%'
+        default = deadband_config.get("default", raw=True)
+        energy = deadband_config.get("energy", raw=True)
+
+        known_types = {t.value.identifier for t in MeterDataPointTypes}
+        rules = {}
+        for option, value in config.items("deadband", raw=True):
+            if option in DeadbandConfig.RESERVED_OPTIONS or option in config.defaults():
+                continue
+            identifier = option.upper()
+            if identifier not in known_types:
+                raise InvalidConfigError(f"Unknown data point type in deadband section: {option}")
+            rules[identifier] = DeadbandRule.parse(value)
+
+        return DeadbandConfig(
+            default=DeadbandRule.parse(default) if default else None,
+            energy=DeadbandRule.parse(energy) if energy else None,
+            rules=rules,
+            heartbeat=heartbeat)
+
+    def rule_for(self, data_point_type: MeterDataPointType) -> Optional[DeadbandRule]:
+        rule = self.rules.get(data_point_type.identifier)
+        if rule is not None:
+            return rule
+        if data_point_type.is_energy:
+            return self.energy
+        return self.default
+
+
+class DeadbandStage(Stage):
+    """Report-on-change filter. A data point is only passed on if its value left the deadband around the
+    last reported value of the same register or if the register was not reported for the heartbeat interval.
+    Bundles without remaining data points are dropped."""
+
+    def __init__(self, config: DeadbandConfig) -> None:
+        self._config = config
+        self._rules: Dict[str, Optional[DeadbandRule]] = {}
+        self._last_reported: Dict[Tuple[str, OBISCode], Tuple[float, datetime]] = {}
+        self._suppressed = 0
+
+    @property
+    def suppressed(self) -> int:
+        """Number of data points which were not passed on."""
+        return self._suppressed
+
+    def process(self, data_bundle: MeterDataBundle) -> Optional[MeterDataBundle]:
+        data_points = data_bundle.data_points
+        reported = [data_point for data_point in data_points if self._report(data_bundle, data_point)]
+        if len(reported) == len(data_points):
+            return data_bundle
+        self._suppressed += len(data_points) - len(reported)
+        if not reported:
+            LOGGER.debug("All data points of '%s' within deadband.", data_bundle.source)
+            return None
+        return MeterDataBundle(data_bundle.source, data_bundle.timestamp, reported)
+
+    def _report(self, data_bundle: MeterDataBundle, data_point: MeterDataPoint) -> bool:
+        identifier = data_point.type.identifier
+        if identifier in self._rules:
+            rule = self._rules[identifier]
+        else:
+            rule = self._rules[identifier] = self._config.rule_for(data_point.type)
+        value = data_point.value
+        if rule is None or not isinstance(value, (int, float)):
+            return True
+
+        key = (data_bundle.source, data_point.obis)
+        last = self._last_reported.get(key)
+        if last is not None and not rule.exceeded(last[0], value) and not self._heartbeat_due(last[1], data_bundle):
+            return False
+        self._last_reported[key] = (value, data_bundle.timestamp)
+        return True
+
+    def _heartbeat_due(self, last_timestamp: datetime, data_bundle: MeterDataBundle) -> bool:
+        if not self._config.heartbeat:
+            return False
+        elapsed = (data_bundle.timestamp - last_timestamp).total_seconds()
+        # a clock which jumped backwards triggers a report as well
+        return elapsed >= self._config.heartbeat or elapsed < 0
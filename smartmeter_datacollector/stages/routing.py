@@ -0,0 +1,98 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+from configparser import SectionProxy
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+from smartmeter_datacollector.stages.stage import Stage
+
+
+def _split_option(config: SectionProxy, option: str) -> List[str]:
+    value = config.get(option, "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _parse_obis(value: str) -> OBISCode:
+    try:
+        if OBISCode.PATTERN.match(value):
+            return OBISCode.from_string(value)
+        return OBISCode.from_short_string(value)
+    except ValueError as ex:
+        raise InvalidConfigError(f"OBIS code is invalid: {value}") from ex
+
+
+@dataclass(frozen=True)
+class RoutingConfig:
+    # empty include sets: everything is included
+    include_obis: FrozenSet[OBISCode] = frozenset()
+    exclude_obis: FrozenSet[OBISCode] = frozenset()
+    include_types: FrozenSet[str] = frozenset()
+    exclude_types: FrozenSet[str] = frozenset()
+    include_sources: FrozenSet[str] = frozenset()
+    exclude_sources: FrozenSet[str] = frozenset()
+
+    @staticmethod
+    def from_sink_config(config: SectionProxy) -> Optional["RoutingConfig"]:
+        known_types = {t.value.identifier for t in MeterDataPointTypes}
+
+        def types(option: str) -> FrozenSet[str]:
+            identifiers = frozenset(identifier.upper() for identifier in _split_option(config, option))
+            unknown = identifiers - known_types
+            if unknown:
+                raise InvalidConfigError(f"'{option}' contains unknown data point types: {', '.join(sorted(unknown))}")
+            return identifiers
+
+        routing_config = RoutingConfig(
+            include_obis=frozenset(_parse_obis(value) for value in _split_option(config, "include_obis")),
+            exclude_obis=frozenset(_parse_obis(value) for value in _split_option(config, "exclude_obis")),
+            include_types=types("include_types"),
+            exclude_types=types("exclude_types"),
+            include_sources=frozenset(_split_option(config, "include_sources")),
+            exclude_sources=frozenset(_split_option(config, "exclude_sources")))
+        if routing_config == RoutingConfig():
+            return None
+        return routing_config
+
+
+class RoutingStage(Stage):  # pylint: disable=too-few-public-methods
+    """Selects the sources and registers passed to a sink. A data point is passed on if its OBIS code and type
+    are included (all are included if no include filter is set) and not excluded. Bundles without remaining
+    data points are dropped."""
+
+    def __init__(self, config: RoutingConfig) -> None:
+        self._config = config
+        self._filter_points = bool(config.include_obis or config.exclude_obis
+                                   or config.include_types or config.exclude_types)
+
+    def process(self, data_bundle: MeterDataBundle) -> Optional[MeterDataBundle]:
+        config = self._config
+        source = data_bundle.source
+        if (config.include_sources and source not in config.include_sources) or source in config.exclude_sources:
+            return None
+        if not self._filter_points:
+            return data_bundle
+
+        data_points = data_bundle.data_points
+        select = self._select
+        selected = [data_point for data_point in data_points if select(data_point.obis, data_point.type.identifier)]
+        if len(selected) == len(data_points):
+            return data_bundle
+        if not selected:
+            return None
+        return MeterDataBundle(source, data_bundle.timestamp, selected)
+
+    def _select(self, obis: OBISCode, identifier: str) -> bool:
+        config = self._config
+        if config.include_obis and obis not in config.include_obis:
+            return False
+        if config.include_types and identifier not in config.include_types:
+            return False
+        return obis not in config.exclude_obis and identifier not in config.exclude_types
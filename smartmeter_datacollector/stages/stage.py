@@ -0,0 +1,25 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle
+
+
+class Stage(ABC):  # pylint: disable=too-few-public-methods
+    """Processing step between the meters and the sinks."""
+
+    @abstractmethod
+    def process(self, data_bundle: MeterDataBundle) -> Optional[MeterDataBundle]:
+        """Returns the (possibly modified) bundle or None if the bundle is dropped."""
+        raise NotImplementedError()
+
+    def flush(self, final: bool = False) -> List[MeterDataBundle]:  # pylint: disable=unused-argument
+        """Returns the bundles held back by the stage which are due. If final is set (e.g. on shutdown), all held
+        back bundles are returned."""
+        return []
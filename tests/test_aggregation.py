@@ -0,0 +1,204 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import configparser
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from smartmeter_datacollector.collector import Collector
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.factory import build_collector
+from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+from smartmeter_datacollector.stages.aggregation import (AggregationConfig, AggregationStage, derived_type,
+                                                         parse_duration)
+
+VOLTAGE = MeterDataPointTypes.VOLTAGE_L1.value
+ENERGY = MeterDataPointTypes.ACTIVE_ENERGY_P.value
+VOLTAGE_OBIS = OBISCode(1, 0, 32, 7, 0)
+ENERGY_OBIS = OBISCode(1, 0, 1, 8, 0)
+START = datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc)
+
+
+def bundle(seconds: float, voltage: float, energy: Optional[float] = None, source: str = "meter1") -> MeterDataBundle:
+    data_points = [MeterDataPoint(VOLTAGE, voltage, VOLTAGE_OBIS)]
+    if energy is not None:
+        data_points.append(MeterDataPoint(ENERGY, energy, ENERGY_OBIS))
+    return MeterDataBundle(source, START + timedelta(seconds=seconds), data_points)
+
+
+def aggregate(stage: AggregationStage, data_bundles: List[MeterDataBundle]) -> List[MeterDataBundle]:
+    processed = (stage.process(data_bundle) for data_bundle in data_bundles)
+    return [data_bundle for data_bundle in processed if data_bundle is not None]
+
+
+def values_by_type(data_bundle: MeterDataBundle) -> dict:
+    return {data_point.type.identifier: data_point.value for data_point in data_bundle.data_points}
+
+
+@pytest.mark.parametrize("text,expected", [("60", 60), ("60s", 60), (" 15m ", 900), ("1h", 3600), ("0.5s", 0.5)])
+def test_parse_duration(text: str, expected: float):
+    assert parse_duration(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "abc", "-1s", "10d"])
+def test_parse_invalid_duration(text: str):
+    with pytest.raises(InvalidConfigError):
+        parse_duration(text)
+
+
+def test_windows_are_aligned_and_emitted_on_next_window():
+    stage = AggregationStage(AggregationConfig(60))
+
+    windows = aggregate(stage, [bundle(10, 230.0), bundle(30, 232.0), bundle(50, 228.0), bundle(65, 240.0)])
+
+    assert len(windows) == 1
+    assert windows[0].source == "meter1"
+    assert windows[0].timestamp == START
+    assert values_by_type(windows[0]) == {"VOLTAGE_L1": 230.0, "VOLTAGE_L1_MIN": 228.0, "VOLTAGE_L1_MAX": 232.0}
+    assert windows[0].data_points[1].obis == VOLTAGE_OBIS
+
+
+def test_configured_functions():
+    stage = AggregationStage(AggregationConfig(60, ("last", "max")))
+
+    windows = aggregate(stage, [bundle(0, 230.0), bundle(1, 235.0), bundle(2, 231.0), bundle(60, 230.0)])
+
+    assert values_by_type(windows[0]) == {"VOLTAGE_L1_LAST": 231.0, "VOLTAGE_L1_MAX": 235.0}
+
+
+def test_energy_registers_report_reading_and_delta():
+    stage = AggregationStage(AggregationConfig(60))
+
+    windows = aggregate(stage, [
+        bundle(0, 230.0, 1000.0), bundle(30, 230.0, 1010.0),
+        bundle(60, 230.0, 1025.0), bundle(90, 230.0, 1030.0),
+        bundle(120, 230.0, 1030.0)])
+
+    assert [values_by_type(window)["ACTIVE_ENERGY_P"] for window in windows] == [1010.0, 1030.0]
+    # the second window includes the consumption between the last reading of the first window and its first reading
+    assert [values_by_type(window)["ACTIVE_ENERGY_P_DELTA"] for window in windows] == [10.0, 20.0]
+    assert "ACTIVE_ENERGY_P_MIN" not in values_by_type(windows[0])
+
+
+def test_sources_are_aggregated_independently():
+    stage = AggregationStage(AggregationConfig(60))
+
+    windows = aggregate(stage, [
+        bundle(0, 230.0, source="meter1"), bundle(0, 200.0, source="meter2"),
+        bundle(60, 231.0, source="meter1"), bundle(60, 201.0, source="meter2")])
+
+    assert [(window.source, values_by_type(window)["VOLTAGE_L1"]) for window in windows] == [
+        ("meter1", 230.0), ("meter2", 200.0)]
+
+
+def test_derived_types_are_shared():
+    assert derived_type(VOLTAGE, "max") is derived_type(VOLTAGE, "max")
+    assert derived_type(VOLTAGE, "max").unit == "V"
+
+
+def test_config_from_sink_section():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink0": {"type": "logger"},
+        "sink1": {"type": "logger", "aggregate": "15m", "aggregate_functions": "mean, last"},
+    })
+
+    assert AggregationConfig.from_sink_config(cfg_parser["sink0"]) is None
+    assert AggregationConfig.from_sink_config(cfg_parser["sink1"]) == AggregationConfig(900, ("mean", "last"))
+
+
+@pytest.mark.parametrize("options", [{"aggregate": "0"}, {"aggregate": "60", "aggregate_functions": "median"}])
+def test_invalid_config(options):
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({"sink0": options})
+
+    with pytest.raises(InvalidConfigError):
+        AggregationConfig.from_sink_config(cfg_parser["sink0"])
+
+
+@pytest.mark.asyncio
+async def test_aggregation_applies_only_to_its_sink(mocker: MockerFixture):
+    coll = Collector()
+    raw_sink = mocker.AsyncMock(DataSink)
+    aggregated_sink = mocker.AsyncMock(DataSink)
+    coll.register_sink(raw_sink)
+    coll.register_sink(aggregated_sink, stages=[AggregationStage(AggregationConfig(60))])
+
+    for data_bundle in [bundle(0, 230.0), bundle(30, 232.0), bundle(60, 234.0)]:
+        coll.notify(data_bundle)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+
+    assert raw_sink.send.await_count == 3
+    aggregated_sink.send.assert_awaited_once()
+    assert values_by_type(aggregated_sink.send.await_args.args[0])["VOLTAGE_L1"] == 231.0
+
+
+def test_silent_sources_are_flushed(mocker: MockerFixture):
+    monotonic = mocker.patch("smartmeter_datacollector.stages.aggregation.time.monotonic", return_value=1000.0)
+    stage = AggregationStage(AggregationConfig(60))
+    aggregate(stage, [bundle(0, 230.0), bundle(10, 232.0, source="meter2")])
+    monotonic.return_value = 1050.0
+    stage.process(bundle(20, 234.0, source="meter2"))
+
+    monotonic.return_value = 1060.0
+    flushed = stage.flush()
+    assert [(data_bundle.source, data_bundle.timestamp) for data_bundle in flushed] == [("meter1", START)]
+    assert values_by_type(flushed[0])["VOLTAGE_L1"] == 230.0
+
+    flushed = stage.flush(final=True)
+    assert [data_bundle.source for data_bundle in flushed] == ["meter2"]
+    assert values_by_type(flushed[0])["VOLTAGE_L1"] == 233.0
+    assert not stage.flush(final=True)
+
+
+@pytest.mark.asyncio
+async def test_collector_drains_open_windows(mocker: MockerFixture):
+    coll = Collector()
+    sink = mocker.AsyncMock(DataSink)
+    coll.register_sink(sink, stages=[AggregationStage(AggregationConfig(60))])
+
+    for data_bundle in [bundle(0, 230.0), bundle(30, 232.0)]:
+        coll.notify(data_bundle)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+    sink.send.assert_not_awaited()
+
+    await coll.drain()
+
+    sink.send.assert_awaited_once()
+    assert values_by_type(sink.send.await_args.args[0])["VOLTAGE_L1"] == 231.0
+
+
+@pytest.mark.asyncio
+async def test_aggregating_sink_is_not_affected_by_deadband(mocker: MockerFixture):
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "deadband": {"default": "1.0", "heartbeat": "0"},
+        "sink0": {"type": "logger"},
+        "sink1": {"type": "logger", "aggregate": "60", "aggregate_functions": "mean, min"},
+    })
+    raw_sink = mocker.AsyncMock(DataSink)
+    aggregated_sink = mocker.AsyncMock(DataSink)
+    coll = build_collector([], [raw_sink, aggregated_sink], cfg_parser)
+
+    for data_bundle in [bundle(0, 230.0), bundle(20, 230.5), bundle(40, 230.9), bundle(60, 234.0)]:
+        coll.notify(data_bundle)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+
+    # the deadband suppresses the small changes for the raw sink only
+    assert [values_by_type(call.args[0])["VOLTAGE_L1"] for call in raw_sink.send.await_args_list] == [230.0, 234.0]
+    aggregated_sink.send.assert_awaited_once()
+    assert values_by_type(aggregated_sink.send.await_args.args[0]) == pytest.approx(
+        {"VOLTAGE_L1": 230.466666, "VOLTAGE_L1_MIN": 230.0})
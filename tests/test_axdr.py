@@ -0,0 +1,130 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+from typing import List
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from smartmeter_datacollector.smartmeter.axdr import (ApduAssembler, AxdrError, decode_data, decode_data_notification,
+                                                      decode_length)
+from smartmeter_datacollector.smartmeter.cosem import Cosem
+from smartmeter_datacollector.smartmeter.hdlc_dlms_parser import HdlcDlmsParser
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle
+from tests.conftest import split_hex_data_to_frames
+from tests.testdata import iskra_am550, lg_e360, lg_e450
+
+
+def parse_all(parser: HdlcDlmsParser, data: str, repetitions: int = 2) -> List[MeterDataBundle]:
+    data_bundles = []
+    for _ in range(repetitions):
+        for chunk in split_hex_data_to_frames(data):
+            for frame in parser.split_hdlc_frames(chunk):
+                data_bundle = parser.feed_frame(frame)
+                if data_bundle is not None:
+                    data_bundles.append(data_bundle)
+    return data_bundles
+
+
+@pytest.mark.parametrize("data,expected", [
+    ("0f85", -123),
+    ("1000ff", 255),
+    ("11ff", 255),
+    ("12ffff", 65535),
+    ("05fffffffe", -2),
+    ("0600000102", 258),
+    ("15" + "00" * 7 + "2a", 42),
+    ("1740490fdb", pytest.approx(3.14159274)),
+    ("18400921fb54442d18", 3.141592653589793),
+    ("0903010203", bytearray(b"\x01\x02\x03")),
+    ("0a03616263", "abc"),
+    ("0301", True),
+    ("00", None),
+    ("020211011200ff", [1, 255]),
+])
+def test_decode_data(data: str, expected):
+    value, offset = decode_data(bytes.fromhex(data))
+
+    assert value == expected
+    assert offset == len(data) // 2
+
+
+def test_decode_long_length():
+    assert decode_length(bytes.fromhex("820102"), 0) == (258, 3)
+
+
+@pytest.mark.parametrize("data", ["", "12ff", "0905010203", "1601", "0d01"])
+def test_decode_invalid_or_unsupported_data(data: str):
+    with pytest.raises(AxdrError):
+        decode_data(bytes.fromhex(data))
+
+
+def test_decode_data_notification_without_date_time():
+    notification = decode_data_notification(bytes.fromhex("0f0000000100020211011200ff"))
+
+    assert notification.invoke_id == 1
+    assert notification.date_time is None
+    assert notification.body == [1, 255]
+
+
+def test_assembler_reassembles_general_block_transfer():
+    assembler = ApduAssembler()
+
+    assert assembler.feed(bytes.fromhex("e6e700e04000010000020102"), False) is None
+    assert assembler.feed(bytes.fromhex("e0c0000200000202"), True) is None
+    assert assembler.feed(bytes.fromhex("03"), False) == bytes.fromhex("01020203")
+
+
+def test_assembler_rejects_missing_block():
+    assembler = ApduAssembler()
+    assembler.feed(bytes.fromhex("e6e700e04000010000020102"), False)
+
+    with pytest.raises(AxdrError):
+        assembler.feed(bytes.fromhex("e0c00003000000"), False)
+    assert assembler.feed(bytes.fromhex("e6e7000f"), False) == b"\x0f"
+
+
+def test_assembler_restarts_on_first_block():
+    assembler = ApduAssembler()
+    assembler.feed(bytes.fromhex("e04000010000020102"), False)
+
+    assert assembler.feed(bytes.fromhex("e0c0000100000103"), False) == b"\x03"
+
+
+@pytest.mark.parametrize("data", [
+    lg_e450.UNENCRYPTED_VALID_DATA,
+    lg_e450.UNENCRYPTED_VALID_DATA1,
+    lg_e450.UNENCRYPTED_EXTENDED_REGISTER_DATA,
+    lg_e450.UNENCRYPTED_VALID_DATA_CFG2026,
+    lg_e360.UNENCRYPTED_VALID_DATA_CFG2026,
+    iskra_am550.UNENCRYPTED_VALID_DATA,
+])
+def test_axdr_decoder_equals_gurux_decoder(data: str, mocker: MockerFixture):
+    gurux_bundles = parse_all(HdlcDlmsParser(Cosem("fallback_id")), data)
+    parser = HdlcDlmsParser(Cosem("fallback_id"), decoder="axdr")
+    gurux_spy = mocker.spy(parser, "_feed_frame_to_gurux")
+
+    axdr_bundles = parse_all(parser, data, repetitions=1)
+    gurux_calls = gurux_spy.call_count
+    axdr_bundles += parse_all(parser, data, repetitions=1)
+
+    assert len(gurux_bundles) == 2
+    assert axdr_bundles == gurux_bundles
+    assert gurux_calls > 0
+    # the second message with the same push-object-list is not decoded by gurux
+    assert gurux_spy.call_count == gurux_calls
+
+
+def test_axdr_decoder_falls_back_to_gurux_for_encrypted_messages():
+    parser = HdlcDlmsParser(Cosem("fallback_id"), "101112131415161718191A1B1C1D1E1F", decoder="axdr")
+
+    assert parser._apdu_assembler is None
+
+
+def test_unknown_decoder():
+    with pytest.raises(ValueError):
+        HdlcDlmsParser(Cosem("fallback_id"), decoder="unknown")
@@ -6,14 +6,18 @@
 # See LICENSES/README.md for more information.
 #
 import asyncio
+import configparser
 from datetime import datetime, timezone
 
 import pytest
 from pytest_mock import MockerFixture
 
-from smartmeter_datacollector.collector import Collector
+from smartmeter_datacollector.collector import (Collector, CollectorConfig, OverflowPolicy, QueuePolicy,
+                                                SinkQueueConfig, SinkWorker)
+from smartmeter_datacollector.config import InvalidConfigError
 from smartmeter_datacollector.sinks.data_sink import DataSink
-from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointType
+from smartmeter_datacollector.smartmeter.meter_data import (ColumnarMeterDataBundle, MeterDataBundle, MeterDataPoint,
+                                                            MeterDataPointType)
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 
 
@@ -76,3 +80,237 @@ async def test_collector_with_two_sinks(mocker: MockerFixture, test_type: MeterD
 
     sink0.send.assert_awaited_once_with(data_bundle)
     sink1.send.assert_awaited_once_with(data_bundle)
+
+
+@pytest.mark.asyncio
+async def test_collector_slow_sink_does_not_stall_other_sinks(mocker: MockerFixture, test_type: MeterDataPointType):
+    coll = Collector()
+    slow_sink = mocker.AsyncMock(DataSink)
+
+    async def slow_send(_):
+        await asyncio.sleep(10)
+    slow_sink.send.side_effect = slow_send
+    fast_sink = mocker.AsyncMock(DataSink)
+
+    data_point = MeterDataPoint(test_type, 0.0, OBISCode(0, 1, 2, 3, 4, 5))
+    bundles = [MeterDataBundle(f"source{i}", datetime.now(timezone.utc), [data_point]) for i in range(3)]
+
+    coll.register_sink(slow_sink)
+    coll.register_sink(fast_sink)
+    for bundle in bundles:
+        coll.notify(bundle)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+
+    slow_sink.send.assert_awaited_once_with(bundles[0])
+    assert fast_sink.send.await_count == 3
+
+
+def _make_bundles(test_type: MeterDataPointType, count: int):
+    data_point = MeterDataPoint(test_type, 0.0, OBISCode(0, 1, 2, 3, 4, 5))
+    return [MeterDataBundle(f"source{i}", datetime.now(timezone.utc), [data_point]) for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_sink_worker_drop_oldest(mocker: MockerFixture, test_type: MeterDataPointType):
+    sink = mocker.AsyncMock(DataSink)
+    worker = SinkWorker(sink, SinkQueueConfig(2, QueuePolicy.DROP_OLDEST))
+    bundles = _make_bundles(test_type, 3)
+
+    for bundle in bundles:
+        await worker.put(bundle)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(worker.run(), 0.1)
+
+    assert worker.dropped == 1
+    assert [call.args[0] for call in sink.send.await_args_list] == bundles[1:]
+
+
+@pytest.mark.asyncio
+async def test_sink_worker_drop_newest(mocker: MockerFixture, test_type: MeterDataPointType):
+    sink = mocker.AsyncMock(DataSink)
+    worker = SinkWorker(sink, SinkQueueConfig(2, QueuePolicy.DROP_NEWEST))
+    bundles = _make_bundles(test_type, 3)
+
+    for bundle in bundles:
+        await worker.put(bundle)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(worker.run(), 0.1)
+
+    assert worker.dropped == 1
+    assert [call.args[0] for call in sink.send.await_args_list] == bundles[:2]
+
+
+@pytest.mark.asyncio
+async def test_sink_worker_continues_after_sink_error(mocker: MockerFixture, test_type: MeterDataPointType):
+    sink = mocker.AsyncMock(DataSink)
+    sink.send.side_effect = [RuntimeError("sink failure"), None]
+    worker = SinkWorker(sink, SinkQueueConfig())
+
+    for bundle in _make_bundles(test_type, 2):
+        await worker.put(bundle)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(worker.run(), 0.1)
+
+    assert sink.send.await_count == 2
+
+
+def test_sink_queue_config_from_sink_config():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink0": {'type': "logger"},
+        "sink1": {'type': "mqtt", 'queue_size': 5, 'queue_policy': "Block"},
+        "sink2": {'type': "mqtt", 'queue_policy': "invalid"},
+        "sink3": {'type': "mqtt", 'queue_size': 0},
+        "sink4": {'type': "mqtt", 'queue_policy': "block", 'queue_block_timeout': 0.5},
+        "sink5": {'type': "mqtt", 'queue_block_timeout': -1},
+    })
+
+    assert SinkQueueConfig.from_sink_config(cfg_parser["sink0"]) == SinkQueueConfig()
+    assert SinkQueueConfig.from_sink_config(cfg_parser["sink1"]) == SinkQueueConfig(5, QueuePolicy.BLOCK)
+    with pytest.raises(InvalidConfigError):
+        SinkQueueConfig.from_sink_config(cfg_parser["sink2"])
+    with pytest.raises(InvalidConfigError):
+        SinkQueueConfig.from_sink_config(cfg_parser["sink3"])
+    assert SinkQueueConfig.from_sink_config(cfg_parser["sink4"]) == SinkQueueConfig(100, QueuePolicy.BLOCK, 0.5)
+    with pytest.raises(InvalidConfigError):
+        SinkQueueConfig.from_sink_config(cfg_parser["sink5"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy,expected_sources,dropped,coalesced", [
+    (OverflowPolicy.DROP_OLDEST, ["b", "a"], 1, 0),
+    (OverflowPolicy.DROP_NEWEST, ["a", "b"], 1, 0),
+    (OverflowPolicy.COALESCE, ["a", "b"], 0, 1),
+])
+async def test_collector_queue_overflow(mocker: MockerFixture, test_type: MeterDataPointType,
+                                        policy: OverflowPolicy, expected_sources, dropped: int, coalesced: int):
+    coll = Collector(CollectorConfig(queue_size=2, overflow_policy=policy))
+    sink = mocker.AsyncMock(DataSink)
+    data_point = MeterDataPoint(test_type, 0.0, OBISCode(0, 1, 2, 3, 4, 5))
+    first = MeterDataBundle("a", datetime.now(timezone.utc), [data_point])
+    second = MeterDataBundle("b", datetime.now(timezone.utc), [data_point])
+    latest = MeterDataBundle("a", datetime.now(timezone.utc), [data_point, data_point])
+
+    coll.register_sink(sink)
+    coll.notify(first)
+    coll.notify(second)
+    coll.notify(latest)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+
+    assert [call.args[0].source for call in sink.send.await_args_list] == expected_sources
+    assert coll.dropped == dropped
+    assert coll.coalesced == coalesced
+    if policy != OverflowPolicy.DROP_NEWEST:
+        assert latest in [call.args[0] for call in sink.send.await_args_list]
+
+
+@pytest.mark.asyncio
+async def test_collector_compacts_bundles(mocker: MockerFixture, test_type: MeterDataPointType):
+    coll = Collector(CollectorConfig(compact_bundles=True))
+    sink = mocker.AsyncMock(DataSink)
+    data_point = MeterDataPoint(test_type, 1.0, OBISCode(0, 1, 2, 3, 4, 5))
+    data_bundle = MeterDataBundle("test_source", datetime.now(timezone.utc), [data_point])
+
+    coll.register_sink(sink)
+    coll.notify(data_bundle)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+
+    sent_bundle = sink.send.await_args.args[0]
+    assert isinstance(sent_bundle, ColumnarMeterDataBundle)
+    assert sent_bundle.data_points == [data_point]
+
+
+def test_collector_config_from_config():
+    cfg_parser = configparser.ConfigParser()
+    assert CollectorConfig.from_config(cfg_parser) == CollectorConfig()
+
+    cfg_parser.read_dict({"collector": {'queue_size': 10, 'overflow_policy': "coalesce"}})
+    assert CollectorConfig.from_config(cfg_parser) == CollectorConfig(10, OverflowPolicy.COALESCE)
+
+    cfg_parser.read_dict({"collector": {'compact_bundles': "true"}})
+    assert CollectorConfig.from_config(cfg_parser).compact_bundles
+
+    cfg_parser.read_dict({"collector": {'overflow_policy': "unknown"}})
+    with pytest.raises(InvalidConfigError):
+        CollectorConfig.from_config(cfg_parser)
+
+
+@pytest.mark.asyncio
+async def test_collector_full_blocking_sink_does_not_stall_other_sinks(mocker: MockerFixture,
+                                                                       test_type: MeterDataPointType):
+    coll = Collector()
+    slow_sink = mocker.AsyncMock(DataSink)
+
+    async def slow_send(_):
+        await asyncio.sleep(10)
+    slow_sink.send.side_effect = slow_send
+    fast_sink = mocker.AsyncMock(DataSink)
+    bundles = _make_bundles(test_type, 5)
+
+    coll.register_sink(slow_sink, SinkQueueConfig(1, QueuePolicy.BLOCK))
+    coll.register_sink(fast_sink)
+    for bundle in bundles:
+        coll.notify(bundle)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+
+    assert fast_sink.send.await_count == 5
+    slow_sink.send.assert_awaited_once_with(bundles[0])
+
+
+@pytest.mark.asyncio
+async def test_sink_worker_block_drops_after_timeout(mocker: MockerFixture, test_type: MeterDataPointType):
+    sink = mocker.AsyncMock(DataSink)
+    worker = SinkWorker(sink, SinkQueueConfig(1, QueuePolicy.BLOCK, block_timeout=0.05))
+    bundles = _make_bundles(test_type, 3)
+
+    for bundle in bundles:
+        await worker.put(bundle)
+    # one bundle queued, one waiting for space and one dropped as at most queue size bundles wait
+    assert worker.dropped == 1
+
+    await asyncio.sleep(0.1)
+    assert worker.dropped == 2
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(worker.run(), 0.1)
+    assert [call.args[0] for call in sink.send.await_args_list] == bundles[:1]
+
+
+@pytest.mark.asyncio
+async def test_sink_worker_block_waits_for_space(mocker: MockerFixture, test_type: MeterDataPointType):
+    sink = mocker.AsyncMock(DataSink)
+    worker = SinkWorker(sink, SinkQueueConfig(1, QueuePolicy.BLOCK))
+    bundles = _make_bundles(test_type, 2)
+
+    for bundle in bundles:
+        await worker.put(bundle)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(worker.run(), 0.1)
+
+    assert worker.dropped == 0
+    assert [call.args[0] for call in sink.send.await_args_list] == bundles
+
+
+@pytest.mark.asyncio
+async def test_sink_worker_drain_sends_waiting_bundles(mocker: MockerFixture, test_type: MeterDataPointType):
+    sink = mocker.AsyncMock(DataSink)
+    worker = SinkWorker(sink, SinkQueueConfig(1, QueuePolicy.BLOCK))
+    bundles = _make_bundles(test_type, 2)
+
+    for bundle in bundles:
+        await worker.put(bundle)
+    await worker.drain()
+
+    assert [call.args[0] for call in sink.send.await_args_list] == bundles
@@ -0,0 +1,130 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import math
+
+import pytest
+from gurux_dlms.objects import GXDLMSClock, GXDLMSData, GXDLMSRegister
+
+from smartmeter_datacollector.smartmeter import cosem as cosem_module
+from smartmeter_datacollector.smartmeter.cosem import Cosem, scale_register_values
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+ID_OBIS = OBISCode(0, 0, 96, 1, 0)
+POWER_OBIS = OBISCode(1, 0, 1, 7, 0)
+CURRENT_OBIS = OBISCode(1, 0, 31, 7, 0)
+UNKNOWN_OBIS = OBISCode(1, 0, 99, 7, 0)
+
+
+def create_objects():
+    meter_id = GXDLMSData(ID_OBIS.to_gurux_str())
+    meter_id.value = "12345678"
+    return {
+        Cosem.CLOCK_DEFAULT_OBIS: GXDLMSClock(),
+        ID_OBIS: meter_id,
+        POWER_OBIS: GXDLMSRegister(POWER_OBIS.to_gurux_str()),
+        UNKNOWN_OBIS: GXDLMSRegister(UNKNOWN_OBIS.to_gurux_str()),
+        CURRENT_OBIS: GXDLMSRegister(CURRENT_OBIS.to_gurux_str()),
+    }
+
+
+def test_conversion_plan():
+    cosem = Cosem("fallback_id")
+    objects = create_objects()
+
+    plan = cosem.get_conversion_plan(objects)
+
+    assert plan.registers == (
+        (2, POWER_OBIS, MeterDataPointTypes.ACTIVE_POWER_P.value, 1.0),
+        (4, CURRENT_OBIS, MeterDataPointTypes.CURRENT_L1.value, 0.01),
+    )
+    assert plan.clock_index == 0
+    assert plan.id_obis == ID_OBIS
+    assert plan.id_index == 1
+    assert cosem.retrieve_id_with_plan(plan, list(objects.values())) == "12345678"
+
+
+def test_conversion_plan_is_compiled_once_per_layout():
+    cosem = Cosem("fallback_id")
+
+    plan = cosem.get_conversion_plan(create_objects())
+
+    assert cosem.get_conversion_plan(create_objects()) is plan
+
+
+def test_conversion_plan_changes_with_layout():
+    cosem = Cosem("fallback_id")
+    plan = cosem.get_conversion_plan(create_objects())
+    objects = create_objects()
+    del objects[Cosem.CLOCK_DEFAULT_OBIS]
+    objects[Cosem.CLOCK_DEFAULT_OBIS] = GXDLMSClock()
+
+    changed_plan = cosem.get_conversion_plan(objects)
+
+    assert changed_plan is not plan
+    assert changed_plan.clock_index == 4
+    assert [index for index, *_ in changed_plan.registers] == [1, 3]
+
+
+def test_retrieve_id_with_plan_without_id_object():
+    cosem = Cosem("fallback_id")
+    objects = create_objects()
+    del objects[ID_OBIS]
+
+    plan = cosem.get_conversion_plan(objects)
+
+    assert plan.id_index is None
+    assert cosem.retrieve_id_with_plan(plan, list(objects.values())) == "fallback_id"
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_scale_register_values(use_numpy: bool, monkeypatch: pytest.MonkeyPatch):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(cosem_module, "numpy", None)
+    raw_values = [[1234, 56, 2**40], [0, -7, 3.5]]
+
+    scaled_values = scale_register_values(raw_values, [1.0, 0.01, 0.001])
+
+    assert scaled_values == [[float(raw) * scaling for raw, scaling in zip(row, [1.0, 0.01, 0.001])]
+                             for row in raw_values]
+    assert all(isinstance(value, float) for row in scaled_values for value in row)
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_scale_register_values_with_missing_values(use_numpy: bool, monkeypatch: pytest.MonkeyPatch):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(cosem_module, "numpy", None)
+
+    scaled_values = scale_register_values([[1, None, float("nan")], [None, 2, 3]], [1.0, 0.5, 1.0])
+
+    assert scaled_values[0][:2] == [1.0, None]
+    assert math.isnan(scaled_values[0][2])
+    assert scaled_values[1] == [None, 1.0, 3.0]
+
+
+def test_scale_register_values_with_invalid_values():
+    scaled_values = scale_register_values([[1, None], ["invalid", 2]], [1.0, 0.5])
+
+    assert scaled_values == [[1.0, None], [None, 1.0]]
+
+
+def test_convert_register_batch():
+    cosem = Cosem("fallback_id")
+    plan = cosem.get_conversion_plan(create_objects())
+
+    data_points = cosem.convert_register_batch(plan, [[1000, 500], [1001, None]])
+
+    assert data_points == [
+        [MeterDataPoint(MeterDataPointTypes.ACTIVE_POWER_P.value, 1000.0, POWER_OBIS),
+         MeterDataPoint(MeterDataPointTypes.CURRENT_L1.value, 5.0, CURRENT_OBIS)],
+        [MeterDataPoint(MeterDataPointTypes.ACTIVE_POWER_P.value, 1001.0, POWER_OBIS)],
+    ]
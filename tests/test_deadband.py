@@ -0,0 +1,157 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import configparser
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from smartmeter_datacollector.collector import Collector
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.sinks.data_sink import DataSink
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+from smartmeter_datacollector.stages.deadband import DeadbandConfig, DeadbandRule, DeadbandStage
+
+VOLTAGE = MeterDataPointTypes.VOLTAGE_L1.value
+ENERGY = MeterDataPointTypes.ACTIVE_ENERGY_P.value
+VOLTAGE_OBIS = OBISCode(1, 0, 32, 7, 0)
+ENERGY_OBIS = OBISCode(1, 0, 1, 8, 0)
+START = datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc)
+
+
+def voltage_bundles(values: List[float], source: str = "meter1") -> List[MeterDataBundle]:
+    return [MeterDataBundle(source, START + timedelta(seconds=index), [MeterDataPoint(VOLTAGE, value, VOLTAGE_OBIS)])
+            for index, value in enumerate(values)]
+
+
+def reported_values(stage: DeadbandStage, data_bundles: List[MeterDataBundle]) -> List[float]:
+    values = []
+    for data_bundle in data_bundles:
+        processed = stage.process(data_bundle)
+        if processed is not None:
+            values.extend(data_point.value for data_point in processed.data_points)
+    return values
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("0.5", DeadbandRule(absolute=0.5)),
+    (" 2% ", DeadbandRule(relative=0.02)),
+    ("0", DeadbandRule()),
+])
+def test_parse_rule(text: str, expected: DeadbandRule):
+    assert DeadbandRule.parse(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "abc", "-1", "-5%"])
+def test_parse_invalid_rule(text: str):
+    with pytest.raises(InvalidConfigError):
+        DeadbandRule.parse(text)
+
+
+def test_absolute_deadband():
+    stage = DeadbandStage(DeadbandConfig(default=DeadbandRule(absolute=1.0)))
+
+    values = reported_values(stage, voltage_bundles([230.0, 230.5, 231.0, 231.1, 229.9, 232.0]))
+
+    assert values == [230.0, 231.1, 229.9, 232.0]
+    assert stage.suppressed == 2
+
+
+def test_relative_deadband():
+    stage = DeadbandStage(DeadbandConfig(default=DeadbandRule(relative=0.01)))
+
+    values = reported_values(stage, voltage_bundles([200.0, 201.0, 202.5, 203.0, 205.0]))
+
+    assert values == [200.0, 202.5, 205.0]
+
+
+def test_heartbeat_reports_unchanged_value():
+    stage = DeadbandStage(DeadbandConfig(default=DeadbandRule(), heartbeat=2))
+
+    values = reported_values(stage, voltage_bundles([230.0] * 6))
+
+    assert values == [230.0, 230.0, 230.0]
+
+
+def test_registers_of_different_sources_are_independent():
+    stage = DeadbandStage(DeadbandConfig(default=DeadbandRule(absolute=1.0), heartbeat=0))
+
+    values = reported_values(stage, voltage_bundles([230.0], "meter1") + voltage_bundles([230.0], "meter2"))
+
+    assert values == [230.0, 230.0]
+
+
+def test_energy_registers_are_exempt_by_default():
+    stage = DeadbandStage(DeadbandConfig(default=DeadbandRule(absolute=1.0)))
+    data_points = [MeterDataPoint(VOLTAGE, 230.0, VOLTAGE_OBIS), MeterDataPoint(ENERGY, 1000.0, ENERGY_OBIS)]
+    stage.process(MeterDataBundle("meter1", START, data_points))
+
+    processed = stage.process(MeterDataBundle("meter1", START + timedelta(seconds=1), data_points))
+
+    assert processed is not None
+    assert [data_point.type for data_point in processed.data_points] == [ENERGY]
+
+
+def test_bundle_without_changes_is_dropped():
+    stage = DeadbandStage(DeadbandConfig(default=DeadbandRule(), energy=DeadbandRule()))
+    data_points = [MeterDataPoint(VOLTAGE, 230.0, VOLTAGE_OBIS), MeterDataPoint(ENERGY, 1000.0, ENERGY_OBIS)]
+
+    assert stage.process(MeterDataBundle("meter1", START, data_points)) is not None
+    assert stage.process(MeterDataBundle("meter1", START + timedelta(seconds=1), data_points)) is None
+
+
+def test_config_from_deadband_section():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_string("""
+        [deadband]
+        heartbeat = 60
+        default = 0
+        voltage_l1 = 0.5%
+        net_frequency = 0.05
+        """)
+
+    config = DeadbandConfig.from_config(cfg_parser)
+
+    assert config == DeadbandConfig(
+        default=DeadbandRule(),
+        rules={"VOLTAGE_L1": DeadbandRule(relative=0.005), "NET_FREQUENCY": DeadbandRule(absolute=0.05)},
+        heartbeat=60)
+    assert config.rule_for(VOLTAGE) == DeadbandRule(relative=0.005)
+    assert config.rule_for(ENERGY) is None
+    assert config.rule_for(MeterDataPointTypes.CURRENT_L1.value) == DeadbandRule()
+
+
+def test_config_without_deadband_section():
+    assert DeadbandConfig.from_config(configparser.ConfigParser()) is None
+
+
+@pytest.mark.parametrize("options", [{"unknown_type": "1"}, {"heartbeat": "-1"}])
+def test_invalid_config(options):
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({"deadband": options})
+
+    with pytest.raises(InvalidConfigError):
+        DeadbandConfig.from_config(cfg_parser)
+
+
+@pytest.mark.asyncio
+async def test_collector_applies_stages_before_sinks(mocker: MockerFixture):
+    coll = Collector()
+    sink = mocker.AsyncMock(DataSink)
+    coll.register_sink(sink)
+    coll.add_stage(DeadbandStage(DeadbandConfig(default=DeadbandRule(absolute=1.0))))
+
+    for data_bundle in voltage_bundles([230.0, 230.2, 232.0]):
+        coll.notify(data_bundle)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(coll.process_queue(), 0.1)
+
+    assert [call.args[0].data_points[0].value for call in sink.send.await_args_list] == [230.0, 232.0]
@@ -0,0 +1,74 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+from smartmeter_datacollector.smartmeter.hdlc import HdlcDeframer, calculate_fcs, fcs16
+from tests.conftest import split_hex_data_to_frames
+from tests.testdata.lg_e450 import UNENCRYPTED_VALID_DATA
+
+
+def build_frame(info: bytes, segmented: bool = False, control: int = 0x13) -> bytes:
+    length = 2 + 2 + 1 + 2 + len(info) + 2
+    header = bytes([0xA0 | (0x08 if segmented else 0) | (length >> 8), length & 0xFF, 0x03, 0x21, control])
+    header += calculate_fcs(header)
+    body = header + info
+    return b"\x7e" + body + calculate_fcs(body) + b"\x7e"
+
+
+def test_fcs16_check_value():
+    assert fcs16(b"123456789") ^ 0xFFFF == 0x906E
+
+
+def test_deframer_accepts_meter_frames():
+    frames = split_hex_data_to_frames(UNENCRYPTED_VALID_DATA)
+    deframer = HdlcDeframer()
+
+    decoded = deframer.feed(b"".join(frames))
+
+    assert [frame.raw for frame in decoded] == frames
+    assert decoded[0].info.startswith(b"\xe6\xe7\x00")
+    assert deframer.rejected == 0
+
+
+def test_deframer_rejects_corrupt_frame_only():
+    corrupt = bytearray(build_frame(b"\x01\x02\x03"))
+    corrupt[-4] ^= 0xFF
+    valid = build_frame(b"\x04\x05")
+    deframer = HdlcDeframer()
+
+    decoded = deframer.feed(bytes(corrupt) + valid)
+
+    assert [frame.info for frame in decoded] == [b"\x04\x05"]
+    assert deframer.rejected == 1
+
+
+def test_deframer_drops_incomplete_segmented_message():
+    segment1 = build_frame(b"\x01", segmented=True)
+    corrupt_segment2 = bytearray(build_frame(b"\x02", segmented=True))
+    corrupt_segment2[-4] ^= 0xFF
+    segment3 = build_frame(b"\x03")
+    next_message = build_frame(b"\x04")
+    deframer = HdlcDeframer()
+
+    decoded = deframer.feed(segment1 + bytes(corrupt_segment2) + segment3 + next_message)
+
+    assert [frame.info for frame in decoded] == [b"\x01", b"\x04"]
+    assert not decoded[0].restart
+    assert decoded[1].restart
+    assert deframer.rejected == 2
+
+
+def test_deframer_checks_sequence_of_i_frames():
+    deframer = HdlcDeframer()
+    frames = [build_frame(b"\x01", segmented=True, control=0x00),
+              build_frame(b"\x02", segmented=True, control=0x04),  # N(S) = 2, expected 1
+              build_frame(b"\x03", control=0x06),
+              build_frame(b"\x04", control=0x08)]
+
+    decoded = deframer.feed(b"".join(frames))
+
+    assert [frame.info for frame in decoded] == [b"\x01", b"\x04"]
+    assert decoded[1].restart
@@ -42,6 +42,25 @@ class TestHdlcParserUnencrypted:
 
         assert parser.extract_data_from_hdlc_frames()
 
+    def test_split_hdlc_frames_from_stream(self):
+        frames = split_hex_data_to_frames(UNENCRYPTED_VALID_DATA)
+        # garbage before the first frame, shared flag between the first two frames
+        stream = b"\x01\x02" + frames[0] + frames[1][1:] + b"".join(frames[2:])
+        parser = HdlcDlmsParser(Cosem("", []))
+
+        split_frames = []
+        for index in range(0, len(stream), 7):
+            split_frames.extend(frame.raw for frame in parser.split_hdlc_frames(stream[index:index + 7]))
+
+        assert split_frames == frames
+
+    def test_split_hdlc_frames_resynchronizes(self):
+        frames = split_hex_data_to_frames(UNENCRYPTED_VALID_DATA)
+        truncated_frame = frames[0][:20] + b"\x7e"
+        parser = HdlcDlmsParser(Cosem("", []))
+
+        assert [frame.raw for frame in parser.split_hdlc_frames(truncated_frame + b"".join(frames))] == frames
+
 
 class TestDlmsParserUnencrypted:
     def test_hdlc_to_dlms_objects_with_pushlist(self, cosem_config_lg: Cosem):
@@ -93,6 +112,21 @@ class TestDlmsParserUnencrypted:
         assert len(meter_data.data_points) == 1
         assert meter_data.data_points[0].value == 30545
 
+    def test_push_object_list_is_parsed_once_per_structure(self, cosem_config_lg: Cosem, mocker):
+        parser = HdlcDlmsParser(cosem_config_lg)
+        parse_spy = mocker.spy(parser._client, "parsePushObjects")
+        meter_data = []
+        for data in (UNENCRYPTED_VALID_DATA, UNENCRYPTED_VALID_DATA, UNENCRYPTED_VALID_DATA1, UNENCRYPTED_VALID_DATA):
+            for frame in split_hex_data_to_frames(data):
+                parser.append_to_hdlc_buffer(frame)
+                parser.extract_data_from_hdlc_frames()
+            meter_data.append(parser.convert_dlms_bundle_to_reader_data(parser.parse_to_dlms_objects()))
+
+        assert parse_spy.call_count == 2
+        assert [len(bundle.data_points) for bundle in meter_data] == [11, 11, 8, 11]
+        assert meter_data[0] == meter_data[1]
+        assert meter_data[0].data_points == meter_data[3].data_points
+
 
 class TestDlmsParserEncrypted:
     def test_hdlc_to_dlms_objects_without_pushlist(self, cosem_config_lg: Cosem):
@@ -0,0 +1,235 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import configparser
+from datetime import datetime, timezone
+from typing import List
+
+import pytest
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.sinks.influx_sink import InfluxConfig, InfluxDataSink, LineProtocolEncoder
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+TIMESTAMP = datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc)
+LINE = "smartmeter,source=meter1 voltage_l1=230.1,active_energy_p=1000.0 1705314600000"
+# UDP listeners expect nanoseconds
+UDP_LINE = "smartmeter,source=meter1 voltage_l1=230.1,active_energy_p=1000.0 1705314600000000000"
+
+
+def bundle(source: str = "meter1", timestamp: datetime = TIMESTAMP) -> MeterDataBundle:
+    return MeterDataBundle(source, timestamp, [
+        MeterDataPoint(MeterDataPointTypes.VOLTAGE_L1.value, 230.1, OBISCode(1, 0, 32, 7, 0)),
+        MeterDataPoint(MeterDataPointTypes.ACTIVE_ENERGY_P.value, 1000.0, OBISCode(1, 0, 1, 8, 0)),
+    ])
+
+
+class StubInfluxServer:
+    """Records the write requests and the number of connections."""
+
+    def __init__(self, status: int = 204) -> None:
+        self.status = status
+        self.requests: List[bytes] = []
+        self.bodies: List[bytes] = []
+        self.connections = 0
+        self.received = asyncio.Event()
+        self._server = None
+        self._handlers: List[asyncio.Task] = []
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        """Must be called after the client closed its connections."""
+        self._server.close()
+        await asyncio.wait_for(asyncio.gather(*self._handlers), 2)
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._handlers.append(asyncio.current_task())
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                length = int(header.lower().split(b"content-length: ")[1].split(b"\r\n")[0])
+                self.requests.append(header)
+                self.bodies.append(await reader.readexactly(length))
+                self.received.set()
+                writer.write(f"HTTP/1.1 {self.status} Status\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+
+def test_line_protocol():
+    encoder = LineProtocolEncoder("smartmeter")
+
+    assert encoder.encode(bundle()) == LINE
+    assert encoder.encode(bundle("meter 1,a=b")).startswith("smartmeter,source=meter\\ 1\\,a\\=b voltage_l1=")
+    assert encoder.encode(MeterDataBundle("meter1", TIMESTAMP, [])) is None
+    assert LineProtocolEncoder("smartmeter", "ns").encode(
+        bundle(timestamp=TIMESTAMP.replace(microsecond=999999))).endswith(" 1705314600999999000")
+
+
+@pytest.mark.asyncio
+async def test_http_batches_are_sent_over_one_connection():
+    server = StubInfluxServer()
+    await server.start()
+    sink = InfluxDataSink(InfluxConfig(
+        "127.0.0.1", port=server.port, bucket="meters", org="scs", token="secret", batch_bytes=200))
+    await sink.start()
+    try:
+        await sink.send(bundle())
+        assert not server.bodies
+        await sink.send(bundle())
+        await sink.send(bundle())
+        await sink.flush()
+    finally:
+        await sink.stop()
+        await server.stop()
+
+    assert server.bodies == [f"{LINE}\n{LINE}\n".encode(), f"{LINE}\n".encode()]
+    assert server.connections == 1
+    assert server.requests[0].startswith(b"POST /api/v2/write?precision=ms&org=scs&bucket=meters HTTP/1.1")
+    assert b"Authorization: Token secret" in server.requests[0]
+
+
+@pytest.mark.asyncio
+async def test_http_flush_after_interval():
+    server = StubInfluxServer()
+    await server.start()
+    sink = InfluxDataSink(InfluxConfig("127.0.0.1", port=server.port, database="meters", flush_interval=0.05))
+    await sink.start()
+    try:
+        await sink.send(bundle())
+        await asyncio.wait_for(server.received.wait(), 2)
+    finally:
+        await sink.stop()
+        await server.stop()
+
+    assert server.bodies == [f"{LINE}\n".encode()]
+    assert server.requests[0].startswith(b"POST /write?precision=ms&db=meters ")
+
+
+@pytest.mark.asyncio
+async def test_http_failed_batch_is_retried():
+    sink = InfluxDataSink(InfluxConfig("127.0.0.1", port=1, flush_interval=10))
+    await sink.start()
+    await sink.send(bundle())
+    await sink.flush()
+
+    server = StubInfluxServer()
+    await server.start()
+    sink._http._port = server.port  # pylint: disable=protected-access
+    try:
+        await sink.send(bundle())
+        await sink.flush()
+    finally:
+        await sink.stop()
+        await server.stop()
+
+    assert server.bodies == [f"{LINE}\n{LINE}\n".encode()]
+
+
+@pytest.mark.asyncio
+async def test_http_backlog_is_retried_in_batches_after_backoff():
+    line = f"{LINE}\n".encode()
+    sink = InfluxDataSink(InfluxConfig("127.0.0.1", port=1, batch_bytes=2 * len(line), flush_interval=10))
+    sink.RETRY_DELAY = 0.2
+    await sink.start()
+    await sink.send(bundle())
+    await sink.send(bundle())  # the first batch fails
+    await sink.send(bundle())
+
+    server = StubInfluxServer()
+    await server.start()
+    sink._http._port = server.port  # pylint: disable=protected-access
+    try:
+        # during the backoff the backlog is not flushed by send
+        for _ in range(3):
+            await sink.send(bundle())
+        assert not server.bodies
+
+        # the flush timer retries the backlog in batches of at most batch_bytes
+        for _ in range(100):
+            if len(server.bodies) == 3:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        await sink.stop()
+        await server.stop()
+
+    assert server.bodies == [line * 2] * 3
+
+
+@pytest.mark.asyncio
+async def test_http_client_error_is_not_retried():
+    server = StubInfluxServer(status=400)
+    await server.start()
+    sink = InfluxDataSink(InfluxConfig("127.0.0.1", port=server.port, flush_interval=10))
+    await sink.start()
+    try:
+        await sink.send(bundle())
+        await sink.flush()
+        await sink.send(bundle())
+        await sink.flush()
+    finally:
+        await sink.stop()
+        await server.stop()
+
+    assert len(server.bodies) == 2
+    assert server.bodies[1] == f"{LINE}\n".encode()
+
+
+@pytest.mark.asyncio
+async def test_udp_datagrams():
+    received = asyncio.Queue()
+
+    class Receiver(asyncio.DatagramProtocol):
+        def datagram_received(self, data, addr):
+            received.put_nowait(data)
+
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(Receiver, local_addr=("127.0.0.1", 0))
+    port = transport.get_extra_info("sockname")[1]
+    sink = InfluxDataSink(InfluxConfig(
+        "127.0.0.1", protocol="udp", port=port, flush_interval=10, udp_payload_bytes=len(UDP_LINE) * 2 + 2))
+    await sink.start()
+    try:
+        for _ in range(3):
+            await sink.send(bundle())
+        await sink.flush()
+        datagrams = [await asyncio.wait_for(received.get(), 2) for _ in range(2)]
+    finally:
+        await sink.stop()
+        transport.close()
+
+    assert datagrams == [f"{UDP_LINE}\n{UDP_LINE}\n".encode(), f"{UDP_LINE}\n".encode()]
+
+
+def test_config_from_sink_config():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink0": {"type": "influxdb", "host": "localhost", "protocol": "udp"},
+        "sink1": {"type": "influxdb"},
+        "sink2": {"type": "influxdb", "host": "localhost", "protocol": "tcp"},
+    })
+
+    assert InfluxConfig.from_sink_config(cfg_parser["sink0"]) == InfluxConfig("localhost", "udp", 8089)
+    assert InfluxConfig("localhost", bucket="meters").write_target() == "/api/v2/write?precision=ms&bucket=meters"
+    assert InfluxConfig("localhost", database="meters").write_target() == "/write?precision=ms&db=meters"
+    assert InfluxConfig("localhost", path="/proxy/write", database="meters").write_target() == \
+        "/proxy/write?precision=ms&db=meters"
+    with pytest.raises(InvalidConfigError):
+        InfluxConfig.from_sink_config(cfg_parser["sink1"])
+    with pytest.raises(InvalidConfigError):
+        InfluxConfig.from_sink_config(cfg_parser["sink2"])
@@ -66,6 +66,22 @@ async def test_lge450_parse_and_provide_unencrypted_data(mocker: MockerFixture):
     assert data_bundle.timestamp.astimezone().strftime(r"%m/%d/%y %H:%M:%S") == "07/06/21 14:58:18"
 
 
+@pytest.mark.asyncio
+async def test_lge450_parse_data_received_in_arbitrary_chunks(mocker: MockerFixture):
+    observer = mocker.stub("collector_mock")
+    observer.mock_add_spec(['notify'])
+    mocker.patch("smartmeter_datacollector.smartmeter.meter.SerialReader", autospec=True)
+    meter = LGE450("/test/port", bulk_read=True)
+    meter.register(observer)
+    stream = b"".join(split_hex_data_to_frames(UNENCRYPTED_VALID_DATA)) * 2
+
+    for index in range(0, len(stream), 64):
+        meter._data_received(stream[index:index + 64])
+
+    assert observer.notify.call_count == 2
+    assert observer.notify.call_args.args[0].source == "LGZ1030655933512"
+
+
 @pytest.mark.asyncio
 async def test_lge450_do_not_provide_invalid_data(mocker: MockerFixture):
     observer = mocker.stub("collector_mock")
@@ -0,0 +1,38 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import logging
+
+import pytest
+from pytest_mock import MockerFixture
+
+from smartmeter_datacollector.log_utils import TRACE, lazy, trace
+
+
+def test_lazy_is_only_evaluated_if_logged(mocker: MockerFixture, caplog: pytest.LogCaptureFixture):
+    logger = logging.getLogger("test_lazy")
+    func = mocker.Mock(return_value="expensive")
+
+    with caplog.at_level(logging.INFO, logger="test_lazy"):
+        logger.debug("value: %s", lazy(func, 1, 2))
+    func.assert_not_called()
+
+    with caplog.at_level(logging.DEBUG, logger="test_lazy"):
+        logger.debug("value: %s", lazy(func, 1, 2))
+    func.assert_called_with(1, 2)
+    assert "value: expensive" in caplog.text
+
+
+def test_trace(caplog: pytest.LogCaptureFixture):
+    logger = logging.getLogger("test_trace")
+
+    with caplog.at_level(logging.DEBUG, logger="test_trace"):
+        trace(logger, "hidden %d", 1)
+    with caplog.at_level("TRACE", logger="test_trace"):
+        trace(logger, "visible %d", 2)
+
+    assert [(record.levelno, record.getMessage()) for record in caplog.records] == [(TRACE, "visible 2")]
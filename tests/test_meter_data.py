@@ -6,9 +6,11 @@
 # See LICENSES/README.md for more information.
 #
 import json
+import pickle
 from datetime import datetime, timezone
 
-from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointType
+from smartmeter_datacollector.smartmeter.meter_data import (ColumnarMeterDataBundle, MeterDataBundle, MeterDataPoint,
+                                                            MeterDataPointType, MeterDataSchema)
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 
 
@@ -43,3 +45,34 @@ def test_meter_data_serialize_short_obis():
     data_point_json_short_obis = data_point.to_json(short_obis=True)
     result = json.loads(data_point_json_short_obis)
     assert result['obis'] == obis_test.to_short_str()
+
+
+def test_columnar_bundle_equals_bundle():
+    test_type = MeterDataPointType("TEST_TYPE", "test type", "unit")
+    data_points = [
+        MeterDataPoint(test_type, 1.5, OBISCode(1, 0, 1, 7, 0)),
+        MeterDataPoint(test_type, -2.0, OBISCode(1, 0, 2, 7, 0)),
+    ]
+    data_bundle = MeterDataBundle("TestSource", datetime.now(timezone.utc), data_points)
+
+    columnar = ColumnarMeterDataBundle.from_bundle(data_bundle)
+
+    assert isinstance(columnar, MeterDataBundle)
+    assert columnar.data_points == data_points
+    assert list(columnar.values) == [1.5, -2.0]
+    assert str(columnar) == str(data_bundle)
+    assert columnar.to_json() == data_bundle.to_json()
+    assert pickle.loads(pickle.dumps(columnar)).data_points == data_points
+
+
+def test_columnar_bundles_share_schema():
+    test_type = MeterDataPointType("TEST_TYPE", "test type", "unit")
+    timestamp = datetime.now(timezone.utc)
+    bundle1 = MeterDataBundle("TestSource", timestamp, [MeterDataPoint(test_type, 1.0, OBISCode(1, 0, 1, 7, 0))])
+    bundle2 = MeterDataBundle("TestSource", timestamp, [MeterDataPoint(test_type, 2.0, OBISCode(1, 0, 1, 7, 0))])
+
+    schema1 = ColumnarMeterDataBundle.from_bundle(bundle1).schema
+    schema2 = ColumnarMeterDataBundle.from_bundle(bundle2).schema
+
+    assert schema1 is schema2
+    assert schema1 == MeterDataSchema((test_type,), (OBISCode(1, 0, 1, 7, 0),))
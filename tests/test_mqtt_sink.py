@@ -5,9 +5,12 @@
 # SPDX-License-Identifier: GPL-2.0-only
 # See LICENSES/README.md for more information.
 #
+import asyncio
 import configparser
 import json
+import time
 from datetime import datetime, timezone
+from pathlib import Path
 from unittest import mock
 
 import pytest
@@ -15,7 +18,9 @@ import pytest_mock
 from aiomqtt import MqttCodeError
 from paho.mqtt.client import MQTT_ERR_NO_CONN
 
+from smartmeter_datacollector.config import InvalidConfigError
 from smartmeter_datacollector.sinks.mqtt_sink import MqttConfig, MqttDataSink, MqttSinkRlDsp
+from smartmeter_datacollector.sinks.payload_encoder import decode_bundle_payload
 from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointType
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 
@@ -60,10 +65,13 @@ async def test_mqtt_sink_retry_sending_datapoint(mocked_mqtt_client: mock.MagicM
     # Simulate publish raising MqttCodeError the first time, then succeeding
     mocked_mqtt_client.publish.side_effect = [MqttCodeError(MQTT_ERR_NO_CONN), None]
 
-    with mock.patch("smartmeter_datacollector.sinks.mqtt_sink.asyncio.sleep"):
-        await sink.send(data_bundle)
+    await sink.send(data_bundle)
+    # the retry does not block the sender
+    assert mocked_mqtt_client.publish.await_count == 1
 
+    assert await sink._retry_scheduler.process_due(time.monotonic() + 5) == 1
     assert mocked_mqtt_client.publish.await_count == 2
+    assert len(sink._retry_scheduler) == 0
 
 
 @pytest.mark.asyncio
@@ -75,10 +83,29 @@ async def test_mqtt_sink_only_retry_sending_3_times(mocked_mqtt_client: mock.Mag
 
     mocked_mqtt_client.publish.side_effect = [MqttCodeError(MQTT_ERR_NO_CONN)]*4
 
-    with mock.patch("smartmeter_datacollector.sinks.mqtt_sink.asyncio.sleep"):
-        await sink.send(data_bundle)
+    await sink.send(data_bundle)
+    for offset in (5, 10, 20):
+        await sink._retry_scheduler.process_due(time.monotonic() + offset)
 
     assert mocked_mqtt_client.publish.await_count == 3
+    assert len(sink._retry_scheduler) == 0
+    assert sink._retry_scheduler.discarded == 1
+
+
+@pytest.mark.asyncio
+async def test_mqtt_sink_fresh_publish_not_blocked_by_pending_retry(mocked_mqtt_client: mock.MagicMock):
+    config = MqttConfig("localhost")
+    sink = MqttDataSink(config)
+    data_bundle = MeterDataBundle("test_source", datetime.now(timezone.utc),
+                                  [MeterDataPoint(TEST_DATA_POINT_TYPE, 1.0, TEST_OBIS)])
+
+    mocked_mqtt_client.publish.side_effect = [MqttCodeError(MQTT_ERR_NO_CONN), None]
+
+    await asyncio.wait_for(sink.send(data_bundle), 0.1)
+    await asyncio.wait_for(sink.send(data_bundle), 0.1)
+
+    assert mocked_mqtt_client.publish.await_count == 2
+    assert len(sink._retry_scheduler) == 1
 
 
 @mock.patch("smartmeter_datacollector.sinks.mqtt_sink.Client", new_callable=mock.MagicMock)
@@ -263,6 +290,19 @@ def test_mqtt_sink_rldsp_to_mqtt_payload_contains_obis_values():
     assert payload["meter"][TEST_OBIS_2.to_short_str()] == 200.0
 
 
+def test_mqtt_sink_rldsp_to_mqtt_payload_format_is_unchanged():
+    timestamp = datetime(2024, 1, 15, 10, 30, 0, tzinfo=timezone.utc)
+    data_points = [
+        MeterDataPoint(TEST_DATA_POINT_TYPE, 100.0, TEST_OBIS),
+        MeterDataPoint(TEST_DATA_POINT_TYPE, float("nan"), TEST_OBIS_2),
+    ]
+    data_bundle = MeterDataBundle("meter1", timestamp, data_points)
+
+    assert MqttSinkRlDsp.to_mqtt_payload(data_bundle) == (
+        f'{{"meter": {{"ts": "{timestamp.isoformat()}", "{TEST_OBIS.to_short_str()}": 100.0, '
+        f'"{TEST_OBIS_2.to_short_str()}": NaN}}}}')
+
+
 def test_mqtt_sink_rldsp_build_topic_name():
     config = MqttConfig("localhost")
     sink = MqttSinkRlDsp(config)
@@ -300,3 +340,152 @@ def test_mqtt_config_topic_group_invalid_uses_default():
     cfg = MqttConfig.from_sink_config(cfg_parser["sink"])
 
     assert cfg.topic_group == "building"
+
+
+@pytest.mark.asyncio
+async def test_mqtt_sink_batch_publishes_bundle_concurrently(mocked_mqtt_client: mock.MagicMock):
+    config = MqttConfig("localhost", batch_publish=True)
+    sink = MqttDataSink(config)
+    data_points = [
+        MeterDataPoint(TEST_DATA_POINT_TYPE, 100.0, TEST_OBIS),
+        MeterDataPoint(TEST_DATA_POINT_TYPE, 200.0, TEST_OBIS_2),
+    ]
+    data_bundle = MeterDataBundle("test_source", datetime.now(timezone.utc), data_points)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def publish(*_):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+    mocked_mqtt_client.publish.side_effect = publish
+
+    await sink.send(data_bundle)
+
+    assert mocked_mqtt_client.publish.await_count == 2
+    assert max_in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_mqtt_sink_batch_window_collects_bundles(mocked_mqtt_client: mock.MagicMock):
+    config = MqttConfig("localhost", batch_window=0.05)
+    sink = MqttSinkRlDsp(config)
+    data_point = MeterDataPoint(TEST_DATA_POINT_TYPE, 42.0, TEST_OBIS)
+
+    await sink.send(MeterDataBundle("meter1", datetime.now(timezone.utc), [data_point]))
+    await sink.send(MeterDataBundle("meter2", datetime.now(timezone.utc), [data_point]))
+    assert mocked_mqtt_client.publish.await_count == 0
+
+    await asyncio.sleep(0.1)
+
+    assert mocked_mqtt_client.publish.await_count == 2
+    topics = {call.args[0] for call in mocked_mqtt_client.publish.await_args_list}
+    assert topics == {"dt/building/meter1/ds", "dt/building/meter2/ds"}
+
+
+def test_mqtt_config_batching():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink": {
+            'type': "mqtt",
+            'host': "localhost",
+            'batch_publish': True,
+            'batch_window': 0.5,
+        }
+    })
+    cfg = MqttConfig.from_sink_config(cfg_parser["sink"])
+
+    assert cfg.batch_publish
+    assert cfg.batch_window == 0.5
+
+
+@pytest.mark.asyncio
+async def test_mqtt_sink_spools_and_replays_failed_msgs(mocked_mqtt_client: mock.MagicMock, tmp_path: Path):
+    config = MqttConfig("localhost", spool_dir=str(tmp_path), spool_replay_rate=0)
+    sink = MqttDataSink(config)
+    data_bundle = MeterDataBundle("test_source", datetime.now(timezone.utc),
+                                  [MeterDataPoint(TEST_DATA_POINT_TYPE, 1.0, TEST_OBIS)])
+
+    mocked_mqtt_client.publish.side_effect = MqttCodeError(MQTT_ERR_NO_CONN)
+    await sink.send(data_bundle)
+    for offset in (5, 10, 20):
+        await sink._retry_scheduler.process_due(time.monotonic() + offset)
+    assert sink.spool_depth == 1
+
+    mocked_mqtt_client.publish.reset_mock(side_effect=True)
+    replay = asyncio.create_task(sink._replay_spool())
+    await asyncio.sleep(0.1)
+    replay.cancel()
+
+    mocked_mqtt_client.publish.assert_awaited_once_with(
+        f"smartmeter/test_source/{TEST_DATA_POINT_TYPE.identifier}", mock.ANY)
+    assert sink.spool_depth == 0
+
+
+def test_mqtt_config_spool():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink": {
+            'type': "mqtt",
+            'host': "localhost",
+            'spool_dir': "/var/spool/smartmeter",
+            'spool_max_bytes': 1000000,
+            'spool_replay_rate': 5,
+        }
+    })
+    cfg = MqttConfig.from_sink_config(cfg_parser["sink"])
+
+    assert cfg.spool_dir == "/var/spool/smartmeter"
+    assert cfg.spool_max_bytes == 1000000
+    assert cfg.spool_replay_rate == 5.0
+
+
+@pytest.mark.asyncio
+async def test_mqtt_sink_packed_payload_with_retained_schema(mocked_mqtt_client: mock.MagicMock):
+    config = MqttConfig("localhost")
+    config.payload_format = "packed"
+    sink = MqttDataSink(config)
+    timestamp = datetime(2024, 1, 15, 10, 30, 0, tzinfo=timezone.utc)
+    data_bundle = MeterDataBundle("meter1", timestamp, [
+        MeterDataPoint(TEST_DATA_POINT_TYPE, 42.0, TEST_OBIS), MeterDataPoint(TEST_DATA_POINT_TYPE, 43.0, TEST_OBIS_2)])
+
+    await sink.send(data_bundle)
+    await sink.send(data_bundle)
+
+    calls = mocked_mqtt_client.publish.await_args_list
+    assert [call.args[0] for call in calls] == ["smartmeter/meter1/schema", "smartmeter/meter1/data",
+                                                "smartmeter/meter1/data"]
+    assert calls[0].kwargs == {"retain": True}
+    schema = json.loads(calls[0].args[1])
+    assert decode_bundle_payload("packed", calls[1].args[1]) == (schema["schema_id"], 1705314600, [42.0, 43.0])
+
+
+@pytest.mark.asyncio
+async def test_mqtt_sink_rldsp_schema_is_republished_after_failure(mocked_mqtt_client: mock.MagicMock):
+    config = MqttConfig("localhost")
+    config.payload_format = "packed"
+    sink = MqttSinkRlDsp(config)
+    data_bundle = MeterDataBundle(
+        "meter1", datetime.now(timezone.utc), [MeterDataPoint(TEST_DATA_POINT_TYPE, 1, TEST_OBIS)])
+    mocked_mqtt_client.publish.side_effect = [MqttCodeError(MQTT_ERR_NO_CONN), None, None, None]
+
+    await sink.send(data_bundle)
+    await sink.send(data_bundle)
+
+    topics = [call.args[0] for call in mocked_mqtt_client.publish.await_args_list]
+    assert topics == ["dt/building/meter1/schema", "dt/building/meter1/ds",
+                      "dt/building/meter1/schema", "dt/building/meter1/ds"]
+
+
+def test_mqtt_config_payload_format():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink0": {'type': "mqtt", 'host': "localhost", 'payload_format': "Packed"},
+        "sink1": {'type': "mqtt", 'host': "localhost", 'payload_format': "xml"},
+    })
+
+    assert MqttConfig.from_sink_config(cfg_parser["sink0"]).payload_format == "packed"
+    with pytest.raises(InvalidConfigError):
+        MqttConfig.from_sink_config(cfg_parser["sink1"])
@@ -5,6 +5,8 @@
 # SPDX-License-Identifier: GPL-2.0-only
 # See LICENSES/README.md for more information.
 #
+import pickle
+
 from smartmeter_datacollector.smartmeter.obis import OBISCode
 
 
@@ -88,3 +90,23 @@ def test_hash_of_obis():
 
     assert hash(obis) == hash(obis_same)
     assert hash(obis) != hash(obis_diff)
+
+
+def test_parsed_obis_codes_are_interned():
+    obis = OBISCode.from_string("1.0.1.8.0.255")
+
+    assert OBISCode.from_string("1.0.1.8.0.255") is obis
+    assert OBISCode.from_string("1-0:1.8.0*255") is obis
+    assert OBISCode.from_short_string("1.8.0") is obis
+    assert OBISCode.from_bytes(bytearray.fromhex("01 00 01 08 00 FF")) is obis
+    # equal but not identical octets a, b or f result in a different instance
+    assert OBISCode.from_string("0.0.1.8.0.255") is not obis
+
+
+def test_pickle_obis():
+    obis = OBISCode(1, 1, 1, 8, 2, 100)
+
+    unpickled = pickle.loads(pickle.dumps(obis))
+
+    assert unpickled == obis
+    assert unpickled.a == 1 and unpickled.b == 1 and unpickled.f == 100
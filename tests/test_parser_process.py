@@ -0,0 +1,119 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import os
+import pickle
+import signal
+import socket
+
+import pytest
+
+from smartmeter_datacollector.smartmeter.cosem import Cosem
+from smartmeter_datacollector.smartmeter.hdlc_dlms_parser import HdlcDlmsParser
+from smartmeter_datacollector.smartmeter.parser_process import FRAME_HEADER, ParserProcess
+from tests.conftest import split_hex_data_to_frames
+from tests.testdata.lg_e450 import UNENCRYPTED_VALID_DATA_CFG2026
+
+
+def test_parser_feed_returns_bundles_of_completed_messages():
+    parser = HdlcDlmsParser(Cosem("fallback_id"))
+    data = b"".join(split_hex_data_to_frames(UNENCRYPTED_VALID_DATA_CFG2026))
+
+    data_bundles = parser.feed(data[:100])
+    data_bundles += parser.feed(data[100:])
+
+    assert len(data_bundles) == 1
+    assert data_bundles[0].data_points
+
+
+@pytest.mark.asyncio
+async def test_parser_process_decodes_in_worker():
+    expected = HdlcDlmsParser(Cosem("fallback_id")).feed(
+        b"".join(split_hex_data_to_frames(UNENCRYPTED_VALID_DATA_CFG2026)))
+    received = asyncio.Queue()
+    parser_process = ParserProcess(Cosem("fallback_id"), None, False, "gurux", received.put_nowait)
+
+    parser_process.start()
+    try:
+        for frame in split_hex_data_to_frames(UNENCRYPTED_VALID_DATA_CFG2026):
+            parser_process.feed(frame)
+        data_bundle = await asyncio.wait_for(received.get(), 30)
+    finally:
+        await parser_process.stop()
+
+    assert data_bundle == expected[0]
+    assert not parser_process.is_alive
+
+
+@pytest.mark.asyncio
+async def test_parser_process_is_restarted_after_worker_died():
+    received = asyncio.Queue()
+    parser_process = ParserProcess(Cosem("fallback_id"), None, False, "gurux", received.put_nowait)
+    parser_process.RESTART_DELAY = 0
+
+    parser_process.start()
+    try:
+        parser_process._process.kill()  # pylint: disable=protected-access
+        for _ in range(100):
+            if parser_process._process is None:  # pylint: disable=protected-access
+                break
+            await asyncio.sleep(0.05)
+        assert not parser_process.is_alive
+
+        for frame in split_hex_data_to_frames(UNENCRYPTED_VALID_DATA_CFG2026):
+            parser_process.feed(frame)
+        data_bundle = await asyncio.wait_for(received.get(), 30)
+        assert parser_process.is_alive
+    finally:
+        await parser_process.stop()
+
+    assert data_bundle.data_points
+
+
+@pytest.mark.asyncio
+async def test_parser_process_feed_does_not_block_on_stalled_worker():
+    parser_process = ParserProcess(Cosem("fallback_id"), None, False, "gurux", lambda _: None)
+
+    parser_process.start()
+    os.kill(parser_process._process.pid, signal.SIGSTOP)  # pylint: disable=protected-access
+    try:
+        for _ in range(100):
+            parser_process.feed(b"\x00" * 65536)
+        assert parser_process.dropped_bytes > 0
+    finally:
+        os.kill(parser_process._process.pid, signal.SIGCONT)  # pylint: disable=protected-access
+        await parser_process.stop()
+
+
+@pytest.mark.asyncio
+async def test_parser_process_buffers_partial_frames():
+    # pylint: disable=protected-access
+    received = []
+    parser_process = ParserProcess(Cosem("fallback_id"), None, False, "gurux", received.append)
+    parser_process._loop = asyncio.get_running_loop()
+    parser_process._result_socket, worker_socket = socket.socketpair()
+    parser_process._result_socket.setblocking(False)
+    body = pickle.dumps(["bundle0", "bundle1"])
+    frame = FRAME_HEADER.pack(len(body)) + body
+    try:
+        worker_socket.sendall(frame[:FRAME_HEADER.size + 3])
+        parser_process._receive()
+        assert not received
+        # no data available, must not block
+        parser_process._receive()
+
+        worker_socket.sendall(frame[FRAME_HEADER.size + 3:] + frame[:2])
+        parser_process._receive()
+        assert received == ["bundle0", "bundle1"]
+
+        worker_socket.sendall(frame[2:])
+        parser_process._receive()
+        assert received == ["bundle0", "bundle1"] * 2
+    finally:
+        worker_socket.close()
+        parser_process._close_connections()
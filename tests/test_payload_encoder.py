@@ -0,0 +1,109 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from smartmeter_datacollector.sinks.mqtt_sink import MqttDataSink, MqttSinkRlDsp
+from smartmeter_datacollector.sinks.payload_encoder import (BundleEncoder, DataPointEncoder, available_payload_formats,
+                                                            decode_bundle_payload)
+from smartmeter_datacollector.smartmeter.meter_data import (ColumnarMeterDataBundle, MeterDataBundle, MeterDataPoint,
+                                                            MeterDataPointType, MeterDataPointTypes)
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+TEST_DATA_POINT_TYPE = MeterDataPointType("TEST_TYPE", "test type", "unit")
+TEST_OBIS = OBISCode(1, 0, 1, 8, 0, 255)
+BUNDLE_FORMATS = [payload_format for payload_format in available_payload_formats() if payload_format != "json"]
+
+
+def meter_bundle(voltage: float = 230.1, source: str = "meter1") -> MeterDataBundle:
+    return MeterDataBundle(source, datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc), [
+        MeterDataPoint(MeterDataPointTypes.VOLTAGE_L1.value, voltage, OBISCode(1, 0, 32, 7, 0)),
+        MeterDataPoint(MeterDataPointTypes.CURRENT_L1.value, 1.25, OBISCode(1, 0, 31, 7, 0)),
+        MeterDataPoint(MeterDataPointTypes.ACTIVE_ENERGY_P.value, 12345678.0, OBISCode(1, 0, 1, 8, 0)),
+    ])
+
+
+@pytest.mark.parametrize("value", [1.0, 0.1, -230.5, 1e-7, 1.5e20, 42, 0, float("nan"), float("inf"), "text"])
+def test_encoder_output_equals_json_dumps(value):
+    encoder = DataPointEncoder()
+    data_point = MeterDataPoint(TEST_DATA_POINT_TYPE, value, TEST_OBIS)
+
+    topic, payload = encoder.encode("meter1", data_point, 1700000000)
+
+    assert topic == MqttDataSink.get_topic_name_for_datapoint(data_point, "meter1")
+    assert payload == MqttDataSink.data_point_to_mqtt_json(data_point, 1700000000)
+
+
+def test_encoder_reuses_template_per_source_and_obis():
+    encoder = DataPointEncoder()
+    encoder.encode("meter1", MeterDataPoint(TEST_DATA_POINT_TYPE, 1.0, TEST_OBIS), 1)
+    encoder.encode("meter1", MeterDataPoint(TEST_DATA_POINT_TYPE, 2.0, TEST_OBIS), 2)
+    encoder.encode("meter2", MeterDataPoint(TEST_DATA_POINT_TYPE, 3.0, TEST_OBIS), 3)
+
+    assert len(encoder._templates) == 2
+
+
+def test_encoder_updates_template_if_type_changes():
+    encoder = DataPointEncoder()
+    other_type = MeterDataPointType("OTHER_TYPE", "other type", "unit")
+    encoder.encode("meter1", MeterDataPoint(TEST_DATA_POINT_TYPE, 1.0, TEST_OBIS), 1)
+
+    topic, _ = encoder.encode("meter1", MeterDataPoint(other_type, 1.0, TEST_OBIS), 1)
+
+    assert topic == "smartmeter/meter1/OTHER_TYPE"
+
+
+@pytest.mark.parametrize("payload_format", BUNDLE_FORMATS)
+def test_bundle_encoder_roundtrip(payload_format: str):
+    encoder = BundleEncoder(payload_format)
+    data_bundle = meter_bundle()
+
+    schema_message, payload = encoder.encode(data_bundle)
+
+    schema = json.loads(schema_message)
+    assert schema["format"] == payload_format
+    assert [(dp["type"], dp["obis"], dp["unit"]) for dp in schema["data_points"]] == [
+        ("VOLTAGE_L1", "32.7.0", "V"), ("CURRENT_L1", "31.7.0", "A"), ("ACTIVE_ENERGY_P", "1.8.0", "Wh")]
+    assert decode_bundle_payload(payload_format, payload) == (
+        schema["schema_id"], 1705314600, [230.1, 1.25, 12345678.0])
+
+
+@pytest.mark.parametrize("payload_format", BUNDLE_FORMATS)
+def test_bundle_payload_is_smaller_than_json(payload_format: str):
+    data_bundle = meter_bundle()
+
+    _, payload = BundleEncoder(payload_format).encode(data_bundle)
+
+    assert len(payload) * 2 < len(MqttSinkRlDsp.to_mqtt_payload(data_bundle))
+
+
+def test_bundle_encoder_returns_schema_until_confirmed():
+    encoder = BundleEncoder("packed")
+    schema_message, _ = encoder.encode(meter_bundle())
+    assert encoder.encode(meter_bundle(231.0))[0] == schema_message
+
+    encoder.confirm_schema("meter1", schema_message)
+
+    assert encoder.encode(meter_bundle(232.0))[0] is None
+    assert encoder.encode(meter_bundle(source="meter2"))[0] == schema_message
+    changed = MeterDataBundle("meter1", datetime.now(timezone.utc), meter_bundle().data_points[:2])
+    assert encoder.encode(changed)[0] not in (None, schema_message)
+
+
+def test_bundle_encoder_accepts_columnar_bundles():
+    encoder = BundleEncoder("packed")
+    data_bundle = meter_bundle()
+
+    assert encoder.encode(ColumnarMeterDataBundle.from_bundle(data_bundle)) == encoder.encode(data_bundle)
+
+
+def test_bundle_encoder_rejects_json():
+    with pytest.raises(ValueError):
+        BundleEncoder("json")
@@ -0,0 +1,110 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import configparser
+from datetime import datetime, timezone
+
+import pytest
+
+from smartmeter_datacollector.sinks.prometheus_sink import PrometheusConfig, PrometheusSink, metric_type
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+from smartmeter_datacollector.stages.aggregation import derived_type
+
+VOLTAGE_OBIS = OBISCode(1, 0, 32, 7, 0)
+ENERGY_OBIS = OBISCode(1, 0, 1, 8, 0)
+TIMESTAMP = datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc)
+
+
+def bundle(source: str, voltage: float, energy: float) -> MeterDataBundle:
+    return MeterDataBundle(source, TIMESTAMP, [
+        MeterDataPoint(MeterDataPointTypes.VOLTAGE_L1.value, voltage, VOLTAGE_OBIS),
+        MeterDataPoint(MeterDataPointTypes.ACTIVE_ENERGY_P.value, energy, ENERGY_OBIS),
+    ])
+
+
+async def http_request(port: int, request: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+@pytest.mark.asyncio
+async def test_render_latest_values():
+    sink = PrometheusSink(PrometheusConfig())
+
+    await sink.send(bundle("meter1", 230.0, 1000.0))
+    await sink.send(bundle("meter1", 231.5, 1010.0))
+    await sink.send(bundle("meter\"2", 229.0, 20.0))
+
+    assert sink.render().decode() == (
+        "# HELP smartmeter_active_energy_p Active Energy + [Wh]\n"
+        "# TYPE smartmeter_active_energy_p counter\n"
+        "smartmeter_active_energy_p{source=\"meter1\",obis=\"1.8.0\"} 1010.0\n"
+        "smartmeter_active_energy_p{source=\"meter\\\"2\",obis=\"1.8.0\"} 20.0\n"
+        "# HELP smartmeter_voltage_l1 Voltage L1 [V]\n"
+        "# TYPE smartmeter_voltage_l1 gauge\n"
+        "smartmeter_voltage_l1{source=\"meter1\",obis=\"32.7.0\"} 231.5\n"
+        "smartmeter_voltage_l1{source=\"meter\\\"2\",obis=\"32.7.0\"} 229.0\n")
+
+
+def test_metric_type_of_energy_deltas_is_gauge():
+    energy = MeterDataPointTypes.ACTIVE_ENERGY_P.value
+
+    assert metric_type(energy) == "counter"
+    assert metric_type(derived_type(energy, "last")) == "counter"
+    assert metric_type(derived_type(energy, "delta")) == "gauge"
+    assert metric_type(MeterDataPointTypes.VOLTAGE_L1.value) == "gauge"
+
+
+@pytest.mark.asyncio
+async def test_render_is_cached_until_a_value_changes():
+    sink = PrometheusSink(PrometheusConfig())
+    await sink.send(bundle("meter1", 230.0, 1000.0))
+    page = sink.render()
+
+    await sink.send(bundle("meter1", 230.0, 1000.0))
+    assert sink.render() is page
+
+    await sink.send(bundle("meter1", 230.0, 1001.0))
+    assert sink.render() is not page
+    assert b"1001.0" in sink.render()
+
+
+@pytest.mark.asyncio
+async def test_serve_metrics():
+    sink = PrometheusSink(PrometheusConfig(host="127.0.0.1", port=0))
+    await sink.start()
+    try:
+        await sink.send(bundle("meter1", 230.0, 1000.0))
+
+        response = await http_request(sink.port, b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        not_found = await http_request(sink.port, b"GET /other HTTP/1.1\r\n\r\n")
+        not_allowed = await http_request(sink.port, b"POST /metrics HTTP/1.1\r\n\r\n")
+        too_large = await http_request(
+            sink.port, b"GET /metrics HTTP/1.1\r\nCookie: " + b"x" * PrometheusSink.MAX_REQUEST_SIZE + b"\r\n\r\n")
+    finally:
+        await sink.stop()
+
+    header, body = response.split(b"\r\n\r\n", 1)
+    assert header.startswith(b"HTTP/1.1 200 OK")
+    assert b"Content-Type: text/plain; version=0.0.4" in header
+    assert body == sink.render()
+    assert not_found.startswith(b"HTTP/1.1 404")
+    assert not_allowed.startswith(b"HTTP/1.1 405")
+    assert too_large.startswith(b"HTTP/1.1 431")
+
+
+def test_config_from_sink_config():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({"sink0": {"type": "prometheus", "port": "9200", "path": "scrape"}})
+
+    assert PrometheusConfig.from_sink_config(cfg_parser["sink0"]) == PrometheusConfig(port=9200, path="/scrape")
@@ -0,0 +1,53 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+from unittest import mock
+
+import pytest
+
+from smartmeter_datacollector.sinks.retry_scheduler import RetryScheduler
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_discards_after_deadline():
+    publish = mock.AsyncMock(return_value=False)
+    scheduler = RetryScheduler(publish, max_age=10.0)
+
+    scheduler.schedule("topic", "payload", retries=5, now=0.0)
+    assert await scheduler.process_due(now=11.0) == 0
+
+    publish.assert_not_awaited()
+    assert scheduler.discarded == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_cap():
+    publish = mock.AsyncMock(return_value=True)
+    scheduler = RetryScheduler(publish, max_size=2)
+
+    for _ in range(3):
+        scheduler.schedule("topic", "payload", retries=2, now=0.0)
+
+    assert len(scheduler) == 2
+    assert scheduler.discarded == 1
+    assert await scheduler.process_due(now=5.0) == 2
+
+
+@pytest.mark.asyncio
+async def test_retry_scheduler_exponential_backoff():
+    publish = mock.AsyncMock(return_value=False)
+    scheduler = RetryScheduler(publish, base_delay=1.0, max_delay=4.0, max_age=100.0)
+
+    scheduler.schedule("topic", "payload", retries=10, now=0.0)
+    assert 0.5 <= scheduler._heap[0].due <= 1.0
+    await scheduler.process_due(now=1.0)
+    assert 2.0 <= scheduler._heap[0].due <= 3.0
+    await scheduler.process_due(now=3.0)
+    assert 5.0 <= scheduler._heap[0].due <= 7.0
+    await scheduler.process_due(now=7.0)
+    # capped by max delay
+    assert 9.0 <= scheduler._heap[0].due <= 11.0
@@ -0,0 +1,105 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import configparser
+from datetime import datetime, timezone
+
+import pytest
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.factory import build_collector, build_sinks
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+from smartmeter_datacollector.stages.routing import RoutingConfig, RoutingStage
+
+VOLTAGE_OBIS = OBISCode(1, 0, 32, 7, 0)
+CURRENT_OBIS = OBISCode(1, 0, 31, 7, 0)
+ENERGY_OBIS = OBISCode(1, 0, 1, 8, 0)
+DATA_POINTS = [
+    MeterDataPoint(MeterDataPointTypes.VOLTAGE_L1.value, 230.0, VOLTAGE_OBIS),
+    MeterDataPoint(MeterDataPointTypes.CURRENT_L1.value, 2.5, CURRENT_OBIS),
+    MeterDataPoint(MeterDataPointTypes.ACTIVE_ENERGY_P.value, 1000.0, ENERGY_OBIS),
+]
+
+
+def bundle(source: str = "meter1") -> MeterDataBundle:
+    return MeterDataBundle(source, datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc), list(DATA_POINTS))
+
+
+def selected_types(config: RoutingConfig, source: str = "meter1"):
+    processed = RoutingStage(config).process(bundle(source))
+    if processed is None:
+        return None
+    return [data_point.type.identifier for data_point in processed.data_points]
+
+
+def sink_section(options: dict) -> configparser.SectionProxy:
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({"sink0": {"type": "logger", **options}})
+    return cfg_parser["sink0"]
+
+
+@pytest.mark.parametrize("config,expected", [
+    (RoutingConfig(include_obis=frozenset({ENERGY_OBIS})), ["ACTIVE_ENERGY_P"]),
+    (RoutingConfig(exclude_obis=frozenset({ENERGY_OBIS})), ["VOLTAGE_L1", "CURRENT_L1"]),
+    (RoutingConfig(include_types=frozenset({"VOLTAGE_L1", "CURRENT_L1"}), exclude_obis=frozenset({CURRENT_OBIS})),
+     ["VOLTAGE_L1"]),
+    (RoutingConfig(exclude_types=frozenset({"VOLTAGE_L1"})), ["CURRENT_L1", "ACTIVE_ENERGY_P"]),
+    (RoutingConfig(include_obis=frozenset({OBISCode(1, 0, 99, 99, 0)})), None),
+])
+def test_register_selection(config: RoutingConfig, expected):
+    assert selected_types(config) == expected
+
+
+def test_source_selection():
+    assert selected_types(RoutingConfig(include_sources=frozenset({"meter2"})), "meter1") is None
+    assert selected_types(RoutingConfig(include_sources=frozenset({"meter2"})), "meter2") == [
+        "VOLTAGE_L1", "CURRENT_L1", "ACTIVE_ENERGY_P"]
+    assert selected_types(RoutingConfig(exclude_sources=frozenset({"meter1"})), "meter1") is None
+
+
+def test_unfiltered_bundle_is_passed_unchanged():
+    data_bundle = bundle()
+
+    assert RoutingStage(RoutingConfig(exclude_types=frozenset({"NET_FREQUENCY"}))).process(data_bundle) is data_bundle
+
+
+def test_config_from_sink_section():
+    config = RoutingConfig.from_sink_config(sink_section({
+        "include_obis": "1-0:1.8.0*255, 32.7.0",
+        "exclude_types": "net_frequency",
+        "include_sources": "meter1,meter2",
+    }))
+
+    assert config == RoutingConfig(
+        include_obis=frozenset({ENERGY_OBIS, VOLTAGE_OBIS}),
+        exclude_types=frozenset({"NET_FREQUENCY"}),
+        include_sources=frozenset({"meter1", "meter2"}))
+
+
+def test_config_without_filters():
+    assert RoutingConfig.from_sink_config(sink_section({})) is None
+
+
+@pytest.mark.parametrize("options", [{"include_obis": "1.8"}, {"exclude_types": "voltage"}])
+def test_invalid_config(options):
+    with pytest.raises(InvalidConfigError):
+        RoutingConfig.from_sink_config(sink_section(options))
+
+
+def test_factory_adds_routing_in_front_of_aggregation():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink0": {"type": "logger", "include_types": "voltage_l1", "aggregate": "60s"},
+        "sink1": {"type": "logger"},
+    })
+
+    collector = build_collector([], build_sinks(cfg_parser), cfg_parser)
+
+    # pylint: disable=protected-access
+    assert [type(stage).__name__ for stage in collector._workers[0]._stages] == ["RoutingStage", "AggregationStage"]
+    assert not collector._workers[1]._stages
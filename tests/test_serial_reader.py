@@ -0,0 +1,97 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import asyncio
+import os
+import sys
+
+import pytest
+import serial
+from pytest_mock import MockerFixture
+
+from smartmeter_datacollector.smartmeter.reader import ReaderError
+from smartmeter_datacollector.smartmeter.serial_reader import NativeSerialPort, SerialConfig, SerialReader
+
+
+@pytest.mark.asyncio
+async def test_serial_reader_reads_until_termination(mocker: MockerFixture):
+    serial_mock = mocker.patch("aioserial.AioSerial", autospec=True).return_value
+    serial_mock.read_until_async.side_effect = [b"\x7e", b"\x01\x02\x7e", asyncio.CancelledError()]
+    callback = mocker.stub()
+    reader = SerialReader(SerialConfig("/test/port", termination=b"\x7e"), callback)
+
+    with pytest.raises(asyncio.CancelledError):
+        await reader.start_and_listen()
+
+    assert [call.args[0] for call in callback.call_args_list] == [b"\x7e", b"\x01\x02\x7e"]
+    serial_mock.read_async.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_serial_reader_bulk_reads_available_bytes(mocker: MockerFixture):
+    serial_mock = mocker.patch("aioserial.AioSerial", autospec=True).return_value
+    serial_mock.read_async.side_effect = [b"\x7e", b"\x03", asyncio.CancelledError()]
+    type(serial_mock).in_waiting = mocker.PropertyMock(side_effect=[3, 0])
+    serial_mock.read.return_value = b"\xa0\x01\x02"
+    callback = mocker.stub()
+    reader = SerialReader(SerialConfig("/test/port", bulk_read=True), callback)
+
+    with pytest.raises(asyncio.CancelledError):
+        await reader.start_and_listen()
+
+    assert [call.args[0] for call in callback.call_args_list] == [b"\x7e\xa0\x01\x02", b"\x03"]
+    serial_mock.read.assert_called_once_with(3)
+    serial_mock.read_until_async.assert_not_called()
+
+
+@pytest.fixture
+def pty_pair():
+    controller_fd, device_fd = os.openpty()
+    yield controller_fd, os.ttyname(device_fd)
+    os.close(controller_fd)
+    os.close(device_fd)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Native serial backend requires POSIX.")
+@pytest.mark.asyncio
+async def test_native_serial_port_reads_and_writes(pty_pair):
+    controller_fd, device = pty_pair
+    port = NativeSerialPort(device, 9600, serial.EIGHTBITS, serial.PARITY_NONE, serial.STOPBITS_ONE)
+
+    os.write(controller_fd, b"\x7e\xa0\x01\x7e")
+    assert await asyncio.wait_for(port.read_until_async(b"\x7e"), 1) == b"\x7e"
+    assert await asyncio.wait_for(port.read_until_async(b"\x7e"), 1) == b"\xa0\x01\x7e"
+
+    read_task = asyncio.ensure_future(port.readline_async())
+    await asyncio.sleep(0.05)
+    assert not read_task.done()
+    os.write(controller_fd, b"1.8.0(00001.000*kWh)\r\n")
+    assert await asyncio.wait_for(read_task, 1) == b"1.8.0(00001.000*kWh)\r\n"
+
+    await port.write_async(b"/?!\r\n")
+    assert os.read(controller_fd, 100) == b"/?!\r\n"
+    port.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Native serial backend requires POSIX.")
+@pytest.mark.asyncio
+async def test_serial_reader_with_native_backend(mocker: MockerFixture, pty_pair):
+    controller_fd, device = pty_pair
+    callback = mocker.stub()
+    reader = SerialReader(SerialConfig(device, bulk_read=True, backend="native"), callback)
+    task = asyncio.ensure_future(reader.start_and_listen())
+
+    os.write(controller_fd, b"\x7e\xa0\x03\x01\x7e")
+    await asyncio.sleep(0.1)
+    task.cancel()
+
+    assert b"".join(call.args[0] for call in callback.call_args_list) == b"\x7e\xa0\x03\x01\x7e"
+
+
+def test_serial_reader_unknown_backend():
+    with pytest.raises(ReaderError):
+        SerialReader(SerialConfig("/test/port", backend="unknown"), lambda _: None)
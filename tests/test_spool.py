@@ -0,0 +1,147 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import threading
+from pathlib import Path
+from unittest import mock
+
+from smartmeter_datacollector.sinks.spool import DiskSpool
+
+
+def test_spool_append_flush_and_replay(tmp_path: Path):
+    spool = DiskSpool(str(tmp_path))
+    spool.append("topic/1", "payload1")
+    spool.append("topic/2", b"\x00\x01")
+
+    # buffered records are only readable after flushing them to disk
+    assert spool.read_batch(10) == []
+    assert spool.depth == 2
+    spool.flush()
+
+    records = spool.read_batch(10)
+    assert [(topic, payload) for topic, payload, _ in records] == [("topic/1", b"payload1"), ("topic/2", b"\x00\x01")]
+
+    spool.ack(records[0][2])
+    assert spool.depth == 1
+    assert [topic for topic, _, _ in spool.read_batch(10)] == ["topic/2"]
+
+    spool.ack(records[1][2])
+    assert spool.depth == 0
+    assert spool.read_batch(10) == []
+    assert not list(tmp_path.glob("*.spool"))
+
+
+def test_spool_rotates_segments(tmp_path: Path):
+    spool = DiskSpool(str(tmp_path), segment_bytes=50)
+    for i in range(5):
+        spool.append("topic", f"payload-{i}-" + "x" * 20)
+        spool.flush()
+
+    assert len(list(tmp_path.glob("*.spool"))) == 5
+    records = spool.read_batch(3)
+    assert len(records) == 3
+    spool.ack(records[-1][2])
+    assert len(list(tmp_path.glob("*.spool"))) == 2
+    assert spool.depth == 2
+
+
+def test_spool_persists_across_restart(tmp_path: Path):
+    spool = DiskSpool(str(tmp_path))
+    for i in range(3):
+        spool.append("topic", f"payload{i}")
+    spool.flush()
+    spool.ack(spool.read_batch(1)[0][2])
+    spool.close()
+
+    spool = DiskSpool(str(tmp_path))
+    assert spool.depth == 2
+    assert [payload for _, payload, _ in spool.read_batch(10)] == [b"payload1", b"payload2"]
+
+    # new records are appended to a new segment
+    spool.append("topic", "payload3")
+    spool.flush()
+    assert [payload for _, payload, _ in spool.read_batch(10)] == [b"payload1", b"payload2", b"payload3"]
+
+
+def test_spool_size_cap_drops_oldest_segment(tmp_path: Path):
+    spool = DiskSpool(str(tmp_path), max_bytes=100, segment_bytes=40)
+    for i in range(6):
+        spool.append("topic", f"payload{i}" + "x" * 10)
+        spool.flush()
+
+    assert spool.depth_bytes <= 100
+    assert spool.dropped > 0
+    payloads = [payload for _, payload, _ in spool.read_batch(10)]
+    assert payloads[-1].startswith(b"payload5")
+    assert len(payloads) == 6 - spool.dropped
+
+
+def test_spool_skips_corrupt_tail(tmp_path: Path):
+    spool = DiskSpool(str(tmp_path))
+    spool.append("topic", "valid")
+    spool.flush()
+    spool.close()
+    segment = next(tmp_path.glob("*.spool"))
+    with open(segment, "ab") as file:
+        file.write(b"\x01\x02\x03\x04\x05\x00garbage")
+
+    spool = DiskSpool(str(tmp_path))
+    records = spool.read_batch(10)
+    assert [payload for _, payload, _ in records] == [b"valid"]
+    spool.ack(records[-1][2])
+    assert spool.depth == 0
+
+
+def test_spool_append_does_not_wait_for_flush(tmp_path: Path):
+    spool = DiskSpool(str(tmp_path))
+    spool.append("topic", "payload0")
+    fsync_started = threading.Event()
+    release_fsync = threading.Event()
+
+    def blocking_fsync(_):
+        fsync_started.set()
+        release_fsync.wait(5)
+
+    with mock.patch("smartmeter_datacollector.sinks.spool.os.fsync", blocking_fsync):
+        flush_thread = threading.Thread(target=spool.flush)
+        flush_thread.start()
+        assert fsync_started.wait(5)
+        append_thread = threading.Thread(target=spool.append, args=("topic", "payload1"))
+        append_thread.start()
+        append_thread.join(1)
+        assert not append_thread.is_alive()
+        assert spool.depth == 2
+        release_fsync.set()
+        flush_thread.join(5)
+
+    spool.flush()
+    assert [payload for _, payload, _ in spool.read_batch(10)] == [b"payload0", b"payload1"]
+
+
+def test_spool_deletes_segments_without_holding_the_lock(tmp_path: Path):
+    # pylint: disable=protected-access
+    spool = DiskSpool(str(tmp_path), max_bytes=100, segment_bytes=40)
+    unlink = Path.unlink
+    locked_during_unlink = []
+
+    def checking_unlink(path: Path, *args, **kwargs):
+        locked_during_unlink.append(spool._lock.locked())
+        unlink(path, *args, **kwargs)
+
+    with mock.patch.object(Path, "unlink", checking_unlink):
+        # size cap on flush
+        for i in range(6):
+            spool.append("topic", f"payload{i}" + "x" * 10)
+            spool.flush()
+        # fully replayed segments on ack
+        records = spool.read_batch(10)
+        spool.ack(records[-1][2])
+
+    assert spool.dropped > 0
+    assert spool.depth == 0
+    assert len(locked_during_unlink) >= 2
+    assert not any(locked_during_unlink)
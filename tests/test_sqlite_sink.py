@@ -0,0 +1,161 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import configparser
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.sinks.sqlite_sink import SqliteConfig, SqliteSink, SqliteWriter
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+VOLTAGE_OBIS = OBISCode(1, 0, 32, 7, 0)
+ENERGY_OBIS = OBISCode(1, 0, 1, 8, 0)
+START = datetime(2024, 1, 15, 10, 30, tzinfo=timezone.utc)
+START_MS = 1705314600000
+
+
+def bundles(count: int, source: str = "meter1") -> List[MeterDataBundle]:
+    return [MeterDataBundle(source, START + timedelta(seconds=index), [
+        MeterDataPoint(MeterDataPointTypes.VOLTAGE_L1.value, 230.0 + index, VOLTAGE_OBIS),
+        MeterDataPoint(MeterDataPointTypes.ACTIVE_ENERGY_P.value, 1000.0 + index, ENERGY_OBIS),
+    ]) for index in range(count)]
+
+
+def query(path: Path, sql: str) -> list:
+    with sqlite3.connect(path) as connection:
+        return connection.execute(sql).fetchall()
+
+
+@pytest.mark.asyncio
+async def test_sink_writes_normalized_samples(tmp_path: Path):
+    path = tmp_path / "data.db"
+    sink = SqliteSink(SqliteConfig(str(path), batch_size=3))
+    await sink.start()
+    for data_bundle in bundles(3) + bundles(1, "meter2"):
+        await sink.send(data_bundle)
+    await sink.stop()
+
+    assert query(path, "PRAGMA journal_mode") == [("wal",)]
+    assert query(path, "SELECT source FROM meters ORDER BY id") == [("meter1",), ("meter2",)]
+    assert query(path, "SELECT COUNT(*) FROM registers") == [(4,)]
+    assert query(path, "SELECT ts, value FROM sample_values WHERE source = 'meter1' AND type = 'VOLTAGE_L1' "
+                       "ORDER BY ts") == [(START_MS, 230.0), (START_MS + 1000, 231.0), (START_MS + 2000, 232.0)]
+    assert query(path, "SELECT COUNT(*) FROM samples") == [(8,)]
+
+
+def test_writer_reuses_registers_after_restart(tmp_path: Path):
+    path = tmp_path / "data.db"
+    writer = SqliteWriter(SqliteConfig(str(path)))
+    assert writer.write(bundles(2)) == 4
+    writer.close()
+
+    writer = SqliteWriter(SqliteConfig(str(path)))
+    writer.write(bundles(1))
+    writer.close()
+
+    assert query(path, "SELECT COUNT(*) FROM registers") == [(2,)]
+    assert query(path, "SELECT COUNT(*) FROM samples") == [(6,)]
+
+
+def invalid_bundle(source: str) -> MeterDataBundle:
+    # integers exceeding 64 bits cannot be stored by SQLite
+    return MeterDataBundle(source, START, [MeterDataPoint(MeterDataPointTypes.VOLTAGE_L1.value, 2**70, VOLTAGE_OBIS)])
+
+
+def test_writer_forgets_ids_of_rolled_back_transaction(tmp_path: Path):
+    path = tmp_path / "data.db"
+    writer = SqliteWriter(SqliteConfig(str(path)))
+    writer.write(bundles(1, "meter1"))
+    with pytest.raises(OverflowError):
+        writer.write(bundles(1, "meter2") + [invalid_bundle("meter2")])
+
+    # the ids of meter2 and its registers were rolled back and must not be reused
+    writer.write(bundles(1, "meter3") + bundles(1, "meter2"))
+    writer.close()
+
+    assert query(path, "SELECT source, COUNT(*) FROM sample_values GROUP BY source ORDER BY source") == [
+        ("meter1", 2), ("meter2", 2), ("meter3", 2)]
+
+
+@pytest.mark.asyncio
+async def test_sink_keeps_running_after_unexpected_write_error(tmp_path: Path):
+    path = tmp_path / "data.db"
+    sink = SqliteSink(SqliteConfig(str(path), batch_size=1))
+    await sink.start()
+    await sink.send(invalid_bundle("meter1"))
+    for data_bundle in bundles(2):
+        await sink.send(data_bundle)
+    await sink.stop()
+
+    assert query(path, "SELECT COUNT(*) FROM samples") == [(4,)]
+
+
+def test_prune_deletes_old_samples_incrementally(tmp_path: Path):
+    path = tmp_path / "data.db"
+    writer = SqliteWriter(SqliteConfig(str(path), prune_batch=3))
+    writer.write(bundles(5))
+
+    assert writer.prune(START_MS + 3000) == 3
+    assert writer.prune(START_MS + 3000) == 3
+    assert writer.prune(START_MS + 3000) == 0
+    writer.close()
+
+    assert query(path, "SELECT MIN(ts) FROM samples") == [(START_MS + 3000,)]
+
+
+def test_prune_does_not_depend_on_insertion_order(tmp_path: Path):
+    path = tmp_path / "data.db"
+    writer = SqliteWriter(SqliteConfig(str(path), prune_batch=3))
+    # a sample from the future (e.g. wrong meter clock) is inserted before the old samples
+    future = MeterDataBundle("meter1", START + timedelta(days=365), [
+        MeterDataPoint(MeterDataPointTypes.VOLTAGE_L1.value, 230.0, VOLTAGE_OBIS)])
+    writer.write([future])
+    writer.write(bundles(3))
+
+    assert writer.prune(START_MS + 3000) == 3
+    assert writer.prune(START_MS + 3000) == 3
+    assert writer.prune(START_MS + 3000) == 0
+    writer.close()
+
+    assert query(path, "SELECT COUNT(*) FROM samples") == [(1,)]
+
+
+def count_prune_steps(path: Path, count: int) -> int:
+    """Number of SQLite VM instructions of a prune without old samples."""
+    writer = SqliteWriter(SqliteConfig(str(path)))
+    writer.write(bundles(count))
+    steps = []
+    writer._connection.set_progress_handler(lambda: steps.append(1), 1)  # pylint: disable=protected-access
+    assert writer.prune(START_MS) == 0
+    writer.close()
+    return len(steps)
+
+
+def test_prune_without_old_samples_reads_a_bounded_number_of_rows(tmp_path: Path):
+    assert count_prune_steps(tmp_path / "small.db", 10) == count_prune_steps(tmp_path / "large.db", 2000)
+
+
+def test_config_from_sink_config():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink0": {"type": "sqlite", "path": "/var/lib/smartmeter/data.db", "retention_days": "30"},
+        "sink1": {"type": "sqlite"},
+        "sink2": {"type": "sqlite", "path": "data.db", "batch_size": "0"},
+    })
+
+    assert SqliteConfig.from_sink_config(cfg_parser["sink0"]) == SqliteConfig(
+        "/var/lib/smartmeter/data.db", retention_days=30)
+    with pytest.raises(InvalidConfigError):
+        SqliteConfig.from_sink_config(cfg_parser["sink1"])
+    with pytest.raises(InvalidConfigError):
+        SqliteConfig.from_sink_config(cfg_parser["sink2"])
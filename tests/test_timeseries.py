@@ -0,0 +1,212 @@
+#
+# Copyright (C) 2024 Supercomputing Systems AG
+# This file is part of smartmeter-datacollector.
+#
+# SPDX-License-Identifier: GPL-2.0-only
+# See LICENSES/README.md for more information.
+#
+import configparser
+import errno
+import math
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from smartmeter_datacollector.config import InvalidConfigError
+from smartmeter_datacollector.sinks.timeseries import (TimeSeriesReader, TimeSeriesWriter, decode_floats,
+                                                       decode_timestamps, encode_floats, encode_timestamps)
+from smartmeter_datacollector.sinks.timeseries_sink import TimeSeriesConfig, TimeSeriesSink
+from smartmeter_datacollector.smartmeter.meter_data import MeterDataBundle, MeterDataPoint, MeterDataPointTypes
+from smartmeter_datacollector.smartmeter.obis import OBISCode
+
+VOLTAGE = MeterDataPointTypes.VOLTAGE_L1.value
+ENERGY = MeterDataPointTypes.ACTIVE_ENERGY_P.value
+VOLTAGE_OBIS = OBISCode(1, 0, 32, 7, 0)
+ENERGY_OBIS = OBISCode(1, 0, 1, 8, 0)
+START = datetime(2024, 1, 15, 23, 59, tzinfo=timezone.utc)
+
+
+def bundles(count: int, source: str = "meter1") -> List[MeterDataBundle]:
+    return [MeterDataBundle(source, START + timedelta(seconds=index), [
+        MeterDataPoint(VOLTAGE, 230.0 + (index % 7) * 0.1, VOLTAGE_OBIS),
+        MeterDataPoint(ENERGY, 1000.0 + index, ENERGY_OBIS),
+    ]) for index in range(count)]
+
+
+def test_timestamp_encoding():
+    timestamps = [1_700_000_000_000, 1_700_000_001_000, 1_700_000_000_500, 1_700_000_100_000]
+
+    assert decode_timestamps(encode_timestamps(timestamps), timestamps[0], len(timestamps)) == timestamps
+
+
+def test_float_encoding():
+    values = [230.1, 230.1, 229.9, -1.5, 0.0, math.inf, 1e300]
+
+    assert decode_floats(encode_floats(values), len(values)) == values
+
+
+def test_write_and_query(tmp_path: Path):
+    writer = TimeSeriesWriter(str(tmp_path))
+    written = bundles(120) + bundles(2, "meter/2")
+    for data_bundle in written:
+        writer.append(data_bundle)
+    writer.flush()
+    reader = TimeSeriesReader(str(tmp_path))
+
+    assert reader.sources() == ["meter1", "meter_2"]
+    # the bundles span two daily partitions
+    assert len(list((tmp_path / "meter1").iterdir())) == 2
+    assert list(reader.query("meter1")) == written[:120]
+    assert [dp.value for data_bundle in reader.query("meter/2") for dp in data_bundle.data_points] == [
+        230.0, 1000.0, 230.1, 1001.0]
+
+
+def test_query_range_and_types(tmp_path: Path):
+    writer = TimeSeriesWriter(str(tmp_path), partition="hour")
+    for data_bundle in bundles(200):
+        writer.append(data_bundle)
+        if data_bundle.timestamp.second == 0:
+            writer.flush()
+    writer.flush()
+
+    result = list(TimeSeriesReader(str(tmp_path)).query(
+        "meter1", START + timedelta(seconds=50), START + timedelta(seconds=70), ["active_energy_p"]))
+
+    assert [data_bundle.timestamp for data_bundle in result] == [
+        START + timedelta(seconds=second) for second in range(50, 70)]
+    assert [data_bundle.data_points for data_bundle in result] == [
+        [MeterDataPoint(ENERGY, 1000.0 + second, ENERGY_OBIS)] for second in range(50, 70)]
+
+
+def test_storage_is_compact(tmp_path: Path):
+    writer = TimeSeriesWriter(str(tmp_path))
+    for data_bundle in bundles(3600):
+        writer.append(data_bundle)
+    writer.flush()
+
+    # two 8 byte values and a 8 byte timestamp per row uncompressed
+    assert writer.size < 3600 * 24 / 4
+
+
+def test_corrupt_tail_is_ignored_and_truncated(tmp_path: Path):
+    writer = TimeSeriesWriter(str(tmp_path))
+    for data_bundle in bundles(10):
+        writer.append(data_bundle)
+    writer.flush()
+    segment = next((tmp_path / "meter1").iterdir())
+    with open(segment, "ab") as file:
+        file.write(b"\x02\x00\x00")
+
+    assert len(list(TimeSeriesReader(str(tmp_path)).query("meter1"))) == 10
+
+    writer = TimeSeriesWriter(str(tmp_path))
+    writer.append(bundles(11)[10])
+    writer.flush()
+    assert len(list(TimeSeriesReader(str(tmp_path)).query("meter1"))) == 11
+
+
+class TornFile:
+    """Writes half of the data and fails like a full disk."""
+
+    def __init__(self, path: Path, mode: str) -> None:
+        self._file = open(path, mode)  # pylint: disable=consider-using-with,unspecified-encoding
+
+    def __enter__(self) -> "TornFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._file.close()
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data[:len(data) // 2])
+        self._file.flush()
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+
+@pytest.mark.parametrize("initial_rows", [0, 10])
+def test_rows_are_kept_after_failed_write(tmp_path: Path, mocker: MockerFixture, initial_rows: int):
+    written = bundles(initial_rows + 6)
+    writer = TimeSeriesWriter(str(tmp_path))
+    for data_bundle in written[:initial_rows]:
+        writer.append(data_bundle)
+    writer.flush()
+
+    for data_bundle in written[initial_rows:-1]:
+        writer.append(data_bundle)
+    torn_open = mocker.patch("smartmeter_datacollector.sinks.timeseries.open", TornFile, create=True)
+    with pytest.raises(OSError):
+        writer.flush()
+    mocker.stop(torn_open)
+    writer.append(written[-1])
+    writer.flush()
+
+    assert list(TimeSeriesReader(str(tmp_path)).query("meter1")) == written
+
+
+def test_append_does_not_wait_for_flush(tmp_path: Path, mocker: MockerFixture):
+    writer = TimeSeriesWriter(str(tmp_path))
+    written = bundles(2)
+    writer.append(written[0])
+    fsync_started = threading.Event()
+    release_fsync = threading.Event()
+
+    def blocking_fsync(_):
+        fsync_started.set()
+        release_fsync.wait(5)
+
+    mocker.patch("smartmeter_datacollector.sinks.timeseries.os.fsync", blocking_fsync)
+    flush_thread = threading.Thread(target=writer.flush)
+    flush_thread.start()
+    assert fsync_started.wait(5)
+    append_thread = threading.Thread(target=writer.append, args=(written[1],))
+    append_thread.start()
+    append_thread.join(1)
+    assert not append_thread.is_alive()
+    release_fsync.set()
+    flush_thread.join(5)
+    writer.flush()
+
+    assert list(TimeSeriesReader(str(tmp_path)).query("meter1")) == written
+
+
+def test_oldest_segments_are_deleted(tmp_path: Path):
+    writer = TimeSeriesWriter(str(tmp_path), partition="hour", max_bytes=1)
+    for data_bundle in bundles(120):
+        writer.append(data_bundle)
+    writer.flush()
+
+    # the segment of the newest partition exceeds the cap as well
+    assert not list((tmp_path / "meter1").iterdir())
+    assert writer.size == 0
+
+
+@pytest.mark.asyncio
+async def test_sink_flushes_on_stop(tmp_path: Path):
+    sink = TimeSeriesSink(TimeSeriesConfig(str(tmp_path)))
+    await sink.start()
+    for data_bundle in bundles(5):
+        await sink.send(data_bundle)
+    assert not TimeSeriesReader(str(tmp_path)).sources()
+
+    await sink.stop()
+
+    assert len(list(TimeSeriesReader(str(tmp_path)).query("meter1"))) == 5
+
+
+def test_config_from_sink_config():
+    cfg_parser = configparser.ConfigParser()
+    cfg_parser.read_dict({
+        "sink0": {"type": "timeseries", "directory": "/var/lib/smartmeter", "partition": "hour"},
+        "sink1": {"type": "timeseries"},
+        "sink2": {"type": "timeseries", "directory": "/tmp", "partition": "week"},
+    })
+
+    assert TimeSeriesConfig.from_sink_config(cfg_parser["sink0"]) == TimeSeriesConfig("/var/lib/smartmeter", "hour")
+    with pytest.raises(InvalidConfigError):
+        TimeSeriesConfig.from_sink_config(cfg_parser["sink1"])
+    with pytest.raises(InvalidConfigError):
+        TimeSeriesConfig.from_sink_config(cfg_parser["sink2"])